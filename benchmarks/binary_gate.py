@@ -0,0 +1,41 @@
+"""
+Compares `_classify` latency of binary samples with and without the binary gate.
+
+Usage: python -m benchmarks.binary_gate [--repeat N] [--sizes KB...]
+"""
+
+import argparse
+import os
+
+from .common import make_classifier, make_task, measure, testdata_samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[64, 1024],
+        help="Sizes of random samples (in KB)",
+    )
+    args = parser.parse_args()
+
+    gated = make_classifier()
+    ungated = make_classifier({"binary_threshold": "1.0"})
+
+    samples = list(testdata_samples()) + [
+        (f"random-{size}K", os.urandom(size * 1024)) for size in args.sizes
+    ]
+    print(f"{'sample':<24}{'rule':>22}{'no gate [ms]':>14}{'gate [ms]':>12}")
+    for name, content in samples:
+        task = make_task(name, content)
+        ungated_time = measure(lambda: ungated._classify(task), args.repeat)
+        gated_time = measure(lambda: gated._classify(task), args.repeat)
+        rule = gated._last_rule or "-"
+        print(f"{name:<24}{rule:>22}{ungated_time:>14.2f}{gated_time:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compares libmagic and compound file directory parsing of OLE samples.
+
+Usage: python -m benchmarks.cfb [--sizes MB...] [--repeat N]
+"""
+
+import argparse
+import os
+
+from karton.classifier.cfb import CompoundFileDirectory
+
+from .common import MB, make_classifier, measure, testdata_dir
+
+OLE_SAMPLES = ["document.doc", "document.xls", "runnable.msi"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 16, 64])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    classifier = make_classifier()
+    print(f"{'sample':<24}{'size':>10}{'type':>6}{'libmagic [us]':>15}{'cfb [us]':>10}")
+    for name in OLE_SAMPLES:
+        for size in args.sizes:
+            # Data appended to the file doesn't change its directory
+            content = (testdata_dir / name).read_bytes() + os.urandom(size * MB)
+            extension = CompoundFileDirectory.from_content(content).guess_extension()
+            libmagic_time = (
+                measure(lambda: classifier._describe(content), args.repeat) * 1000
+            )
+            cfb_time = (
+                measure(
+                    lambda: CompoundFileDirectory.from_content(content), args.repeat
+                )
+                * 1000
+            )
+            print(
+                f"{name:<24}{len(content):>10}{extension:>6}"
+                f"{libmagic_time:>15.1f}{cfb_time:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import logging
+import os
+import pathlib
+import statistics
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from karton.core import Resource, Task
+from karton.core.test import ConfigMock, KartonBackendMock
+
+from karton.classifier import Classifier
+
+testdata_dir = pathlib.Path(__file__).parent.parent / "tests" / "testdata"
+
+MB = 1024 * 1024
+
+
+def make_classifier(options: Optional[Dict[str, str]] = None, **kwargs) -> Classifier:
+    config = ConfigMock()
+    if options:
+        config.config.read_dict({"classifier": options})
+    classifier = Classifier(config=config, backend=KartonBackendMock(), **kwargs)
+    classifier.log.setLevel(logging.ERROR)
+    return classifier
+
+
+def make_task(name: str, content: bytes) -> Task:
+    task = Task({"type": "sample", "kind": "raw"})
+    task.add_payload("sample", Resource(name, content, sha256="sha256"))
+    return task
+
+
+def testdata_samples() -> Iterator[Tuple[str, bytes]]:
+    for path in sorted(testdata_dir.iterdir()):
+        yield path.name, path.read_bytes()
+
+
+def synthetic_samples(sizes: List[int]) -> Iterator[Tuple[str, bytes]]:
+    exe = (testdata_dir / "runnable.exe").read_bytes()
+    zip_ = (testdata_dir / "archive.zip").read_bytes()
+    for size in sizes:
+        label = f"{size // MB}M"
+        yield f"random-{label}", os.urandom(size)
+        yield f"zeros-{label}", bytes(size)
+        yield f"text-{label}", (b"lorem ipsum dolor sit amet\n" * (size // 27 + 1))[
+            :size
+        ]
+        yield f"exe-overlay-{label}", exe + os.urandom(size - len(exe))
+        yield f"zip-prefixed-{label}", os.urandom(size - len(zip_)) + zip_
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Returns median wall time of `fn` in milliseconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
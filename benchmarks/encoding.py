@@ -0,0 +1,72 @@
+"""
+Compares time of heuristics stages with chardet-only and default encoding detection.
+
+Usage: python -m benchmarks.encoding [--repeat N]
+"""
+
+import argparse
+import logging
+
+from karton.classifier.encoding import (
+    DEFAULT_ENCODING_DETECTORS,
+    decode_text,
+    get_encoding_detectors,
+)
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.rules import HEURISTICS_WINDOW, KEYWORD_SCANNER
+
+from .common import make_classifier, measure, testdata_samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--window", type=int, default=HEURISTICS_WINDOW)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    log = logging.getLogger("benchmark")
+    log.setLevel(logging.ERROR)
+    classifier = make_classifier()
+    chardet_only = get_encoding_detectors(["chardet"])
+    default = get_encoding_detectors(DEFAULT_ENCODING_DETECTORS)
+
+    print(
+        f"{'sample':<24}{'encoding':>14}{'window [us]':>13}"
+        f"{'chardet [us]':>14}{'detect [us]':>13}{'keywords [us]':>15}"
+    )
+    total_chardet = total_default = 0.0
+    for name, content in testdata_samples():
+        magic, _ = classifier._get_magic(BytesSampleReader(content))
+        reader = BytesSampleReader(content)
+
+        def read_window() -> bytes:
+            return reader.head(args.window) + reader.tail(args.window)
+
+        partial = read_window()
+        decoded = decode_text(partial, magic, default)
+        window_time = measure(read_window, args.repeat) * 1000
+        chardet_time = (
+            measure(lambda: decode_text(partial, magic, chardet_only), args.repeat)
+            * 1000
+        )
+        default_time = (
+            measure(lambda: decode_text(partial, magic, default), args.repeat) * 1000
+        )
+        total_chardet += chardet_time
+        total_default += default_time
+        if decoded is None:
+            keywords_time = 0.0
+        else:
+            text = decoded[0].lower()
+            keywords_time = (
+                measure(lambda: KEYWORD_SCANNER.scan(text).counts(), args.repeat) * 1000
+            )
+        print(
+            f"{name:<24}{decoded[1] if decoded else '-':>14}{window_time:>13.1f}"
+            f"{chardet_time:>14.1f}{default_time:>13.1f}{keywords_time:>15.1f}"
+        )
+    print(f"{'total':<24}{'':>14}{'':>13}{total_chardet:>14.1f}{total_default:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
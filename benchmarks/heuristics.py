@@ -0,0 +1,106 @@
+"""
+Compares keyword heuristics cost of separate per-family scans, KeywordScanner
+and a single-pass combined regular expression.
+
+Usage: python -m benchmarks.heuristics [--windows BYTES...] [--repeat N]
+"""
+
+import argparse
+import logging
+import re
+from typing import Optional
+
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.rules import (
+    HEURISTICS_KEYWORDS,
+    KEYWORD_SCANNER,
+    ClassificationContext,
+)
+
+from .common import measure, testdata_samples
+
+# Family thresholds in the order of heuristics rules
+THRESHOLDS = [("html", 2), ("vbs", 2), ("ps1", 1), ("js", 2)]
+
+
+def per_family_scans(text: str) -> Optional[str]:
+    for family, threshold in THRESHOLDS:
+        keywords = HEURISTICS_KEYWORDS[family]
+        if len([True for keyword in keywords if keyword in text]) >= threshold:
+            return family
+    return None
+
+
+# Lookahead finds overlapping keywords. The longest keyword matching at each
+# position is reported, so keywords that are its prefixes are found as well.
+KEYWORDS_PATTERN = re.compile(
+    "(?=({}))".format(
+        "|".join(
+            re.escape(keyword)
+            for keyword in sorted(KEYWORD_SCANNER.keywords, key=len, reverse=True)
+        )
+    )
+)
+KEYWORD_PREFIXES = {
+    keyword: [other for other in KEYWORD_SCANNER.keywords if keyword.startswith(other)]
+    for keyword in KEYWORD_SCANNER.keywords
+}
+
+
+def combined_regex(text: str) -> Optional[str]:
+    found = set()
+    for match in KEYWORDS_PATTERN.finditer(text):
+        found.update(KEYWORD_PREFIXES[match.group(1)])
+    for family, threshold in THRESHOLDS:
+        keywords = KEYWORD_SCANNER.families[family]
+        if sum(keyword in found for keyword in keywords) >= threshold:
+            return family
+    return None
+
+
+def keyword_scanner(text: str) -> Optional[str]:
+    hits = KEYWORD_SCANNER.scan(text)
+    for family, threshold in THRESHOLDS:
+        if hits.has_at_least(family, threshold):
+            return family
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--windows", type=int, nargs="+", default=[2048, 16384, 65536])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    log = logging.getLogger("benchmark")
+    log.setLevel(logging.ERROR)
+    print(
+        f"{'sample':<24}{'window':>8}{'family':>8}"
+        f"{'scans [us]':>12}{'scanner [us]':>14}{'regex [us]':>12}"
+    )
+    for name, content in testdata_samples():
+        for window in args.windows:
+            ctx = ClassificationContext(
+                BytesSampleReader(content),
+                magic="",
+                mime="",
+                extension="",
+                log=log,
+                heuristics_window=window,
+            )
+            text = ctx.partial_str
+            if text is None:
+                continue
+            family = keyword_scanner(text)
+            assert family == per_family_scans(text) == combined_regex(text)
+            scans_time = measure(lambda: per_family_scans(text), args.repeat) * 1000
+            scanner_time = measure(lambda: keyword_scanner(text), args.repeat) * 1000
+            regex_time = measure(lambda: combined_regex(text), args.repeat) * 1000
+            print(
+                f"{name:<24}{window:>8}{family or '-':>8}"
+                f"{scans_time:>12.1f}{scanner_time:>14.1f}{regex_time:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compares per-sample `_classify` latency with and without the magic window.
+
+Usage: python -m benchmarks.magic_window [--window BYTES] [--repeat N]
+"""
+
+import argparse
+
+from .common import (
+    MB,
+    make_classifier,
+    make_task,
+    measure,
+    synthetic_samples,
+    testdata_samples,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--window", type=int, default=MB)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1, 16, 64, 256],
+        help="Sizes of synthetic samples (in MB)",
+    )
+    args = parser.parse_args()
+
+    full = make_classifier()
+    windowed = make_classifier({"magic_window": str(args.window)})
+
+    samples = list(testdata_samples()) + list(
+        synthetic_samples([size * MB for size in args.sizes])
+    )
+    print(f"{'sample':<24}{'size':>12}{'full [ms]':>12}{'window [ms]':>12}")
+    for name, content in samples:
+        task = make_task(name, content)
+        full_time = measure(lambda: full._classify(task), args.repeat)
+        window_time = measure(lambda: windowed._classify(task), args.repeat)
+        print(f"{name:<24}{len(content):>12}{full_time:>12.2f}{window_time:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
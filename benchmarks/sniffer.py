@@ -0,0 +1,55 @@
+"""
+Compares per-format latency of libmagic and the signature sniffer.
+
+Usage: python -m benchmarks.sniffer [--repeat N]
+"""
+
+import argparse
+import struct
+
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.signatures import sniff
+
+from .common import make_classifier, make_task, measure, testdata_samples
+
+SYNTHETIC_SAMPLES = [
+    ("elf64", b"\x7fELF\x02\x01\x01" + bytes(9) + struct.pack("<HHI", 2, 62, 1)),
+    ("macho64", b"\xcf\xfa\xed\xfe" + struct.pack("<IIII", 7, 3, 2, 0)),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    plain = make_classifier()
+    sniffing = make_classifier({"signature_sniffer": "true"})
+    fast = make_classifier(
+        {"signature_sniffer": "true", "signature_sniffer_magic": "false"}
+    )
+    print(
+        f"{'sample':<24}{'sniffed':>24}{'libmagic [us]':>15}{'sniff [us]':>12}"
+        f"{'classify [us]':>15}{'sniffer [us]':>14}{'no magic [us]':>15}"
+    )
+    samples = list(testdata_samples()) + [
+        (name, content + bytes(4096)) for name, content in SYNTHETIC_SAMPLES
+    ]
+    for name, content in samples:
+        reader = BytesSampleReader(content)
+        sniffed = sniff(reader)
+        task = make_task(name, content)
+        libmagic_time = measure(lambda: plain._get_magic(reader), args.repeat) * 1000
+        sniff_time = measure(lambda: sniff(reader), args.repeat) * 1000
+        classify_time = measure(lambda: plain._classify(task), args.repeat) * 1000
+        sniffing_time = measure(lambda: sniffing._classify(task), args.repeat) * 1000
+        fast_time = measure(lambda: fast._classify(task), args.repeat) * 1000
+        print(
+            f"{name:<24}{sniffed[0] if sniffed else '-':>24}{libmagic_time:>15.1f}"
+            f"{sniff_time:>12.1f}{classify_time:>15.1f}{sniffing_time:>14.1f}"
+            f"{fast_time:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Measures throughput and latency of classification per rule branch.
+
+Samples from tests/testdata, large synthetic samples and pathological
+variants are classified by `Classifier` with `KartonBackendMock`. Latencies
+are grouped by the branch of the matched rule (PE, ZIP/APK/JAR, OOXML, OLE,
+archives, scripts, unrecognized...) and reported as ops/sec, p50 and p99.
+Rule traces show time spent in each rule and how often it matches, so
+expensive rules that rarely match can be found.
+Results can be saved as JSON and compared with results of other releases
+and configurations.
+
+Usage: python -m benchmarks.throughput [--repeat N] [--sizes MB...]
+           [--mode classify|process] [--option KEY=VALUE...]
+           [--json PATH] [--compare PATH] [--no-rules]
+"""
+
+import argparse
+import gzip
+import io
+import json
+import math
+import os
+import platform
+import time
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from karton.classifier import Classifier
+from karton.classifier.__version__ import __version__
+from karton.classifier.cache import get_fingerprint
+
+from .common import (
+    MB,
+    make_classifier,
+    make_task,
+    synthetic_samples,
+    testdata_dir,
+    testdata_samples,
+)
+
+# Branches of the classification rules (by rule name prefix)
+BRANCHES = [
+    ("pe", "pe"),
+    ("dump_", "pe"),
+    ("apk", "zip"),
+    ("jar", "zip"),
+    ("mac_app", "zip"),
+    ("docx", "ooxml"),
+    ("xlsx", "ooxml"),
+    ("pptx", "ooxml"),
+    ("ooxml", "ooxml"),
+    ("composite_document", "ole"),
+    ("rtf", "document"),
+    ("pdf", "document"),
+    ("office_extension", "document"),
+    ("archive_", "archive"),
+    ("email_", "archive"),
+    ("win_script_extension", "script"),
+    ("linux_script", "script"),
+    ("vbs_heuristics", "script"),
+    ("ps1_heuristics", "script"),
+    ("js_heuristics", "script"),
+    ("jse_heuristics", "script"),
+    ("elf", "runnable"),
+    ("macho", "runnable"),
+    ("dex", "runnable"),
+    ("swf", "runnable"),
+    ("lnk", "runnable"),
+    ("pkg", "runnable"),
+    ("dmg", "runnable"),
+    ("html", "text"),
+    ("ascii", "text"),
+    ("iso-8859-1", "text"),
+    ("utf-8", "text"),
+]
+
+
+def get_branch(rule: Optional[str]) -> str:
+    if rule is None:
+        return "unrecognized"
+    for prefix, branch in BRANCHES:
+        if rule.startswith(prefix):
+            return branch
+    return "other"
+
+
+def pathological_samples() -> Iterator[Tuple[str, bytes]]:
+    exe = (testdata_dir / "runnable.exe").read_bytes()
+    doc = (testdata_dir / "document.doc").read_bytes()
+    # ZIP with a large central directory
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as archive:
+        for index in range(20000):
+            archive.writestr(f"dir/file{index}.txt", b"")
+    yield "zip-many-members", output.getvalue()
+    # PE header offset pointing outside of the file
+    yield "pe-bad-offset", exe[:0x3C] + b"\xff\xff\xff\x7f" + exe[0x40:]
+    yield "mz-junk", b"MZ" + os.urandom(MB)
+    yield "ole-truncated", doc[:1024]
+    yield "gz-bomb", gzip.compress(bytes(64 * MB))
+    # Script keywords in a single long line
+    yield "js-long-line", b"var x = eval(function(){return 1;});" * (MB // 37)
+
+
+def percentile(values: List[float], q: int) -> float:
+    # Nearest-rank percentile (statistics.quantiles requires Python 3.8)
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered) / 100) - 1, 0)]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Returns ops/sec and latency percentiles (in milliseconds)
+    """
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) / sum(latencies) if sum(latencies) else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_sample(
+    classifier: Classifier, name: str, content: bytes, mode: str, repeat: int
+) -> Tuple[Optional[str], List[float]]:
+    """
+    Returns name of the matched rule and latencies (in seconds)
+    """
+    latencies = []
+    for _ in range(repeat):
+        task = make_task(name, content)
+        start = time.perf_counter()
+        if mode == "process":
+            classifier.current_task = task
+            classifier.process(task)
+        else:
+            classifier._classify(task)
+        latencies.append(time.perf_counter() - start)
+        classifier.backend.produced_tasks = []
+    return classifier._last_rule, latencies
+
+
+def trace_sample(
+    classifier: Classifier,
+    name: str,
+    content: bytes,
+    repeat: int,
+    rule_stats: Dict[str, Dict[str, Any]],
+) -> None:
+    """
+    Adds evaluations of rules for the sample to `rule_stats`
+    """
+    for _ in range(repeat):
+        _, trace = classifier.explain(make_task(name, content))
+        for entry in trace:
+            stats = rule_stats.setdefault(
+                entry.rule, {"evaluated": 0, "matched": 0, "total_ms": 0.0}
+            )
+            stats["evaluated"] += 1
+            stats["matched"] += int(entry.matched)
+            stats["total_ms"] += entry.duration * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1, 16],
+        help="Sizes of synthetic samples (in MB)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["classify", "process"],
+        default="process",
+        help="Measure only classification or whole task processing",
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Classifier configuration option (can be repeated)",
+    )
+    parser.add_argument("--json", help="Save results as JSON to the given path")
+    parser.add_argument("--compare", help="Compare with results saved as JSON")
+    parser.add_argument("--no-rules", action="store_true", help="Skip tracing of rules")
+    args = parser.parse_args()
+
+    options = dict(option.split("=", 1) for option in args.option)
+    classifier = make_classifier(options)
+    samples = (
+        list(testdata_samples())
+        + list(synthetic_samples([size * MB for size in args.sizes]))
+        + list(pathological_samples())
+    )
+
+    branch_latencies: Dict[str, List[float]] = {}
+    rule_stats: Dict[str, Dict[str, Any]] = {}
+    sample_results: List[Dict[str, Any]] = []
+    print(f"{'sample':<24}{'size':>12}{'rule':>24}{'p50 [ms]':>12}{'p99 [ms]':>12}")
+    for name, content in samples:
+        rule, latencies = run_sample(classifier, name, content, args.mode, args.repeat)
+        if not args.no_rules:
+            # Traced separately, so rule timing doesn't affect latencies
+            trace_sample(classifier, name, content, args.repeat, rule_stats)
+        branch = get_branch(rule)
+        branch_latencies.setdefault(branch, []).extend(latencies)
+        summary = summarize(latencies)
+        sample_results.append(
+            {
+                "name": name,
+                "size": len(content),
+                "rule": rule,
+                "branch": branch,
+                **summary,
+            }
+        )
+        print(
+            f"{name:<24}{len(content):>12}{rule or '-':>24}"
+            f"{summary['p50_ms']:>12.3f}{summary['p99_ms']:>12.3f}"
+        )
+
+    branch_results = {
+        branch: summarize(latencies)
+        for branch, latencies in sorted(branch_latencies.items())
+    }
+    print()
+    print(f"{'branch':<24}{'ops':>12}{'ops/sec':>12}{'p50 [ms]':>12}{'p99 [ms]':>12}")
+    for branch, summary in branch_results.items():
+        print(
+            f"{branch:<24}{summary['ops']:>12}{summary['ops_per_sec']:>12.1f}"
+            f"{summary['p50_ms']:>12.3f}{summary['p99_ms']:>12.3f}"
+        )
+
+    if rule_stats:
+        print()
+        print(
+            f"{'rule':<24}{'evaluated':>12}{'matched':>12}"
+            f"{'mean [us]':>12}{'total [ms]':>12}"
+        )
+        for rule, stats in sorted(
+            rule_stats.items(), key=lambda item: item[1]["total_ms"], reverse=True
+        ):
+            print(
+                f"{rule:<24}{stats['evaluated']:>12}{stats['matched']:>12}"
+                f"{stats['total_ms'] / stats['evaluated'] * 1000:>12.1f}"
+                f"{stats['total_ms']:>12.3f}"
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        print(f"Compared with {baseline['version']} ({baseline['options']})")
+        print(f"{'branch':<24}{'p50':>12}{'p99':>12}{'ops/sec':>12}")
+        for branch, summary in branch_results.items():
+            previous = baseline["branches"].get(branch)
+            if previous is None:
+                continue
+            print(
+                f"{branch:<24}"
+                f"{summary['p50_ms'] / previous['p50_ms'] - 1:>+12.1%}"
+                f"{summary['p99_ms'] / previous['p99_ms'] - 1:>+12.1%}"
+                f"{summary['ops_per_sec'] / previous['ops_per_sec'] - 1:>+12.1%}"
+            )
+
+    if args.json:
+        results = {
+            "version": __version__,
+            "fingerprint": get_fingerprint(),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "repeat": args.repeat,
+            "options": options,
+            "branches": branch_results,
+            "rules": rule_stats,
+            "samples": sample_results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,615 @@
+"""
+Member listings of ZIP, 7z and RAR archives.
+
+Only the archive metadata is read (ZIP central directory, 7z header,
+RAR block headers), members are never extracted.
+"""
+
+import lzma
+import struct
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from .reader import SampleReader
+from .zipindex import ZipIndex
+
+# Default limit of listed members
+MAX_MEMBERS = 1000
+
+# Limit of the unpacked 7z header size
+MAX_7Z_HEADER_SIZE = 16 * 1024 * 1024
+
+# Limits of RAR blocks walked per listed member and of the total size
+# of walked block headers. Archives with more (or larger) service blocks
+# get a truncated listing.
+MAX_RAR_BLOCKS_PER_MEMBER = 4
+MAX_RAR_HEADERS_SIZE = 16 * 1024 * 1024
+
+# Limit of a single RAR5 block header size (from the format specification)
+MAX_RAR5_HEADER_SIZE = 2 * 1024 * 1024
+
+SEVENZIP_SIGNATURE = b"7z\xbc\xaf\x27\x1c"
+RAR4_SIGNATURE = b"Rar!\x1a\x07\x00"
+RAR5_SIGNATURE = b"Rar!\x1a\x07\x01\x00"
+ZIP_SIGNATURES = (b"PK\x03\x04", b"PK\x05\x06")
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    # Uncompressed size (None if not known)
+    size: Optional[int]
+    is_dir: bool = False
+    encrypted: bool = False
+
+
+class ArchiveListing(NamedTuple):
+    # zip, 7z or rar
+    format: str
+    members: List[ArchiveMember]
+    # Total number of members (None if listing was truncated before the end)
+    total: Optional[int]
+    # Listing is not available because archive headers are encrypted
+    encrypted: bool = False
+
+
+def list_zip(zip_index: ZipIndex, limit: int = MAX_MEMBERS) -> ArchiveListing:
+    infolist = zip_index.infos
+    members = [
+        ArchiveMember(
+            name=info.filename,
+            size=info.file_size,
+            is_dir=info.is_dir(),
+            encrypted=bool(info.flag_bits & 0x1),
+        )
+        for info in infolist[:limit]
+    ]
+    return ArchiveListing("zip", members, total=len(infolist))
+
+
+class _SevenZipHeader:
+    """
+    Reader of 7z header structures (see 7zFormat.txt from the 7-Zip sources)
+    """
+
+    END = 0x00
+    HEADER = 0x01
+    ARCHIVE_PROPERTIES = 0x02
+    ADDITIONAL_STREAMS_INFO = 0x03
+    MAIN_STREAMS_INFO = 0x04
+    FILES_INFO = 0x05
+    PACK_INFO = 0x06
+    UNPACK_INFO = 0x07
+    SUBSTREAMS_INFO = 0x08
+    SIZE = 0x09
+    CRC = 0x0A
+    FOLDER = 0x0B
+    CODERS_UNPACK_SIZE = 0x0C
+    NUM_UNPACK_STREAM = 0x0D
+    EMPTY_STREAM = 0x0E
+    EMPTY_FILE = 0x0F
+    NAME = 0x11
+    ATTRIBUTES = 0x15
+    ENCODED_HEADER = 0x17
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.position = 0
+        # Folders with CRC defined in the unpack info
+        self.folder_crcs: List[bool] = []
+
+    def byte(self) -> int:
+        if self.position >= len(self.data):
+            raise ValueError("Truncated 7z header")
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def read(self, length: int) -> bytes:
+        if self.position + length > len(self.data):
+            raise ValueError("Truncated 7z header")
+        value = self.data[self.position : self.position + length]
+        self.position += length
+        return value
+
+    def number(self) -> int:
+        first = self.byte()
+        mask = 0x80
+        value = 0
+        for index in range(8):
+            if first & mask == 0:
+                return value | ((first & (mask - 1)) << (8 * index))
+            value |= self.byte() << (8 * index)
+            mask >>= 1
+        return value
+
+    def count(self) -> int:
+        """
+        Reads number of items described by the following header data.
+
+        Every item takes at least one byte of the header, so counts larger
+        than the rest of the header are rejected before anything is allocated
+        for the items.
+        """
+        value = self.number()
+        if value > len(self.data) - self.position:
+            raise ValueError("Invalid 7z item count")
+        return value
+
+    def bit_vector(self, count: int) -> List[bool]:
+        data = self.read((count + 7) // 8)
+        return [
+            bool(data[index // 8] & (0x80 >> (index % 8))) for index in range(count)
+        ]
+
+    def expect(self, property_id: int) -> None:
+        if self.byte() != property_id:
+            raise ValueError(f"Expected 7z property {property_id:#x}")
+
+    def digests(self, count: int) -> List[bool]:
+        """
+        Skips CRCs of `count` items and returns which ones are defined
+        """
+        if self.byte():
+            self.read(4 * count)
+            return [True] * count
+        defined = self.bit_vector(count)
+        self.read(4 * sum(defined))
+        return defined
+
+    def pack_info(self) -> Tuple[int, List[int]]:
+        pack_position = self.number()
+        pack_sizes = [0] * self.count()
+        while True:
+            property_id = self.byte()
+            if property_id == self.END:
+                return pack_position, pack_sizes
+            if property_id == self.SIZE:
+                pack_sizes = [self.number() for _ in pack_sizes]
+            elif property_id == self.CRC:
+                self.digests(len(pack_sizes))
+            else:
+                raise ValueError(f"Unexpected 7z property {property_id:#x}")
+
+    def folder(self) -> Tuple[List[Tuple[bytes, bytes]], List[int], int]:
+        """
+        Returns coders (method id, properties), bind pair outputs
+        and number of output streams
+        """
+        coders = []
+        inputs = outputs = 0
+        for _ in range(self.count()):
+            flags = self.byte()
+            if flags & 0x80:
+                raise ValueError("Alternative 7z coder methods are not supported")
+            method = self.read(flags & 0x0F)
+            if flags & 0x10:
+                inputs += self.number()
+                outputs += self.number()
+            else:
+                inputs += 1
+                outputs += 1
+            properties = self.read(self.number()) if flags & 0x20 else b""
+            coders.append((method, properties))
+        bound_outputs = []
+        for _ in range(outputs - 1):
+            self.number()
+            bound_outputs.append(self.number())
+        packed_streams = inputs - (outputs - 1)
+        if packed_streams > 1:
+            for _ in range(packed_streams):
+                self.number()
+        return coders, bound_outputs, outputs
+
+    def unpack_info(self) -> List[Tuple[List[Tuple[bytes, bytes]], int]]:
+        """
+        Returns coders and the final unpack size of each folder
+        (and sets :py:attr:`folder_crcs`)
+        """
+        self.expect(self.FOLDER)
+        count = self.count()
+        if self.byte() != 0:
+            raise ValueError("External 7z folders are not supported")
+        folders = [self.folder() for _ in range(count)]
+        self.expect(self.CODERS_UNPACK_SIZE)
+        result = []
+        for coders, bound_outputs, outputs in folders:
+            sizes = [self.number() for _ in range(outputs)]
+            # Folder output is the only stream not bound to other coder
+            unbound = [
+                size for index, size in enumerate(sizes) if index not in bound_outputs
+            ]
+            result.append((coders, unbound[0] if unbound else 0))
+        self.folder_crcs = [False] * count
+        while True:
+            property_id = self.byte()
+            if property_id == self.END:
+                return result
+            if property_id == self.CRC:
+                self.folder_crcs = self.digests(count)
+            else:
+                raise ValueError(f"Unexpected 7z property {property_id:#x}")
+
+    def substreams_info(self, folder_sizes: List[int]) -> List[int]:
+        """
+        Returns unpack sizes of streams in the folders
+        """
+        streams = [1] * len(folder_sizes)
+        property_id = self.byte()
+        if property_id == self.NUM_UNPACK_STREAM:
+            streams = [self.number() for _ in folder_sizes]
+            property_id = self.byte()
+        sizes: List[int] = []
+        has_sizes = property_id == self.SIZE
+        for folder_size, count in zip(folder_sizes, streams):
+            if count == 0:
+                continue
+            folder_sizes_read = (
+                [self.number() for _ in range(count - 1)] if has_sizes else []
+            )
+            sizes += folder_sizes_read + [folder_size - sum(folder_sizes_read)]
+        if has_sizes:
+            property_id = self.byte()
+        while property_id != self.END:
+            if property_id == self.CRC:
+                # Single-stream folders with CRC don't repeat it
+                self.digests(
+                    sum(
+                        count
+                        for index, count in enumerate(streams)
+                        if count != 1
+                        or index >= len(self.folder_crcs)
+                        or not self.folder_crcs[index]
+                    )
+                )
+            else:
+                raise ValueError(f"Unexpected 7z property {property_id:#x}")
+            property_id = self.byte()
+        return sizes
+
+    def streams_info(
+        self,
+    ) -> Tuple[int, List[int], List[Tuple[List[Tuple[bytes, bytes]], int]], List[int]]:
+        """
+        Returns pack position, pack sizes, folders and unpack sizes of streams
+        """
+        pack_position, pack_sizes = 0, []  # type: Tuple[int, List[int]]
+        folders: List[Tuple[List[Tuple[bytes, bytes]], int]] = []
+        stream_sizes: Optional[List[int]] = None
+        while True:
+            property_id = self.byte()
+            if property_id == self.END:
+                break
+            if property_id == self.PACK_INFO:
+                pack_position, pack_sizes = self.pack_info()
+            elif property_id == self.UNPACK_INFO:
+                folders = self.unpack_info()
+            elif property_id == self.SUBSTREAMS_INFO:
+                stream_sizes = self.substreams_info([size for _, size in folders])
+            else:
+                raise ValueError(f"Unexpected 7z property {property_id:#x}")
+        if stream_sizes is None:
+            stream_sizes = [size for _, size in folders]
+        return pack_position, pack_sizes, folders, stream_sizes
+
+    def skip_archive_properties(self) -> None:
+        while self.byte() != self.END:
+            self.read(self.number())
+
+    def files_info(
+        self, stream_sizes: List[int], limit: int
+    ) -> Tuple[List[ArchiveMember], int]:
+        count = self.count()
+        names: List[str] = []
+        empty_stream = [False] * count
+        empty_file: List[bool] = []
+        attributes: List[Optional[int]] = [None] * count
+        while True:
+            property_id = self.byte()
+            if property_id == self.END:
+                break
+            size = self.number()
+            end = self.position + size
+            if property_id == self.EMPTY_STREAM:
+                empty_stream = self.bit_vector(count)
+            elif property_id == self.EMPTY_FILE:
+                empty_file = self.bit_vector(sum(empty_stream))
+            elif property_id == self.NAME:
+                if self.byte() != 0:
+                    raise ValueError("External 7z names are not supported")
+                names = self.read(end - self.position).decode("utf-16-le").split("\x00")
+            elif property_id == self.ATTRIBUTES:
+                defined = [True] * count if self.byte() else self.bit_vector(count)
+                if self.byte() != 0:
+                    raise ValueError("External 7z attributes are not supported")
+                for index in range(count):
+                    if defined[index]:
+                        attributes[index] = struct.unpack("<I", self.read(4))[0]
+            self.position = end
+        members = []
+        empty_index = stream_index = 0
+        for index in range(min(count, limit)):
+            if empty_stream[index]:
+                is_file = empty_index < len(empty_file) and empty_file[empty_index]
+                empty_index += 1
+                member_size: Optional[int] = 0
+                is_dir = not is_file
+            else:
+                member_size = (
+                    stream_sizes[stream_index]
+                    if stream_index < len(stream_sizes)
+                    else None
+                )
+                stream_index += 1
+                is_dir = False
+            attribute = attributes[index]
+            if attribute is not None:
+                # FILE_ATTRIBUTE_DIRECTORY
+                is_dir = bool(attribute & 0x10)
+            members.append(
+                ArchiveMember(
+                    name=names[index] if index < len(names) else "",
+                    size=member_size,
+                    is_dir=is_dir,
+                )
+            )
+        return members, count
+
+
+def _decode_7z_folder(
+    coders: List[Tuple[bytes, bytes]], data: bytes, size: int
+) -> bytes:
+    if len(coders) != 1:
+        raise ValueError("Unsupported 7z header coders")
+    method, properties = coders[0]
+    if method == b"\x00":
+        return data[:size]
+    if method == b"\x03\x01\x01" and len(properties) >= 5:
+        # LZMA: lc/lp/pb byte and dictionary size
+        lc, remainder = properties[0] % 9, properties[0] // 9
+        lp, pb = remainder % 5, remainder // 5
+        dict_size = struct.unpack("<I", properties[1:5])[0]
+        lzma_filter = {
+            "id": lzma.FILTER_LZMA1,
+            "dict_size": dict_size,
+            "lc": lc,
+            "lp": lp,
+            "pb": pb,
+        }
+    elif method == b"\x21" and len(properties) >= 1:
+        # LZMA2: dictionary size encoded in a single byte
+        bits = properties[0]
+        dict_size = (2 | (bits & 1)) << (bits // 2 + 11) if bits < 40 else 0xFFFFFFFF
+        lzma_filter = {"id": lzma.FILTER_LZMA2, "dict_size": dict_size}
+    elif method == b"\x06\xf1\x07\x01":
+        raise PermissionError("Encrypted 7z header")
+    else:
+        raise ValueError(f"Unsupported 7z header coder: {method.hex()}")
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=[lzma_filter])
+    return decompressor.decompress(data, max_length=size)
+
+
+def list_7z(reader: SampleReader, limit: int = MAX_MEMBERS) -> ArchiveListing:
+    start_header = reader.read(0, 32)
+    if len(start_header) < 32 or not start_header.startswith(SEVENZIP_SIGNATURE):
+        raise ValueError("Not a 7z archive")
+    next_offset, next_size = struct.unpack_from("<QQ", start_header, 12)
+    if next_size > MAX_7Z_HEADER_SIZE:
+        raise ValueError("7z header is too large")
+    header = _SevenZipHeader(reader.read(32 + next_offset, next_size))
+    if not header.data:
+        # Empty archive
+        return ArchiveListing("7z", [], total=0)
+    property_id = header.byte()
+    if property_id == header.ENCODED_HEADER:
+        pack_position, pack_sizes, folders, _ = header.streams_info()
+        if not folders or not pack_sizes:
+            raise ValueError("Missing 7z header streams")
+        coders, size = folders[0]
+        if size > MAX_7Z_HEADER_SIZE:
+            raise ValueError("7z header is too large")
+        try:
+            data = _decode_7z_folder(
+                coders, reader.read(32 + pack_position, pack_sizes[0]), size
+            )
+        except PermissionError:
+            return ArchiveListing("7z", [], total=None, encrypted=True)
+        header = _SevenZipHeader(data)
+        property_id = header.byte()
+    if property_id != header.HEADER:
+        raise ValueError("Missing 7z header")
+    stream_sizes: List[int] = []
+    members: List[ArchiveMember] = []
+    count = 0
+    while True:
+        property_id = header.byte()
+        if property_id == header.END:
+            break
+        if property_id == header.ARCHIVE_PROPERTIES:
+            header.skip_archive_properties()
+        elif property_id == header.ADDITIONAL_STREAMS_INFO:
+            header.streams_info()
+        elif property_id == header.MAIN_STREAMS_INFO:
+            stream_sizes = header.streams_info()[3]
+        elif property_id == header.FILES_INFO:
+            members, count = header.files_info(stream_sizes, limit)
+        else:
+            raise ValueError(f"Unexpected 7z property {property_id:#x}")
+    return ArchiveListing("7z", members, total=count)
+
+
+class _RarWalkLimit:
+    """
+    Limits number of RAR blocks and size of block headers walked
+    while listing `limit` members
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.blocks = MAX_RAR_BLOCKS_PER_MEMBER * (limit + 1)
+        self.headers_size = MAX_RAR_HEADERS_SIZE
+
+    def exceeded(self, header_size: int) -> bool:
+        self.blocks -= 1
+        self.headers_size -= header_size
+        return self.blocks < 0 or self.headers_size < 0
+
+
+def list_rar4(reader: SampleReader, limit: int = MAX_MEMBERS) -> ArchiveListing:
+    members: List[ArchiveMember] = []
+    position = len(RAR4_SIGNATURE)
+    walk_limit = _RarWalkLimit(limit)
+    while True:
+        block = reader.read(position, 7)
+        if len(block) < 7:
+            # Truncated archive, listing is incomplete
+            return ArchiveListing("rar", members, total=None)
+        _, block_type, flags, header_size = struct.unpack("<HBHH", block)
+        if header_size < 7:
+            raise ValueError("Invalid RAR block header")
+        if walk_limit.exceeded(header_size):
+            return ArchiveListing("rar", members, total=None)
+        if block_type == 0x7B:
+            # End of archive
+            return ArchiveListing("rar", members, total=len(members))
+        data_size = 0
+        if block_type == 0x73 and flags & 0x80:
+            # Encrypted block headers
+            return ArchiveListing("rar", [], total=None, encrypted=True)
+        if block_type == 0x74:
+            if len(members) >= limit:
+                return ArchiveListing("rar", members, total=None)
+            header = reader.read(position, header_size)
+            if len(header) < 32:
+                raise ValueError("Truncated RAR file header")
+            data_size, size, name_size = struct.unpack_from("<II11xH", header, 7)
+            name_offset = 32
+            if flags & 0x100:
+                high_pack, high_unpack = struct.unpack_from("<II", header, 32)
+                data_size |= high_pack << 32
+                size |= high_unpack << 32
+                name_offset += 8
+            name = header[name_offset : name_offset + name_size]
+            if flags & 0x200:
+                # Unicode name is stored after the zero byte, the first part is UTF-8
+                name = name.split(b"\x00", 1)[0]
+            members.append(
+                ArchiveMember(
+                    name=name.decode("utf-8", errors="replace").replace("\\", "/"),
+                    size=size,
+                    is_dir=flags & 0xE0 == 0xE0,
+                    encrypted=bool(flags & 0x04),
+                )
+            )
+        elif flags & 0x8000:
+            data_size = struct.unpack("<I", reader.read(position + 7, 4))[0]
+        position += header_size + data_size
+
+
+def _read_vint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if position >= len(data) or shift > 63:
+            raise ValueError("Invalid RAR5 variable length integer")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def _rar5_has_record(header: bytes, extra_size: int, record_type: int) -> bool:
+    # Extra area records are placed at the end of the header
+    position = len(header) - extra_size
+    while 0 <= position < len(header):
+        size, data = _read_vint(header, position)
+        found_type, _ = _read_vint(header, data)
+        if found_type == record_type:
+            return True
+        position = data + size
+    return False
+
+
+def list_rar5(reader: SampleReader, limit: int = MAX_MEMBERS) -> ArchiveListing:
+    members: List[ArchiveMember] = []
+    position = len(RAR5_SIGNATURE)
+    walk_limit = _RarWalkLimit(limit)
+    while True:
+        # CRC32 and header size (up to 3 bytes)
+        prefix = reader.read(position, 7)
+        if len(prefix) < 5:
+            return ArchiveListing("rar", members, total=None)
+        header_size, data_start = _read_vint(prefix, 4)
+        if header_size > MAX_RAR5_HEADER_SIZE:
+            raise ValueError("Invalid RAR5 block header")
+        if walk_limit.exceeded(header_size):
+            return ArchiveListing("rar", members, total=None)
+        header = reader.read(position + data_start, header_size)
+        if len(header) < header_size:
+            return ArchiveListing("rar", members, total=None)
+        block_type, offset = _read_vint(header, 0)
+        flags, offset = _read_vint(header, offset)
+        extra_size = 0
+        if flags & 0x01:
+            extra_size, offset = _read_vint(header, offset)
+        data_size = 0
+        if flags & 0x02:
+            data_size, offset = _read_vint(header, offset)
+        if block_type == 4:
+            # Archive encryption header, other headers are encrypted
+            return ArchiveListing("rar", [], total=None, encrypted=True)
+        if block_type == 5:
+            return ArchiveListing("rar", members, total=len(members))
+        if block_type == 2:
+            if len(members) >= limit:
+                return ArchiveListing("rar", members, total=None)
+            file_flags, offset = _read_vint(header, offset)
+            size, offset = _read_vint(header, offset)
+            _, offset = _read_vint(header, offset)  # attributes
+            if file_flags & 0x02:
+                offset += 4  # mtime
+            if file_flags & 0x04:
+                offset += 4  # CRC32
+            _, offset = _read_vint(header, offset)  # compression info
+            _, offset = _read_vint(header, offset)  # host OS
+            name_size, offset = _read_vint(header, offset)
+            name = header[offset : offset + name_size]
+            members.append(
+                ArchiveMember(
+                    name=name.decode("utf-8", errors="replace"),
+                    size=None if file_flags & 0x08 else size,
+                    is_dir=bool(file_flags & 0x01),
+                    encrypted=_rar5_has_record(header, extra_size, 0x01),
+                )
+            )
+        position += data_start + header_size + data_size
+
+
+def list_archive(
+    reader: SampleReader,
+    limit: int = MAX_MEMBERS,
+    get_zip_index: Optional[Callable[[], ZipIndex]] = None,
+) -> Optional[ArchiveListing]:
+    """
+    Returns listing of ZIP, 7z or RAR archive (None for other files)
+
+    :param reader: Sample reader
+    :param limit: Maximum number of listed members
+    :param get_zip_index: Returns ZIP index already decoded for the sample
+                          (central directory is decoded from the reader
+                          if not provided)
+    """
+    head = reader.head(8)
+    if head.startswith(ZIP_SIGNATURES):
+        if get_zip_index is not None:
+            zip_index = get_zip_index()
+        else:
+            zip_index = ZipIndex.from_file(reader.open())
+        return list_zip(zip_index, limit)
+    listers: List[Tuple[bytes, Callable[[SampleReader, int], ArchiveListing]]] = [
+        (SEVENZIP_SIGNATURE, list_7z),
+        (RAR5_SIGNATURE, list_rar5),
+        (RAR4_SIGNATURE, list_rar4),
+    ]
+    for signature, lister in listers:
+        if head.startswith(signature):
+            return lister(reader, limit)
+    return None
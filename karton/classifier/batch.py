@@ -0,0 +1,180 @@
+"""
+Offline bulk classification of local files.
+
+Files are classified by a pool of worker processes running the same rules
+as the Karton consumer and results are streamed to stdout as JSON lines.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tarfile
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from karton.core import Config, Resource, Task
+
+from .classifier import Classifier, get_tag, get_trace_payload
+from .rules import RuleTrace
+
+# (path, content) - content is None for files read directly by the worker
+BatchItem = Tuple[str, Optional[bytes]]
+
+_classifier: Optional[Classifier] = None
+_trace = False
+
+
+class OfflineBackend:
+    """
+    Minimal backend for classifier instances that don't talk to Karton.
+
+    Logs are printed only by the stream handler and tasks are never sent.
+    """
+
+    def produce_log(self, log_record: Dict[str, Any], logger_name: str, level: str):
+        return True
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "paths", nargs="*", help="Files or directories (walked recursively)"
+    )
+    parser.add_argument(
+        "--tar",
+        action="append",
+        default=[],
+        metavar="ARCHIVE",
+        help="Classify members of tar archive (can be repeated)",
+    )
+    parser.add_argument(
+        "--paths-from",
+        metavar="FILE",
+        help="Read paths to classify from file, one per line ('-' for stdin)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Add rules evaluated for each file (with their timing) to results",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=16,
+        help="Number of files sent to the worker at once",
+    )
+
+
+def iter_paths(path: str) -> Iterator[str]:
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for filename in sorted(files):
+                yield os.path.join(root, filename)
+    else:
+        yield path
+
+
+def iter_tar(path: str) -> Iterator[BatchItem]:
+    # Streaming mode, so compressed archives are read sequentially only once
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            fileobj = archive.extractfile(member)
+            if fileobj is not None:
+                yield f"{path}:{member.name}", fileobj.read()
+
+
+def iter_batch_items(args: argparse.Namespace) -> Iterator[BatchItem]:
+    for path in args.paths:
+        for file_path in iter_paths(path):
+            yield file_path, None
+    if args.paths_from:
+        with (
+            open(args.paths_from) if args.paths_from != "-" else sys.stdin
+        ) as paths_file:
+            for line in paths_file:
+                line = line.rstrip("\n")
+                if line:
+                    for file_path in iter_paths(line):
+                        yield file_path, None
+    for tar_path in args.tar:
+        yield from iter_tar(tar_path)
+
+
+def load_config(config_file: Optional[str]) -> Config:
+    config = Config(config_file, check_sections=False)
+    # Offline backend doesn't connect to Redis, so the shared cache
+    # is replaced by the in-process one
+    if config.config.get("classifier", "cache_backend", fallback=None) == "redis":
+        config.config.set("classifier", "cache_backend", "memory")
+    return config
+
+
+def init_worker(config_file: Optional[str], trace: bool = False) -> None:
+    global _classifier, _trace
+    _trace = trace
+    config = load_config(config_file)
+    _classifier = Classifier(config=config, backend=OfflineBackend())  # type: ignore
+    # Classifier installs graceful shutdown handlers, but pool workers
+    # must be terminated immediately and leave Ctrl+C to the parent process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def classify_item(item: BatchItem) -> str:
+    path, content = item
+    assert _classifier is not None
+    try:
+        if content is None:
+            resource = Resource(os.path.basename(path), path=path)
+        elif content:
+            resource = Resource(os.path.basename(path), content=content)
+        else:
+            raise ValueError("Empty file")
+        task = Task({"type": "sample", "kind": "raw"})
+        task.add_payload("sample", resource)
+
+        trace: Optional[List[RuleTrace]] = [] if _trace else None
+        sample_class = _classifier.classify(task, trace)
+        result = {
+            "path": path,
+            "sha256": resource.sha256,
+            "headers": _classifier.get_derived_headers(task, sample_class),
+            "tag": get_tag(sample_class) if sample_class else None,
+            "magic": sample_class.get("magic") if sample_class else None,
+        }
+        if trace is not None:
+            result["trace"] = get_trace_payload(trace)["rules"]
+    except Exception as e:
+        result = {"path": path, "error": str(e)}
+    return json.dumps(result)
+
+
+def run_batch(args: argparse.Namespace, output: IO[str] = sys.stdout) -> int:
+    """
+    Classifies all files pointed by command-line arguments.
+
+    :return: Number of classified files
+    """
+    items: Iterable[BatchItem] = iter_batch_items(args)
+    count = 0
+    with multiprocessing.Pool(
+        args.workers,
+        initializer=init_worker,
+        initargs=(args.config_file, args.trace),
+    ) as pool:
+        for line in pool.imap_unordered(classify_item, items, args.chunksize):
+            output.write(line + "\n")
+            count += 1
+        pool.close()
+        pool.join()
+    output.flush()
+    return count
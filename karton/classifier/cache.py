@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+import magic as pymagic  # type: ignore
+
+from .__version__ import __version__
+
+if TYPE_CHECKING:
+    from redis import StrictRedis
+
+Classification = Optional[Dict[str, Optional[str]]]
+
+# Expired entries of SQLite cache are removed by writes at most once
+# per interval (in seconds)
+PURGE_INTERVAL = 60.0
+
+# Lifetime of Redis cache entries (in seconds) if no TTL is configured.
+# Redis is shared with Karton, so entries must expire (e.g. entries made
+# before an upgrade are never read again).
+REDIS_DEFAULT_TTL = 24 * 60 * 60.0
+
+
+def get_fingerprint(options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Returns fingerprint of the classification rules, libmagic version
+    and classifier options affecting the results.
+
+    Cached results are valid only for the same fingerprint.
+    """
+    try:
+        magic_version = str(pymagic.version())
+    except Exception:
+        # version() is not available in older libmagic releases
+        magic_version = "unknown"
+    fingerprint = f"{__version__}:{magic_version}"
+    if options:
+        options_hash = hashlib.sha256(
+            json.dumps(options, sort_keys=True).encode()
+        ).hexdigest()
+        fingerprint += f":{options_hash[:16]}"
+    return fingerprint
+
+
+class ClassificationCache:
+    """
+    Base class for caches of classification results.
+
+    Subclasses implement :py:meth:`_get` and :py:meth:`_set`, hit and miss
+    counters are maintained by the base class.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: str) -> Tuple[bool, Classification]:
+        raise NotImplementedError()
+
+    def _set(self, key: str, classification: Classification) -> None:
+        raise NotImplementedError()
+
+    def get(self, key: str) -> Tuple[bool, Classification]:
+        """
+        Returns (found, classification) tuple.
+
+        Classification itself may be None for unrecognized samples.
+        """
+        found, classification = self._get(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, dict(classification) if classification is not None else None
+
+    def has(self, key: str) -> bool:
+        """
+        Checks if classification is cached (without counting hits and misses)
+        """
+        return self._get(key)[0]
+
+    def set(self, key: str, classification: Classification) -> None:
+        self._set(key, dict(classification) if classification is not None else None)
+
+
+class LRUClassificationCache(ClassificationCache):
+    """
+    Bounded in-process cache of classification results.
+
+    Least recently used entries are evicted when cache is full. Entries older
+    than `ttl` seconds are treated as missing.
+
+    :param maxsize: Maximum number of cached results
+    :param ttl: Entry lifetime in seconds (None = entries never expire)
+    :param clock: Time source (for testing)
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Classification]]" = OrderedDict()
+        # Cache is also checked by prefetching threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: str) -> Tuple[bool, Classification]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[0] < self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def _set(self, key: str, classification: Classification) -> None:
+        expires = self.clock() + self.ttl if self.ttl is not None else 0.0
+        with self._lock:
+            self._entries[key] = (expires, classification)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class SQLiteClassificationCache(ClassificationCache):
+    """
+    Classification cache stored in SQLite database file.
+
+    Database can be shared by classifier processes running on the same host.
+    Entries made with different fingerprint (classifier or libmagic version)
+    are removed when cache is opened and ignored by lookups. Expired entries
+    are also removed when cache is opened and then periodically by writes.
+
+    :param path: Path to the database file
+    :param ttl: Entry lifetime in seconds (None = entries never expire)
+    :param fingerprint: Version fingerprint (see :py:func:`get_fingerprint`)
+    :param clock: Time source (for testing)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        fingerprint: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.fingerprint = fingerprint or get_fingerprint()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS classification ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT, expires REAL, value TEXT)"
+            )
+            self._db.execute(
+                "DELETE FROM classification WHERE fingerprint != ? "
+                "OR (expires IS NOT NULL AND expires < ?)",
+                (self.fingerprint, self.clock()),
+            )
+        self._next_purge = self.clock() + PURGE_INTERVAL
+
+    def _connect(self) -> sqlite3.Connection:
+        self._pid = os.getpid()
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # Let SQLite read the database through shared memory mapping
+        db.execute("PRAGMA mmap_size=268435456")
+        return db
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared with forked processes
+        if self._pid != os.getpid():
+            self._db = self._connect()
+        return self._db
+
+    def _get(self, key: str) -> Tuple[bool, Classification]:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT value FROM classification WHERE key = ? AND fingerprint = ? "
+                "AND (expires IS NULL OR expires >= ?)",
+                (key, self.fingerprint, self.clock()),
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def _set(self, key: str, classification: Classification) -> None:
+        now = self.clock()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO classification VALUES (?, ?, ?, ?)",
+                (key, self.fingerprint, expires, json.dumps(classification)),
+            )
+            if self.ttl is not None and now >= self._next_purge:
+                self.db.execute("DELETE FROM classification WHERE expires < ?", (now,))
+                self._next_purge = now + PURGE_INTERVAL
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class RedisClassificationCache(ClassificationCache):
+    """
+    Classification cache stored in Redis shared by all classifier replicas.
+
+    Each result is stored under a separate key prefixed with the fingerprint,
+    so results made by different classifier or libmagic version are never
+    used. Keys are written with SETEX and expire independently, so stale
+    entries are removed by Redis.
+
+    :param redis: Redis connection (e.g. ``KartonBackend.redis``)
+    :param ttl: Entry lifetime in seconds (must be positive)
+    :param fingerprint: Version fingerprint (see :py:func:`get_fingerprint`)
+    """
+
+    KEY_PREFIX = "karton.classifier.cache"
+
+    def __init__(
+        self,
+        redis: "StrictRedis",
+        ttl: float = REDIS_DEFAULT_TTL,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        super().__init__()
+        if ttl is None or ttl <= 0:
+            raise ValueError("Redis cache requires positive TTL")
+        self.redis = redis
+        # SETEX requires whole seconds
+        self.ttl = max(int(ttl), 1)
+        self.key_prefix = f"{self.KEY_PREFIX}:{fingerprint or get_fingerprint()}"
+
+    def _get(self, key: str) -> Tuple[bool, Classification]:
+        value = self.redis.get(f"{self.key_prefix}:{key}")
+        if value is None:
+            return False, None
+        return True, json.loads(value)
+
+    def _set(self, key: str, classification: Classification) -> None:
+        self.redis.setex(
+            f"{self.key_prefix}:{key}", self.ttl, json.dumps(classification)
+        )
@@ -0,0 +1,168 @@
+import struct
+from io import BytesIO
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Set
+
+CFB_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# CLSID of the root storage of MSI installers ({000C1084-0000-0000-C000-000000000046})
+MSI_CLSID = bytes.fromhex("84100c0000000000c000000000000046")
+
+# Top-level streams identifying Office documents
+OFFICE_STREAMS = [
+    ("WordDocument", "doc"),
+    ("Workbook", "xls"),
+    ("Book", "xls"),
+    ("PowerPoint Document", "ppt"),
+]
+
+# Special sector numbers (end of chain, free sector etc.)
+MAX_REGULAR_SECTOR = 0xFFFFFFFA
+NO_STREAM = 0xFFFFFFFF
+
+# Limit of directory sectors read from a single file
+MAX_DIRECTORY_SECTORS = 1024
+
+DIRECTORY_ENTRY_SIZE = 128
+STORAGE_OBJECT = 1
+STREAM_OBJECT = 2
+ROOT_OBJECT = 5
+
+
+class _DirectoryEntry(NamedTuple):
+    name: str
+    object_type: int
+    clsid: bytes
+    left: int
+    right: int
+    child: int
+
+
+class CompoundFileDirectory:
+    """
+    Names of top-level storages and streams of an OLE compound file (CFB).
+
+    Only the header, the directory sector chain and the FAT sectors needed
+    to follow it are read, so parsing doesn't depend on the file size.
+
+    :param names: Names of entries stored directly in the root storage
+    :param root_clsid: CLSID of the root storage
+    """
+
+    def __init__(self, names: Iterable[str], root_clsid: bytes = bytes(16)) -> None:
+        self.names = frozenset(names)
+        self.root_clsid = root_clsid
+
+    @classmethod
+    def from_file(cls, fileobj: BinaryIO) -> "CompoundFileDirectory":
+        entries = _DirectoryReader(fileobj).read_entries()
+        if not entries or entries[0].object_type != ROOT_OBJECT:
+            raise ValueError("Missing root storage entry")
+        names = []
+        visited: Set[int] = set()
+        # Children of the root storage form a tree of siblings
+        pending = [entries[0].child]
+        while pending:
+            index = pending.pop()
+            if index == NO_STREAM or index in visited or index >= len(entries):
+                continue
+            visited.add(index)
+            entry = entries[index]
+            if entry.object_type in (STORAGE_OBJECT, STREAM_OBJECT):
+                names.append(entry.name)
+            pending += [entry.left, entry.right]
+        return cls(names, root_clsid=entries[0].clsid)
+
+    @classmethod
+    def from_content(cls, content: bytes) -> "CompoundFileDirectory":
+        return cls.from_file(BytesIO(content))
+
+    def has_entry(self, name: str) -> bool:
+        return name in self.names
+
+    def guess_extension(self) -> Optional[str]:
+        """
+        Returns extension of the document type (msi, doc, xls, ppt) if known
+        """
+        if self.root_clsid == MSI_CLSID:
+            return "msi"
+        for name, extension in OFFICE_STREAMS:
+            if name in self.names:
+                return extension
+        return None
+
+
+class _DirectoryReader:
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self._file = fileobj
+        header = self._read(0, 512)
+        if len(header) < 512 or not header.startswith(CFB_SIGNATURE):
+            raise ValueError("Not a compound file")
+        sector_shift = struct.unpack("<H", header[0x1E:0x20])[0]
+        if sector_shift not in (9, 12):
+            raise ValueError(f"Unsupported sector shift: {sector_shift}")
+        self._sector_size = 1 << sector_shift
+        self._first_directory_sector = struct.unpack("<I", header[0x30:0x34])[0]
+        self._next_difat_sector, self._difat_sectors = struct.unpack(
+            "<II", header[0x44:0x4C]
+        )
+        # Locations of FAT sectors, extended by DIFAT sectors when needed
+        self._difat: List[int] = list(struct.unpack("<109I", header[0x4C:0x200]))
+        self._fat_sectors: Dict[int, bytes] = {}
+
+    def _read(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def _read_sector(self, sector: int) -> bytes:
+        if sector >= MAX_REGULAR_SECTOR:
+            raise ValueError(f"Invalid sector number: {sector:#x}")
+        data = self._read((sector + 1) * self._sector_size, self._sector_size)
+        if len(data) < self._sector_size:
+            raise ValueError(f"Truncated sector: {sector:#x}")
+        return data
+
+    def _fat_sector_location(self, index: int) -> int:
+        per_sector = self._sector_size // 4 - 1
+        while index >= len(self._difat):
+            if (
+                self._difat_sectors == 0
+                or self._next_difat_sector >= MAX_REGULAR_SECTOR
+            ):
+                raise ValueError("FAT sector out of DIFAT")
+            data = self._read_sector(self._next_difat_sector)
+            entries = struct.unpack(f"<{per_sector + 1}I", data)
+            self._difat += entries[:per_sector]
+            self._next_difat_sector = entries[per_sector]
+            self._difat_sectors -= 1
+        return self._difat[index]
+
+    def _next_sector(self, sector: int) -> int:
+        per_sector = self._sector_size // 4
+        index, position = divmod(sector, per_sector)
+        if index not in self._fat_sectors:
+            self._fat_sectors[index] = self._read_sector(
+                self._fat_sector_location(index)
+            )
+        return struct.unpack_from("<I", self._fat_sectors[index], position * 4)[0]
+
+    def read_entries(self) -> List[_DirectoryEntry]:
+        entries = []
+        sector = self._first_directory_sector
+        visited: Set[int] = set()
+        while sector < MAX_REGULAR_SECTOR:
+            if sector in visited or len(visited) >= MAX_DIRECTORY_SECTORS:
+                raise ValueError("Directory chain is too long or cyclic")
+            visited.add(sector)
+            data = self._read_sector(sector)
+            for offset in range(0, self._sector_size, DIRECTORY_ENTRY_SIZE):
+                entry = data[offset : offset + DIRECTORY_ENTRY_SIZE]
+                name_length = struct.unpack("<H", entry[64:66])[0]
+                name = entry[: max(min(name_length, 64) - 2, 0)].decode(
+                    "utf-16-le", errors="replace"
+                )
+                left, right, child = struct.unpack("<III", entry[68:80])
+                entries.append(
+                    _DirectoryEntry(name, entry[66], entry[80:96], left, right, child)
+                )
+            sector = self._next_sector(sector)
+        return entries
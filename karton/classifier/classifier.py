@@ -1,27 +1,143 @@
-import re
-import struct
-from hashlib import sha256
-from io import BytesIO
-from typing import Callable, Dict, Optional, cast
-from zipfile import ZipFile
-
-import chardet  # type: ignore
+import argparse
+import os
+import tempfile
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
 import magic as pymagic  # type: ignore
 from karton.core import Config, Karton, Task
 from karton.core.backend import KartonBackend
 
 from .__version__ import __version__
+from .archives import MAX_MEMBERS, ArchiveListing, list_archive
+from .cache import (
+    REDIS_DEFAULT_TTL,
+    ClassificationCache,
+    LRUClassificationCache,
+    RedisClassificationCache,
+    SQLiteClassificationCache,
+    get_fingerprint,
+)
+from .compression import (
+    DECOMPRESSORS,
+    PEEK_INPUT_SIZE,
+    PEEK_OUTPUT_SIZE,
+    PEEK_TIME,
+    peek_decompressed,
+)
+from .digests import MultiDigest
+from .encoding import DEFAULT_ENCODING_DETECTORS, get_encoding_detectors
+from .executables import parse_executable
+from .metrics import (
+    NO_METRICS,
+    Metrics,
+    PrometheusMetrics,
+    multiprocess_registry,
+    start_metrics_server,
+)
+from .pipeline import run_pipelined
+from .prefork import run_prefork
+from .profiling import DEFAULT_MAX_SIZE, AllocationTracer, TaskProfiler
+from .reader import (
+    DEFAULT_BLOCK_SIZE,
+    BytesSampleReader,
+    MappedSampleReader,
+    RangedSampleReader,
+    SampleReader,
+    digest_content,
+    get_sample_reader,
+)
+from .rules import (  # noqa: F401
+    BINARY_THRESHOLD,
+    CLASSIFICATION_RULES,
+    HEURISTICS_WINDOW,
+    ClassificationContext,
+    RuleEngine,
+    RuleTrace,
+    classify_openxml,
+)
+from .signatures import sniff
+
+# Properties of executables passed as task headers (see :class:`ExecutableInfo`)
+EXECUTABLE_HEADERS = ["machine", "bitness", "subsystem", "binary_type"]
+
+# Type of the content of compressed samples passed as task headers
+INNER_HEADERS = ["inner_kind", "inner_extension"]
+
+# Windows executables that are not recognized by the rules only by extension
+# (used to infer types of archive members)
+WIN32_RUNNABLE_EXTENSIONS = ["exe", "dll", "scr", "com", "pif", "cpl", "sys", "ocx"]
+
+# Magic window used by range reads mode if `magic_window` is not configured
+DEFAULT_RANGE_MAGIC_WINDOW = 64 * 1024
+
+
+def is_generic_magic(magic: Optional[str]) -> bool:
+    """
+    Checks whether libmagic result doesn't say anything about the content type
+    """
+    return not magic or magic == "data"
+
+
+class MagicBackend:
+    """
+    libmagic handle giving both description and MIME type of the content.
 
+    Single libmagic cookie is used for both lookups (flags are switched
+    between them), so the magic database is loaded only once. Instances are
+    callable with the same ``(content, mime)`` signature as the ``magic``
+    argument of :class:`Classifier`.
+
+    :param magic_file: Alternative path to the compiled magic database
+    """
+
+    # MIME types that libmagic reports for content without any matching rule
+    GENERIC_MIME = {
+        "data": "application/octet-stream",
+        "empty": "application/x-empty",
+    }
+
+    def __init__(self, magic_file: Optional[str] = None) -> None:
+        self._cookie = pymagic.magic_open(pymagic.MAGIC_NONE)
+        pymagic.magic_load(self._cookie, magic_file)
+        self._lock = threading.Lock()
+
+    def _lookup(self, content: bytes, flags: int) -> str:
+        pymagic.magic_setflags(self._cookie, flags)
+        try:
+            return pymagic.maybe_decode(pymagic.magic_buffer(self._cookie, content))
+        except pymagic.MagicException as e:
+            # libmagic may fail to identify the MIME type without setting
+            # an error message (see python-magic Magic._handle509Bug)
+            if e.message is None and flags & pymagic.MAGIC_MIME_TYPE:
+                return "application/octet-stream"
+            raise
+
+    def describe(self, content: bytes) -> Tuple[str, str]:
+        """
+        Returns (description, MIME type) of the content.
+
+        MIME lookup is skipped when libmagic doesn't recognize the content at all.
+        """
+        with self._lock:
+            magic = self._lookup(content, pymagic.MAGIC_NONE)
+            mime = self.GENERIC_MIME.get(magic) or self._lookup(
+                content, pymagic.MAGIC_MIME_TYPE
+            )
+        return magic, mime
 
-def classify_openxml(content: bytes) -> Optional[str]:
-    zipfile = ZipFile(BytesIO(content))
-    extensions = {"docx": "word", "pptx": "ppt", "xlsx": "xl"}
-    filenames = [x.filename for x in zipfile.filelist]
+    def __call__(self, content: bytes, mime: bool = False) -> str:
+        with self._lock:
+            return self._lookup(
+                content, pymagic.MAGIC_MIME_TYPE if mime else pymagic.MAGIC_NONE
+            )
 
-    for ext, file_prefix in extensions.items():
-        if any(x.startswith(file_prefix) for x in filenames):
-            return ext
-    return None
+    def __del__(self) -> None:
+        cookie = getattr(self, "_cookie", None)
+        if cookie and pymagic.magic_close:
+            pymagic.magic_close(cookie)
+            self._cookie = None
 
 
 def get_tag(classification: Dict) -> str:
@@ -45,6 +161,24 @@ def get_tag(classification: Dict) -> str:
     return sample_type
 
 
+def get_trace_payload(trace: List[RuleTrace]) -> Dict[str, Any]:
+    """
+    Returns rules evaluated for the sample (see :py:meth:`RuleEngine.match`)
+    in the form of `trace` payload
+    """
+    return {
+        "rule": trace[-1].rule if trace and trace[-1].matched else None,
+        "rules": [
+            {
+                "rule": entry.rule,
+                "matched": entry.matched,
+                "duration_ms": round(entry.duration * 1000, 3),
+            }
+            for entry in trace
+        ],
+    }
+
+
 class Classifier(Karton):
     """
     File type classifier for the Karton framework.
@@ -68,23 +202,428 @@ class Classifier(Karton):
         magic: Callable = None,
     ) -> None:
         super().__init__(config=config, identity=identity, backend=backend)
-        self._magic = magic or self._magic_from_content()
+        self._magic = magic or MagicBackend()
+        # Size of head/tail window passed to libmagic (0 = whole sample)
+        self.magic_window = self.config.config.getint(
+            "classifier", "magic_window", fallback=0
+        )
+        # Fetch only the needed parts of remote samples using ranged GETs
+        self.range_reads = self.config.config.getboolean(
+            "classifier", "range_reads", fallback=False
+        )
+        self.range_block_size = self.config.config.getint(
+            "classifier", "range_block_size", fallback=DEFAULT_BLOCK_SIZE
+        )
+        if self.range_reads and not self.magic_window:
+            # Whole sample would be downloaded for libmagic otherwise, so
+            # descriptions of large samples may differ from the default mode
+            self.magic_window = DEFAULT_RANGE_MAGIC_WINDOW
+            self.log.info(
+                "Range reads mode uses {} bytes magic window".format(self.magic_window)
+            )
+        # Size of head and tail parts scanned by content heuristics
+        self.heuristics_window = self.config.config.getint(
+            "classifier", "heuristics_window", fallback=HEURISTICS_WINDOW
+        )
+        # Text encoding detectors used by heuristics, tried in order
+        self.encoding_detectors = get_encoding_detectors(
+            self.config.config.get(
+                "classifier",
+                "encoding_detectors",
+                fallback=",".join(DEFAULT_ENCODING_DETECTORS),
+            ).split(",")
+        )
+        # Ratio of control bytes above which script heuristics are skipped
+        self.binary_threshold = self.config.config.getfloat(
+            "classifier", "binary_threshold", fallback=BINARY_THRESHOLD
+        )
+        # Digests computed while the sample is downloaded (empty = disabled)
+        self.digests = [
+            algorithm.strip()
+            for algorithm in self.config.config.get(
+                "classifier", "digests", fallback=""
+            ).split(",")
+            if algorithm.strip()
+        ]
+        if self.digests and "sha256" not in self.digests:
+            # sha256 is required by the outgoing task anyway
+            self.digests.append("sha256")
+        # Fail early on unknown algorithms
+        MultiDigest(self.digests)
+        # Remote samples of at least this size are spooled to a temporary file
+        # and memory-mapped instead of being loaded into memory (0 = disabled)
+        self.mmap_threshold = self.config.config.getint(
+            "classifier", "mmap_threshold", fallback=0
+        )
+        self.mmap_dir = self.config.config.get("classifier", "mmap_dir", fallback=None)
+        # Recognize common formats by signatures without calling libmagic
+        self.signature_sniffer = self.config.config.getboolean(
+            "classifier", "signature_sniffer", fallback=False
+        )
+        # Call libmagic for `magic` payload and MIME type of sniffed samples
+        self.signature_sniffer_magic = self.config.config.getboolean(
+            "classifier", "signature_sniffer_magic", fallback=True
+        )
+        # Add CPU, bitness and image type of executables to the task
+        self.executable_info = self.config.config.getboolean(
+            "classifier", "executable_info", fallback=False
+        )
+        # List members of ZIP, 7z and RAR archives (without extracting them)
+        self.archive_listing = self.config.config.getboolean(
+            "classifier", "archive_listing", fallback=False
+        )
+        self.archive_max_members = self.config.config.getint(
+            "classifier", "archive_max_members", fallback=MAX_MEMBERS
+        )
+        # Classify the beginning of decompressed gz, bz2, xz and zlib samples
+        self.decompress_peek = self.config.config.getboolean(
+            "classifier", "decompress_peek", fallback=False
+        )
+        self.decompress_peek_input = self.config.config.getint(
+            "classifier", "decompress_peek_input", fallback=PEEK_INPUT_SIZE
+        )
+        self.decompress_peek_output = self.config.config.getint(
+            "classifier", "decompress_peek_output", fallback=PEEK_OUTPUT_SIZE
+        )
+        self.decompress_peek_time = self.config.config.getfloat(
+            "classifier", "decompress_peek_time", fallback=PEEK_TIME
+        )
+        # Port of the Prometheus /metrics endpoint (0 = metrics disabled)
+        self.metrics_port = self.config.config.getint(
+            "classifier", "metrics_port", fallback=0
+        )
+        self.metrics_addr = self.config.config.get(
+            "classifier", "metrics_addr", fallback="127.0.0.1"
+        )
+        self.metrics: Metrics = (
+            PrometheusMetrics() if self.metrics_port > 0 else NO_METRICS
+        )
+        self._metrics_server_started = False
+        # Profile fraction of tasks and tasks slower than threshold (in seconds)
+        profile_rate = self.config.config.getfloat(
+            "classifier", "profile_rate", fallback=0.0
+        )
+        profile_threshold = self.config.config.getfloat(
+            "classifier", "profile_threshold", fallback=0.0
+        )
+        self.profiler: Optional[TaskProfiler] = None
+        if profile_rate > 0 or profile_threshold > 0:
+            self.profiler = TaskProfiler(
+                self.config.config.get(
+                    "classifier",
+                    "profile_dir",
+                    fallback=os.path.join(
+                        tempfile.gettempdir(), "karton-classifier-profiles"
+                    ),
+                ),
+                rate=profile_rate,
+                threshold=profile_threshold,
+                max_size=self.config.config.getint(
+                    "classifier", "profile_max_size", fallback=DEFAULT_MAX_SIZE
+                ),
+                log=self.log,
+            )
+        # Add rules evaluated for the sample (with their timing) as `trace` payload
+        self.trace_rules = self.config.config.getboolean(
+            "classifier", "trace_rules", fallback=False
+        )
+        # Log peak size of memory allocated by Python while processing each task
+        self.trace_memory = self.config.config.getboolean(
+            "classifier", "trace_memory", fallback=False
+        )
+        # Classification rules compiled into indexes
+        self.rules = RuleEngine(CLASSIFICATION_RULES)
+        # Name of the rule that matched the last classified sample
+        self._last_rule: Optional[str] = None
+        # Cache of classification results keyed by sample sha256
+        self.cache = self._make_cache()
+        # Number of samples downloaded ahead of the classified one (0 = disabled)
+        self.prefetch = self.config.config.getint("classifier", "prefetch", fallback=0)
+        self._prefetched_readers: "weakref.WeakKeyDictionary[Task, SampleReader]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @classmethod
+    def args_parser(cls) -> argparse.ArgumentParser:
+        from .batch import add_batch_arguments
+
+        parser = super().args_parser()
+        parser.add_argument(
+            "--workers",
+            dest="prefork_workers",
+            type=int,
+            default=1,
+            help="Number of worker processes consuming tasks (default: 1)",
+        )
+        subparsers = parser.add_subparsers(dest="command")
+        add_batch_arguments(
+            subparsers.add_parser(
+                "batch", help="Classify local files and print results as JSON lines"
+            )
+        )
+        return parser
 
-    def _magic_from_content(self) -> Callable:
-        get_magic = pymagic.Magic(mime=False)
-        get_mime = pymagic.Magic(mime=True)
+    @classmethod
+    def main(cls) -> None:
+        parser = cls.args_parser()
+        args = parser.parse_args()
+        if args.command == "batch":
+            from .batch import run_batch
 
-        def wrapper(content, mime):
-            if mime:
-                return get_mime.from_buffer(content)
+            run_batch(args)
+            return
+        config = Config(args.config_file)
+        service = cls(config)
+        if args.prefork_workers > 1:
+            if service.metrics_port > 0:
+                # Metrics of all workers are served by the parent process
+                start_metrics_server(
+                    service.metrics_port,
+                    service.metrics_addr,
+                    multiprocess_registry(),
+                )
+                service._metrics_server_started = True
+            # Service is initialized (with magic database loaded) before fork
+            run_prefork(service, args.prefork_workers)
+        else:
+            service.loop()
+
+    def loop(self) -> None:
+        if isinstance(self.metrics, PrometheusMetrics) and not (
+            self._metrics_server_started
+        ):
+            start_metrics_server(
+                self.metrics_port, self.metrics_addr, self.metrics.registry
+            )
+            self._metrics_server_started = True
+        if self.prefetch > 0:
+            run_pipelined(self, self.prefetch, self._prefetch_sample)
+        else:
+            super().loop()
+
+    def _prefetch_sample(self, task: Task) -> None:
+        """
+        Downloads the sample before the task is processed.
+
+        In range reads mode, only the head of the sample is fetched unless
+        the sample is small enough to be passed to libmagic as a whole.
+        """
+        if not task.has_payload("sample"):
+            return
+        key = self._get_cache_key(task)
+        if key is not None and self.cache is not None and self.cache.has(key):
+            # Cached classification doesn't need the sample
+            return
+        reader = self._create_sample_reader(task)
+        # Other readers download the sample when they're created
+        if isinstance(reader, RangedSampleReader):
+            if reader.size > self.magic_window * 2:
+                reader.head(self.magic_window)
             else:
-                return get_magic.from_buffer(content)
+                reader.getvalue()
+        self._prefetched_readers[task] = reader
+
+    def _make_cache(self) -> Optional[ClassificationCache]:
+        cache_backend = self.config.config.get(
+            "classifier", "cache_backend", fallback="memory"
+        )
+        cache_ttl = (
+            self.config.config.getfloat("classifier", "cache_ttl", fallback=0) or None
+        )
+        # Shared caches may be used by replicas with different configuration
+        fingerprint = get_fingerprint(self._get_cache_options())
+        if cache_backend == "memory":
+            cache_size = self.config.config.getint(
+                "classifier", "cache_size", fallback=0
+            )
+            if cache_size <= 0:
+                return None
+            return LRUClassificationCache(maxsize=cache_size, ttl=cache_ttl)
+        elif cache_backend == "sqlite":
+            cache_path = self.config.config.get(
+                "classifier",
+                "cache_path",
+                fallback=os.path.join(tempfile.gettempdir(), "karton-classifier.db"),
+            )
+            return SQLiteClassificationCache(
+                cache_path, ttl=cache_ttl, fingerprint=fingerprint
+            )
+        elif cache_backend == "redis":
+            return RedisClassificationCache(
+                self.backend.redis,
+                ttl=cache_ttl or REDIS_DEFAULT_TTL,
+                fingerprint=fingerprint,
+            )
+        else:
+            raise ValueError(f"Unknown cache backend: {cache_backend}")
+
+    def _get_cache_options(self) -> Dict[str, Any]:
+        """
+        Returns options affecting classification results
+        """
+        return {
+            "magic_window": self.magic_window,
+            "range_reads": self.range_reads,
+            "signature_sniffer": self.signature_sniffer,
+            "signature_sniffer_magic": self.signature_sniffer_magic,
+            "heuristics_window": self.heuristics_window,
+            "binary_threshold": self.binary_threshold,
+            "encoding_detectors": [
+                detector.__name__ for detector in self.encoding_detectors
+            ],
+            "executable_info": self.executable_info,
+            "archive_listing": self.archive_listing,
+            "archive_max_members": self.archive_max_members,
+            "decompress_peek": self.decompress_peek,
+            "decompress_peek_input": self.decompress_peek_input,
+            "decompress_peek_output": self.decompress_peek_output,
+            "decompress_peek_time": self.decompress_peek_time,
+        }
+
+    def _describe(self, content: bytes) -> Tuple[str, str]:
+        """
+        Gets libmagic description and MIME type of the content.
+
+        Uses single call if magic backend supports it (see :class:`MagicBackend`).
+        """
+        if isinstance(self._magic, MagicBackend):
+            return self._magic.describe(content)
+        return self._magic(content, mime=False), self._magic(content, mime=True)
+
+    def _get_magic(self, reader: SampleReader) -> Tuple[str, str]:
+        """
+        Gets libmagic description and MIME type of the sample content.
+
+        If magic window is configured, libmagic is run on the head of the sample
+        and then on its tail. Whole content is used only when both windows
+        give an empty or generic result.
+        """
+        window = self.magic_window
+        if window > 0 and reader.size > window * 2:
+            for part in (reader.head(window), reader.tail(window)):
+                magic, mime = self._describe(part)
+                if not is_generic_magic(magic):
+                    return magic, mime
+        if isinstance(reader, MappedSampleReader) and isinstance(
+            self._magic, MagicBackend
+        ):
+            # libmagic reads the mapped file directly
+            with reader.c_buffer() as buffer:
+                return self._magic.describe(cast(bytes, buffer))
+        return self._describe(reader.getvalue())
 
-        return wrapper
+    def _get_cache_key(self, task: Task) -> Optional[str]:
+        sample = task.get_resource("sample")
+        sha256 = sample.metadata.get("sha256")
+        if not sha256:
+            return None
+        # Classification depends also on the file extension
+        return f"{sha256}:{self._get_extension(sample.name or 'sample')}"
+
+    def _classify_cached(
+        self, task: Task, trace: Optional[List[RuleTrace]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Classifies the sample using results cache if it's enabled.
+
+        Cache hit doesn't require the sample content to be downloaded.
+        """
+        key = self._get_cache_key(task)
+        if self.cache is None or key is None:
+            return self._classify(task, trace)
+        with self.metrics.stage("cache"):
+            found, sample_class = self.cache.get(key)
+        if not found:
+            sample_class = self._classify(task, trace)
+            with self.metrics.stage("cache"):
+                self.cache.set(key, sample_class)
+        self.log.debug(
+            "Classification cache hits: %d, misses: %d",
+            self.cache.hits,
+            self.cache.misses,
+        )
+        return sample_class
+
+    def get_derived_headers(
+        self, task: Task, sample_class: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Returns headers of the task derived from the classified sample
+        """
+        if sample_class is None:
+            return {
+                "type": "sample",
+                "stage": "unrecognized",
+                "kind": "unknown",
+                "quality": task.headers.get("quality", "high"),
+            }
+
+        derived_headers = {
+            "type": "sample",
+            "stage": "recognized",
+            "quality": task.headers.get("quality", "high"),
+            "mime": sample_class["mime"],
+        }
+        if sample_class.get("kind") is not None:
+            derived_headers["kind"] = sample_class["kind"]
+        if sample_class.get("platform") is not None:
+            derived_headers["platform"] = sample_class["platform"]
+        if sample_class.get("extension") is not None:
+            derived_headers["extension"] = sample_class["extension"]
+        for header in EXECUTABLE_HEADERS + INNER_HEADERS:
+            if sample_class.get(header) is not None:
+                derived_headers[header] = sample_class[header]
+        return derived_headers
 
     def process(self, task: Task) -> None:  # type: ignore
+        try:
+            with self.metrics.stage("process"):
+                if self.trace_memory:
+                    self._process_traced_memory(task)
+                else:
+                    self._process_task(task)
+        finally:
+            # Prefetched sample is not used if classification was cached
+            reader = self._prefetched_readers.pop(task, None)
+            if reader is not None:
+                reader.close()
+
+    def _process_task(self, task: Task) -> None:
+        if self.profiler is not None:
+            self._process_profiled(task, self.profiler)
+        else:
+            self._process(task)
+
+    def _process_traced_memory(self, task: Task) -> None:
+        tracer = AllocationTracer()
+        try:
+            with tracer:
+                self._process_task(task)
+        finally:
+            sample = task.get_resource("sample")
+            self.log.info(
+                "Sample {!r} ({} bytes) peak memory allocation: {} bytes".format(
+                    (sample.name or "sample").encode("utf8"), sample.size, tracer.peak
+                )
+            )
+            self.metrics.memory_peak(tracer.peak)
+
+    def _process_profiled(self, task: Task, profiler: TaskProfiler) -> None:
+        self._last_rule = None
+        profiler.run(
+            lambda: self._process(task),
+            lambda: (
+                task.get_resource("sample").metadata.get("sha256") or "unknown",
+                # No rule is matched for unrecognized and cached samples
+                self._last_rule or "norule",
+            ),
+        )
+
+    def _process(self, task: Task) -> None:
         sample = task.get_resource("sample")
-        sample_class = self._classify(task)
+        # Rules are not evaluated (and traced) for cached results
+        trace: Optional[List[RuleTrace]] = [] if self.trace_rules else None
+        sample_class = self._classify_cached(task, trace)
 
         file_name = sample.name or "sample"
 
@@ -94,15 +633,11 @@ class Classifier(Karton):
                     file_name.encode("utf8")
                 )
             )
-            res = task.derive_task(
-                {
-                    "type": "sample",
-                    "stage": "unrecognized",
-                    "kind": "unknown",
-                    "quality": task.headers.get("quality", "high"),
-                }
-            )
-            self.send_task(res)
+            res = task.derive_task(self.get_derived_headers(task, sample_class))
+            if trace is not None:
+                res.add_payload("trace", get_trace_payload(trace))
+            with self.metrics.stage("send_task"):
+                self.send_task(res)
             return
 
         classification_tag = get_tag(sample_class)
@@ -112,20 +647,7 @@ class Classifier(Karton):
             )
         )
 
-        derived_headers = {
-            "type": "sample",
-            "stage": "recognized",
-            "quality": task.headers.get("quality", "high"),
-            "mime": sample_class["mime"],
-        }
-        if sample_class.get("kind") is not None:
-            derived_headers["kind"] = sample_class["kind"]
-        if sample_class.get("platform") is not None:
-            derived_headers["platform"] = sample_class["platform"]
-        if sample_class.get("extension") is not None:
-            derived_headers["extension"] = sample_class["extension"]
-
-        derived_task = task.derive_task(derived_headers)
+        derived_task = task.derive_task(self.get_derived_headers(task, sample_class))
 
         # pass the original tags to the next task
         tags = [classification_tag]
@@ -139,30 +661,114 @@ class Classifier(Karton):
         if "magic" in sample_class:
             derived_task.add_payload("magic", sample_class["magic"])
 
+        if sample_class.get("executable_format") is not None:
+            derived_task.add_payload(
+                "executable",
+                {
+                    "format": sample_class["executable_format"],
+                    **{
+                        header: sample_class[header]
+                        for header in EXECUTABLE_HEADERS
+                        if sample_class.get(header) is not None
+                    },
+                },
+            )
+
+        if sample_class.get("archive") is not None:
+            derived_task.add_payload("archive", sample_class["archive"])
+
+        if trace is not None:
+            derived_task.add_payload("trace", get_trace_payload(trace))
+
         # add a sha256 digest in the outgoing task if there
         # isn't one in the incoming task
         if "sha256" not in derived_task.payload["sample"].metadata:
-            derived_task.payload["sample"].metadata["sha256"] = sha256(
-                cast(bytes, sample.content)
-            ).hexdigest()
+            with self.metrics.stage("sha256"):
+                # Samples that are not loaded (e.g. in range reads mode)
+                # are streamed instead of being downloaded into memory
+                derived_task.payload["sample"].metadata["sha256"] = digest_content(
+                    sample, "sha256"
+                )
 
-        self.send_task(derived_task)
+        with self.metrics.stage("send_task"):
+            self.send_task(derived_task)
+
+    def explain(self, task: Task) -> Tuple[Optional[Dict[str, Any]], List[RuleTrace]]:
+        """
+        Classifies the sample (without using the cache) and returns
+        the classification with rules evaluated in order
+        """
+        trace: List[RuleTrace] = []
+        return self.classify(task, trace), trace
+
+    def classify(
+        self, task: Task, trace: Optional[List[RuleTrace]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Classifies the sample without using the cache and sending tasks.
+
+        :param task: Task with the `sample` resource
+        :param trace: List extended with rules evaluated for the sample
+        :return: Classification or None if sample was not recognized
+        """
+        return self._classify(task, trace)
 
     def _get_extension(self, name: str) -> str:
         splitted = name.rsplit(".", 1)
         return splitted[-1].lower() if len(splitted) > 1 else ""
 
-    def _classify(self, task: Task) -> Optional[Dict[str, Optional[str]]]:
+    def _get_sample_reader(self, task: Task) -> SampleReader:
+        prefetched_reader = self._prefetched_readers.pop(task, None)
+        if prefetched_reader is not None:
+            return prefetched_reader
+        return self._create_sample_reader(task)
+
+    def _create_sample_reader(self, task: Task) -> SampleReader:
+        return get_sample_reader(
+            task.get_resource("sample"),
+            range_reads=self.range_reads,
+            block_size=self.range_block_size,
+            digests=self.digests,
+            mmap_threshold=self.mmap_threshold,
+            mmap_dir=self.mmap_dir,
+        )
+
+    def _classify(
+        self, task: Task, trace: Optional[List[RuleTrace]] = None
+    ) -> Optional[Dict[str, Any]]:
+        with self.metrics.stage("download"):
+            reader = self._get_sample_reader(task)
+        try:
+            return self._classify_sample(task, reader, trace)
+        finally:
+            reader.close()
+
+    def _classify_sample(
+        self,
+        task: Task,
+        reader: SampleReader,
+        trace: Optional[List[RuleTrace]] = None,
+    ) -> Optional[Dict[str, Any]]:
         sample = task.get_resource("sample")
-        content = cast(bytes, sample.content)
+        # Digests computed during download are passed to the next services
+        # (values provided by the producer are kept)
+        for algorithm, hexdigest in reader.digests.items():
+            if not sample.metadata.get(algorithm):
+                sample.metadata[algorithm] = hexdigest
 
         magic = task.get_payload("magic") or ""
         magic_mime = task.get_payload("mime") or ""
-        try:
-            magic = self._magic(content, mime=False)
-            magic_mime = self._magic(content, mime=True)
-        except Exception as ex:
-            self.log.warning(f"unable to get magic: {ex}")
+        with self.metrics.stage("magic"):
+            sniffed = sniff(reader) if self.signature_sniffer else None
+            if sniffed is not None:
+                # Rules get synthetic description, libmagic is called only
+                # for recognized samples if enabled (see below)
+                magic, magic_mime = sniffed
+            else:
+                try:
+                    magic, magic_mime = self._get_magic(reader)
+                except Exception as ex:
+                    self.log.warning(f"unable to get magic: {ex}")
 
         extension = self._get_extension(sample.name or "sample")
         sample_class = {
@@ -173,440 +779,156 @@ class Classifier(Karton):
             "extension": None,
         }
 
-        # Is PE file?
-        if magic.startswith("PE32") or magic.startswith("MS-DOS executable PE32"):
-            sample_class.update(
-                {"kind": "runnable", "platform": "win32", "extension": "exe"}
-            )
-            if magic.startswith("PE32+"):
-                sample_class["platform"] = "win64"  # 64-bit only executable
-            if "(DLL)" in magic:
-                sample_class["extension"] = "dll"
-            return sample_class
-
-        # ZIP-contained files?
-        def zip_has_file(path: str) -> bool:
+        ctx = ClassificationContext(
+            reader,
+            magic=magic,
+            mime=magic_mime,
+            extension=extension,
+            log=self.log,
+            heuristics_window=self.heuristics_window,
+            encoding_detectors=self.encoding_detectors,
+            binary_threshold=self.binary_threshold,
+            metrics=self.metrics,
+        )
+        with self.metrics.stage("rules"):
+            match = self.rules.match(ctx, trace)
+        self.metrics.rule_matched(match[0].name if match is not None else None)
+        if match is None:
+            # If not recognized then unsupported
+            self._last_rule = None
+            return None
+        rule, headers = match
+        self._last_rule = rule.name
+        if sniffed is not None and self.signature_sniffer_magic:
+            # Synthetic description is not passed to the next services,
+            # magic payload and MIME type come from libmagic like for other
+            # samples
+            with self.metrics.stage("magic"):
+                try:
+                    magic, magic_mime = self._get_magic(reader)
+                except Exception as ex:
+                    self.log.warning(f"unable to get magic: {ex}")
+            sample_class["magic"] = magic if magic else None
+            sample_class["mime"] = magic_mime if magic_mime else None
+        elif sniffed is not None:
+            # Synthetic description is not passed as the magic payload,
+            # sniffed MIME type matches the one reported by libmagic
+            del sample_class["magic"]
+        sample_class.update(headers)
+        if self.executable_info and sample_class["kind"] in ("runnable", "dump"):
+            with self.metrics.stage("executable"):
+                info = parse_executable(reader)
+            if info is not None:
+                sample_class["executable_format"] = info.format
+                sample_class.update(info.headers())
+        if self.archive_listing and sample_class["kind"] == "archive":
             try:
-                ZipFile(BytesIO(content)).getinfo(path)
-                return True
-            except Exception:
-                return False
-
-        if magic.startswith("Zip archive data") or magic.startswith(
-            "Java archive data (JAR)"
-        ):
-            if extension == "apk" or zip_has_file("AndroidManifest.xml"):
-                sample_class.update(
-                    {"kind": "runnable", "platform": "android", "extension": "apk"}
-                )
-                return sample_class
-
-            if extension == "jar" or zip_has_file("META-INF/MANIFEST.MF"):
-                sample_class.update(
-                    {
-                        "kind": "runnable",
-                        "platform": "win32",  # Default platform should be Windows
-                        "extension": "jar",
-                    }
-                )
-                return sample_class
-
-        # Dalvik Android files?
-        if magic.startswith("Dalvik dex file") or extension == "dex":
-            sample_class.update(
-                {"kind": "runnable", "platform": "android", "extension": "dex"}
-            )
-            return sample_class
-
-        # Shockwave Flash?
-        if magic.startswith("Macromedia Flash") or extension == "swf":
-            sample_class.update(
-                {"kind": "runnable", "platform": "win32", "extension": "swf"}
-            )
-            return sample_class
-
-        # Windows LNK?
-        if magic.startswith("MS Windows shortcut") or extension == "lnk":
-            sample_class.update(
-                {"kind": "runnable", "platform": "win32", "extension": "lnk"}
-            )
-            return sample_class
-
-        # Is ELF file?
-        if magic.startswith("ELF"):
-            sample_class.update({"kind": "runnable", "platform": "linux"})
-            return sample_class
-
-        # Is PKG file?
-        if magic.startswith("xar archive") or extension == "pkg":
-            sample_class.update(
-                {"kind": "runnable", "platform": "macos", "extension": "pkg"}
-            )
-            return sample_class
-
-        # Is DMG file?
-        if extension == "dmg" or all(
-            [
-                len(content) > 512,
-                content[-512:][:4] == b"koly",
-                content[-512:][8:12] == b"\x00\x00\x02\x00",
-            ]
+                with self.metrics.stage("archive"):
+                    # Central directory of ZIP archives is decoded once
+                    # for the rules and the listing
+                    listing = list_archive(
+                        reader,
+                        self.archive_max_members,
+                        get_zip_index=lambda: ctx.zip_index,
+                    )
+            except Exception as ex:
+                self.log.warning(f"unable to list archive members: {ex}")
+                listing = None
+            if listing is not None:
+                sample_class["archive"] = self._get_archive_payload(listing)
+        if (
+            self.decompress_peek
+            and sample_class["kind"] == "archive"
+            and sample_class["extension"] in DECOMPRESSORS
         ):
-            sample_class.update(
-                {"kind": "runnable", "platform": "macos", "extension": "dmg"}
-            )
-            return sample_class
-
-        # Is mach-o file?
-        if magic.startswith("Mach-O"):
-            sample_class.update({"kind": "runnable", "platform": "macos"})
-            return sample_class
-
-        def zip_has_mac_app() -> bool:
-            try:
-                zipfile = ZipFile(BytesIO(content))
-                return any(
-                    x.filename.lower().endswith(".app/contents/info.plist")
-                    for x in zipfile.filelist
+            with self.metrics.stage("decompress"):
+                inner = self._classify_inner(
+                    reader, sample_class["extension"], sample.name or "sample"
                 )
-            except Exception:
-                return False
-
-        # macos app within zip
-        if magic.startswith("Zip archive data") and zip_has_mac_app():
-            sample_class.update(
-                {"kind": "runnable", "platform": "macos", "extension": "app"}
-            )
-            return sample_class
-
-        # Windows scripts (per extension)
-        script_extensions = [
-            "vbs",
-            "vbe",
-            "js",
-            "jse",
-            "wsh",
-            "wsf",
-            "hta",
-            "cmd",
-            "bat",
-            "ps1",
-        ]
-        if extension in script_extensions:
-            sample_class.update(
-                {"kind": "script", "platform": "win32", "extension": extension}
-            )
-            return sample_class
+            if inner is not None:
+                sample_class["inner_kind"] = inner.get("kind")
+                sample_class["inner_extension"] = inner.get("extension")
+        return sample_class
+
+    def _classify_inner(
+        self, reader: SampleReader, compression: str, name: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Classifies the beginning of decompressed sample using the same rules
+        """
+        data = peek_decompressed(
+            reader,
+            compression,
+            input_size=self.decompress_peek_input,
+            output_size=self.decompress_peek_output,
+            time_limit=self.decompress_peek_time,
+        )
+        if data is None:
+            return None
+        inner_reader = BytesSampleReader(data)
+        sniffed = sniff(inner_reader) if self.signature_sniffer else None
+        try:
+            magic, mime = sniffed or self._describe(data)
+        except Exception as ex:
+            self.log.warning(f"unable to get magic of decompressed data: {ex}")
+            return None
+        # Name of the compressed file is usually the original name with suffix
+        ctx = ClassificationContext(
+            inner_reader,
+            magic=magic,
+            mime=mime,
+            extension=self._get_extension(name.rsplit(".", 1)[0]),
+            log=self.log,
+            heuristics_window=self.heuristics_window,
+            encoding_detectors=self.encoding_detectors,
+            binary_threshold=self.binary_threshold,
+        )
+        match = self.rules.match(ctx)
+        return match[1] if match is not None else None
+
+    def _get_member_type(self, extension: str) -> Optional[str]:
+        """
+        Infers classification tag of the archive member by its extension
+        """
+        if not extension:
+            return None
+        ctx = ClassificationContext(
+            BytesSampleReader(b""),
+            magic="",
+            mime="",
+            extension=extension,
+            log=self.log,
+        )
+        match = self.rules.match(ctx)
+        if match is not None:
+            return get_tag(match[1])
+        if extension in WIN32_RUNNABLE_EXTENSIONS:
+            return f"runnable:win32:{extension}"
+        return None
 
-        # Office documents
-        office_extensions = {
-            "doc": "Microsoft Word",
-            "xls": "Microsoft Excel",
-            "ppt": "Microsoft PowerPoint",
-        }
-        # Check RTF by libmagic
-        if magic.startswith("Rich Text Format"):
-            sample_class.update(
-                {"kind": "document", "platform": "win32", "extension": "rtf"}
-            )
-            return sample_class
-        # Check Composite Document (doc/xls/ppt) by libmagic and extension
-        if magic.startswith("Composite Document File"):
-            # MSI installers are also CDFs
-            if "MSI Installer" in magic:
-                sample_class.update(
-                    {"kind": "runnable", "platform": "win32", "extension": "msi"}
-                )
-                return sample_class
-            # If not MSI, treat it like Office document
-            sample_class.update(
+    def _get_archive_payload(self, listing: ArchiveListing) -> Dict[str, Any]:
+        # Members with the same extension are classified once
+        member_types: Dict[str, Optional[str]] = {}
+        members: List[Dict[str, Any]] = []
+        for member in listing.members:
+            member_type = None
+            if not member.is_dir:
+                extension = self._get_extension(member.name.rsplit("/", 1)[-1])
+                if extension not in member_types:
+                    member_types[extension] = self._get_member_type(extension)
+                member_type = member_types[extension]
+            members.append(
                 {
-                    "kind": "document",
-                    "platform": "win32",
+                    "name": member.name,
+                    "size": member.size,
+                    "is_dir": member.is_dir,
+                    "encrypted": member.encrypted,
+                    "type": member_type,
                 }
             )
-
-            for ext, typepart in office_extensions.items():
-                if f"Name of Creating Application: {typepart}" in magic:
-                    sample_class["extension"] = ext
-                    return sample_class
-
-            if extension[:3] in office_extensions.keys():
-                sample_class["extension"] = extension
-            else:
-                sample_class["extension"] = "doc"
-            return sample_class
-
-        # Check docx/xlsx/pptx by libmagic
-        for ext, typepart in office_extensions.items():
-            if magic.startswith(typepart):
-                sample_class.update(
-                    {"kind": "document", "platform": "win32", "extension": ext + "x"}
-                )
-                return sample_class
-
-        # Check RTF by extension
-        if extension == "rtf":
-            sample_class.update(
-                {"kind": "document", "platform": "win32", "extension": "rtf"}
-            )
-            return sample_class
-
-        # Finally check document type only by extension
-        if extension[:3] in office_extensions.keys():
-            sample_class.update(
-                {"kind": "document", "platform": "win32", "extension": extension}
-            )
-            return sample_class
-
-        # Unclassified Open XML documents
-        if magic.startswith("Microsoft OOXML"):
-            try:
-                extn = classify_openxml(content)
-                if extn:
-                    sample_class.update(
-                        {
-                            "kind": "document",
-                            "platform": "win32",
-                            "extension": extn,
-                        }
-                    )
-                    return sample_class
-            except Exception:
-                self.log.exception("Error while trying to classify OOXML")
-
-        # PDF files
-        if magic.startswith("PDF document") or extension == "pdf":
-            sample_class.update(
-                {"kind": "document", "platform": "win32", "extension": "pdf"}
-            )
-            return sample_class
-
-        # Archives
-        archive_assoc = {
-            "7z": ["7-zip archive data"],
-            "ace": ["ACE archive data"],
-            "bz2": ["bzip2 compressed data"],
-            "cab": ["Microsoft Cabinet archive data"],
-            "gz": ["gzip compressed"],
-            "iso": ["ISO 9660 CD-ROM"],
-            "lz": ["lzip compressed data"],
-            "tar": ["tar archive", "POSIX tar archive"],
-            "rar": ["RAR archive data"],
-            "udf": ["UDF filesystem data"],
-            "xz": ["XZ compressed data"],
-            "zip": ["Zip archive data"],
-            "zlib": ["zlib compressed data"],
-        }
-        archive_extensions = [
-            "ace",
-            "zip",
-            "rar",
-            "tar",
-            "cab",
-            "gz",
-            "7z",
-            "bz2",
-            "arj",
-            "iso",
-            "xz",
-            "lz",
-            "udf",
-            "cab",
-            "zlib",
-        ]
-
-        def apply_archive_headers(extension):
-            headers = {"kind": "archive", "extension": extension}
-            if extension == "xz":
-                # libmagic >= 5.40 generates correct MIME type for XZ archives
-                headers["mime"] = "application/x-xz"
-            sample_class.update(headers)
-            return sample_class
-
-        for archive_extension, assocs in archive_assoc.items():
-            if any(magic.startswith(assoc) for assoc in assocs):
-                return apply_archive_headers(archive_extension)
-
-        if extension in archive_extensions:
-            return apply_archive_headers(extension)
-
-        # E-mail
-        email_assoc = {
-            "msg": ["Microsoft Outlook Message"],
-            "eml": ["multipart/mixed", "RFC 822 mail", "SMTP mail"],
+        return {
+            "format": listing.format,
+            "count": listing.total,
+            "encrypted": listing.encrypted,
+            "members": members,
         }
-        for ext, patterns in email_assoc.items():
-            if any(pattern in magic for pattern in patterns):
-                sample_class.update({"kind": "archive", "extension": ext})
-                return sample_class
-
-        if extension in email_assoc.keys():
-            sample_class.update({"kind": "archive", "extension": extension})
-            return sample_class
-
-        # HTML
-        if magic.startswith("HTML document"):
-            sample_class.update({"kind": "html"})
-            return sample_class
-
-        # Linux scripts
-        if ("script" in magic and "executable" in magic) or extension == "sh":
-            sample_class.update(
-                {"kind": "script", "platform": "linux", "extension": extension}
-            )
-            return sample_class
-
-        # Content heuristics
-        partial = content[:2048] + content[-2048:]
-
-        # Dumped PE file heuristics (PE not recognized by libmagic)
-        if b".text" in partial and b"This program cannot be run" in partial:
-            sample_class.update(
-                {"kind": "dump", "platform": "win32", "extension": "exe"}
-            )
-            return sample_class
-
-        if len(partial) > 0x40:
-            pe_offs = struct.unpack("<H", partial[0x3C:0x3E])[0]
-            if partial[pe_offs : pe_offs + 2] == b"PE":
-                sample_class.update(
-                    {"kind": "dump", "platform": "win32", "extension": "exe"}
-                )
-                return sample_class
-
-        if partial.startswith(b"MZ"):
-            sample_class.update(
-                {"kind": "dump", "platform": "win32", "extension": "exe"}
-            )
-            return sample_class
-
-        # Heuristics for scripts
-        try:
-            try:
-                partial_str = partial.decode(
-                    chardet.detect(partial)["encoding"]
-                ).lower()
-            except Exception:
-                self.log.warning("Heuristics disabled - unknown encoding")
-            else:
-                vbs_keywords = [
-                    "end function",
-                    "end if",
-                    "array(",
-                    "sub ",
-                    "on error ",
-                    "createobject",
-                    "execute",
-                ]
-                js_keywords = [
-                    "function ",
-                    "function(",
-                    "this.",
-                    "this[",
-                    "new ",
-                    "createobject",
-                    "activexobject",
-                    "var ",
-                    "catch",
-                ]
-                html_keywords = ["<!doctype", "<html", "<script"]
-                ps_keywords = [
-                    "powershell",
-                    "-nop",
-                    "bypass",
-                    "new-object",
-                    "invoke-expression",
-                    "frombase64string(",
-                    "| iex",
-                    "|iex",
-                ]
-                if (
-                    len([True for keyword in html_keywords if keyword in partial_str])
-                    >= 2
-                ):
-                    sample_class.update({"kind": "html"})
-                    return sample_class
-
-                if (
-                    len([True for keyword in vbs_keywords if keyword in partial_str])
-                    >= 2
-                ):
-                    sample_class.update(
-                        {"kind": "script", "platform": "win32", "extension": "vbs"}
-                    )
-                    return sample_class
-                # Powershell heuristics
-                if len(
-                    [True for keyword in ps_keywords if keyword.lower() in partial_str]
-                ):
-                    sample_class.update(
-                        {"kind": "script", "platform": "win32", "extension": "ps1"}
-                    )
-                    return sample_class
-                # JS heuristics
-                if (
-                    len([True for keyword in js_keywords if keyword in partial_str])
-                    >= 2
-                ):
-                    sample_class.update(
-                        {"kind": "script", "platform": "win32", "extension": "js"}
-                    )
-                    return sample_class
-                # JSE heuristics
-                if re.match("#@~\\^[a-zA-Z0-9+/]{6}==", partial_str):
-                    sample_class.update(
-                        {
-                            "kind": "script",
-                            "platform": "win32",
-                            "extension": "jse",  # jse is more possible than vbe
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("ASCII"):
-                    sample_class.update(
-                        {
-                            "kind": "ascii",
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("ISO-8859"):
-                    sample_class.update(
-                        {
-                            "kind": "iso-8859-1",
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("UTF-8"):
-                    sample_class.update(
-                        {
-                            "kind": "utf-8",
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("PGP"):
-                    sample_class.update(
-                        {
-                            "kind": "pgp",
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("pcap capture file"):
-                    sample_class.update(
-                        {
-                            "kind": "pcap",
-                        }
-                    )
-                    return sample_class
-                if magic.startswith("pcap") and "ng capture file" in magic:
-                    sample_class.update(
-                        {
-                            "kind": "pcapng",
-                        }
-                    )
-                    return sample_class
-        except Exception as e:
-            self.log.exception(e)
-
-        # If not recognized then unsupported
-        return None
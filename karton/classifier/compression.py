@@ -0,0 +1,96 @@
+"""
+Bounded decompression of the head of gz, bz2, xz and zlib samples.
+
+Only the beginning of the compressed stream is fed to the stdlib streaming
+decompressors, with limits of input read, output produced and time spent,
+so decompression bombs are rejected as cheaply as other samples.
+"""
+
+import bz2
+import lzma
+import time
+import zlib
+from typing import Callable, Dict, Optional, Union
+
+from .reader import SampleReader
+
+# Default limits of the decompression peek. bz2 decompresses whole blocks
+# (up to 900 kB of data), so the first one must fit in the input limit.
+PEEK_INPUT_SIZE = 256 * 1024
+PEEK_OUTPUT_SIZE = 1024 * 1024
+PEEK_TIME = 0.5
+
+# Size of compressed chunks fed to the decompressor
+PEEK_CHUNK_SIZE = 16 * 1024
+
+Decompressor = Union["zlib._Decompress", bz2.BZ2Decompressor, lzma.LZMADecompressor]
+
+DECOMPRESSORS: Dict[str, Callable[[], Decompressor]] = {
+    "gz": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    "zlib": lambda: zlib.decompressobj(),
+    "bz2": bz2.BZ2Decompressor,
+    "xz": lzma.LZMADecompressor,
+}
+
+
+def _decompress(decompressor: Decompressor, data: bytes, max_length: int) -> bytes:
+    output = decompressor.decompress(data, max_length)
+    if isinstance(decompressor, (bz2.BZ2Decompressor, lzma.LZMADecompressor)):
+        # Unconsumed input is buffered by the decompressor
+        while (
+            len(output) < max_length
+            and not decompressor.eof
+            and not decompressor.needs_input
+        ):
+            output += decompressor.decompress(b"", max_length - len(output))
+    else:
+        while (
+            len(output) < max_length
+            and not decompressor.eof
+            and decompressor.unconsumed_tail
+        ):
+            output += decompressor.decompress(
+                decompressor.unconsumed_tail, max_length - len(output)
+            )
+    return output
+
+
+def peek_decompressed(
+    reader: SampleReader,
+    compression: str,
+    input_size: int = PEEK_INPUT_SIZE,
+    output_size: int = PEEK_OUTPUT_SIZE,
+    time_limit: float = PEEK_TIME,
+) -> Optional[bytes]:
+    """
+    Returns up to `output_size` bytes from the beginning of decompressed sample.
+
+    Decompression stops when `input_size` bytes of the sample are consumed
+    or after `time_limit` seconds, so the result may be shorter. Data
+    decompressed before a corrupted part of the stream is still returned.
+
+    :param reader: Sample reader
+    :param compression: Compression format (gz, zlib, bz2 or xz)
+    :return: Decompressed data or None if nothing was decompressed
+    """
+    if compression not in DECOMPRESSORS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    decompressor = DECOMPRESSORS[compression]()
+    deadline = time.monotonic() + time_limit
+    output = b""
+    offset = 0
+    input_size = min(input_size, reader.size)
+    while offset < input_size and len(output) < output_size:
+        if time.monotonic() > deadline:
+            break
+        chunk = reader.read(offset, min(PEEK_CHUNK_SIZE, input_size - offset))
+        if not chunk:
+            break
+        offset += len(chunk)
+        try:
+            output += _decompress(decompressor, chunk, output_size - len(output))
+        except (OSError, EOFError, zlib.error, lzma.LZMAError):
+            break
+        if decompressor.eof:
+            break
+    return output or None
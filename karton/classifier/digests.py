@@ -0,0 +1,31 @@
+import hashlib
+from typing import Dict, Iterable
+
+
+class MultiDigest:
+    """
+    Computes several digests of the data in a single pass over its chunks.
+
+    :param algorithms: Names of hashlib algorithms (e.g. ``sha256``)
+    """
+
+    def __init__(self, algorithms: Iterable[str]) -> None:
+        self._hashes = {}
+        for algorithm in algorithms:
+            try:
+                self._hashes[algorithm] = hashlib.new(algorithm)
+            except ValueError:
+                raise ValueError(f"Unknown digest algorithm: {algorithm}")
+
+    @property
+    def algorithms(self) -> Iterable[str]:
+        return self._hashes.keys()
+
+    def update(self, data: bytes) -> None:
+        for digest in self._hashes.values():
+            digest.update(data)
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {
+            algorithm: digest.hexdigest() for algorithm, digest in self._hashes.items()
+        }
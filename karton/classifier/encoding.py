@@ -0,0 +1,134 @@
+"""
+Text encoding detection used by content heuristics.
+
+Detectors are tried in order, from the cheapest ones. Each detector proposes
+an encoding that is accepted only if the text can be strictly decoded with it.
+chardet is the slowest one, so it's used as the last resort.
+"""
+
+import codecs
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import chardet  # type: ignore
+
+# Function returning encoding proposed for the data (or None).
+# Second argument is the libmagic description of the sample.
+EncodingDetector = Callable[[bytes, str], Optional[str]]
+
+# Charsets reported by libmagic in the description of text files
+# (more specific ones go first)
+MAGIC_CHARSETS = [
+    ("UTF-16, little-endian", "utf-16-le"),
+    ("Little-endian UTF-16", "utf-16-le"),
+    ("UTF-16, big-endian", "utf-16-be"),
+    ("Big-endian UTF-16", "utf-16-be"),
+    ("UTF-8", "utf-8"),
+    ("ISO-8859", "iso-8859-1"),
+    ("ASCII", "ascii"),
+]
+
+
+def detect_bom(data: bytes, magic: str) -> Optional[str]:
+    if data.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return None
+
+
+def detect_ascii(data: bytes, magic: str) -> Optional[str]:
+    return "ascii" if data.isascii() else None
+
+
+def detect_utf8(data: bytes, magic: str) -> Optional[str]:
+    # Validated by the strict decoding
+    return "utf-8"
+
+
+def detect_magic_charset(data: bytes, magic: str) -> Optional[str]:
+    for pattern, encoding in MAGIC_CHARSETS:
+        if pattern in magic:
+            return encoding
+    return None
+
+
+def detect_chardet(data: bytes, magic: str) -> Optional[str]:
+    return chardet.detect(data)["encoding"]
+
+
+ENCODING_DETECTORS: Dict[str, EncodingDetector] = {
+    "bom": detect_bom,
+    "ascii": detect_ascii,
+    "utf-8": detect_utf8,
+    "magic": detect_magic_charset,
+    "chardet": detect_chardet,
+}
+
+DEFAULT_ENCODING_DETECTORS = ["bom", "magic", "ascii", "utf-8", "chardet"]
+
+
+def get_encoding_detectors(names: Iterable[str]) -> List[EncodingDetector]:
+    """
+    Returns detectors with given names (see :py:data:`ENCODING_DETECTORS`)
+    """
+    detectors = []
+    for name in names:
+        name = name.strip()
+        if name not in ENCODING_DETECTORS:
+            raise ValueError(f"Unknown encoding detector: {name}")
+        detectors.append(ENCODING_DETECTORS[name])
+    return detectors
+
+
+# Bytes expected in text files. Other ones are control characters that
+# appear mostly in binary files (and in UTF-16/32 text).
+TEXT_BYTES = bytes(range(0x20, 0x7F)) + b"\t\n\r\f\b\x1b" + bytes(range(0x80, 0x100))
+
+
+def control_bytes_ratio(data: bytes) -> float:
+    """
+    Returns ratio of control bytes (other than whitespace) in the data
+    """
+    if not data:
+        return 0.0
+    return len(data.translate(None, TEXT_BYTES)) / len(data)
+
+
+def is_binary(data: bytes, magic: str = "", threshold: float = 0.05) -> bool:
+    """
+    Checks whether data is clearly not a text.
+
+    Data is binary if ratio of control bytes is higher than `threshold`,
+    unless it starts with a byte order mark or libmagic reported a charset.
+    """
+    if control_bytes_ratio(data) <= threshold:
+        return False
+    return detect_bom(data, magic) is None and detect_magic_charset(data, magic) is None
+
+
+def decode_text(
+    data: bytes,
+    magic: str = "",
+    detectors: Optional[Iterable[EncodingDetector]] = None,
+) -> Optional[Tuple[str, str]]:
+    """
+    Decodes the data using the first proposed encoding that works.
+
+    :param data: Data to decode
+    :param magic: libmagic description of the data
+    :param detectors: Encoding detectors (default: DEFAULT_ENCODING_DETECTORS)
+    :return: Tuple of (text, encoding) or None if data can't be decoded
+    """
+    if detectors is None:
+        detectors = get_encoding_detectors(DEFAULT_ENCODING_DETECTORS)
+    tried = set()
+    for detector in detectors:
+        encoding = detector(data, magic)
+        if not encoding or encoding.lower() in tried:
+            continue
+        tried.add(encoding.lower())
+        try:
+            return data.decode(encoding), encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None
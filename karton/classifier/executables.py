@@ -0,0 +1,253 @@
+"""
+Parsers of fixed executable headers (PE, ELF, Mach-O).
+
+Only the headers at known offsets are read, so routing properties
+(CPU, bitness, subsystem, image type) are available without parsing
+sections or load commands. The only exception are ELF shared objects,
+whose program headers are checked to tell position-independent executables
+from shared libraries.
+"""
+
+import struct
+from typing import Dict, NamedTuple, Optional
+
+from .reader import SampleReader
+
+PE_MACHINES = {
+    0x14C: "x86",
+    0x8664: "x86_64",
+    0x1C0: "arm",
+    0x1C2: "arm",
+    0x1C4: "arm",
+    0xAA64: "arm64",
+    0x200: "ia64",
+}
+
+PE_SUBSYSTEMS = {
+    1: "native",
+    2: "gui",
+    3: "console",
+    5: "os2_console",
+    7: "posix_console",
+    9: "windows_ce_gui",
+    10: "efi_application",
+    11: "efi_boot_service_driver",
+    12: "efi_runtime_driver",
+    13: "efi_rom",
+    14: "xbox",
+    16: "windows_boot_application",
+}
+
+ELF_MACHINES = {
+    2: "sparc",
+    3: "x86",
+    4: "m68k",
+    8: "mips",
+    20: "ppc",
+    21: "ppc64",
+    22: "s390",
+    40: "arm",
+    42: "sh",
+    43: "sparc",
+    50: "ia64",
+    62: "x86_64",
+    183: "arm64",
+    243: "riscv",
+}
+
+ELF_TYPES = {
+    1: "object",
+    2: "executable",
+    3: "shared_object",
+    4: "core",
+}
+
+ELF_ET_DYN = 3
+ELF_PT_DYNAMIC = 2
+ELF_PT_INTERP = 3
+ELF_DT_NULL = 0
+ELF_DT_FLAGS_1 = 0x6FFFFFFB
+ELF_DF_1_PIE = 0x08000000
+
+# Limits of program headers and dynamic entries checked in ELF shared objects
+ELF_MAX_PROGRAM_HEADERS = 256
+ELF_MAX_PROGRAM_HEADER_SIZE = 256
+ELF_MAX_DYNAMIC_ENTRIES = 1024
+
+# ELF class: (program header offset, header fields, program header fields,
+# dynamic entry format)
+ELF_LAYOUTS = {
+    32: (28, "I10xHH", "II8xI", "iI"),
+    64: (32, "Q14xHH", "I4xQ16xQ", "qQ"),
+}
+
+MACHO_MACHINES = {
+    7: "x86",
+    0x01000007: "x86_64",
+    12: "arm",
+    0x0100000C: "arm64",
+    18: "ppc",
+    0x01000012: "ppc64",
+}
+
+MACHO_TYPES = {
+    1: "object",
+    2: "executable",
+    4: "core",
+    6: "shared_object",
+    8: "bundle",
+    11: "kext",
+}
+
+# Mach-O magic: (byte order, bitness)
+MACHO_MAGIC = {
+    b"\xfe\xed\xfa\xce": (">", 32),
+    b"\xce\xfa\xed\xfe": ("<", 32),
+    b"\xfe\xed\xfa\xcf": (">", 64),
+    b"\xcf\xfa\xed\xfe": ("<", 64),
+}
+
+
+class ExecutableInfo(NamedTuple):
+    """
+    Properties read from the executable headers
+    """
+
+    # pe, elf or macho
+    format: str
+    # CPU architecture (e.g. x86, x86_64, arm64), "unknown" if not recognized
+    machine: str
+    bitness: int
+    # Image type: executable, dll, shared_object, object, core...
+    binary_type: str
+    # PE subsystem (e.g. gui, console, native)
+    subsystem: Optional[str] = None
+
+    def headers(self) -> Dict[str, str]:
+        """
+        Returns task headers with the properties (other than format)
+        """
+        headers = {
+            "machine": self.machine,
+            "bitness": str(self.bitness),
+            "binary_type": self.binary_type,
+        }
+        if self.subsystem is not None:
+            headers["subsystem"] = self.subsystem
+        return headers
+
+
+def parse_pe(reader: SampleReader) -> Optional[ExecutableInfo]:
+    dos_header = reader.head(0x40)
+    if len(dos_header) < 0x40 or not dos_header.startswith(b"MZ"):
+        return None
+    pe_offset = struct.unpack("<I", dos_header[0x3C:0x40])[0]
+    # Signature, file header and optional header up to the subsystem field
+    header = reader.read(pe_offset, 0x5E)
+    if len(header) < 0x1A or not header.startswith(b"PE\x00\x00"):
+        return None
+    machine, characteristics, optional_magic = struct.unpack_from("<H16xHH", header, 4)
+    bitness = {0x10B: 32, 0x20B: 64}.get(optional_magic)
+    if bitness is None:
+        return None
+    subsystem = None
+    if len(header) >= 0x5E:
+        # Subsystem offset is the same for PE32 and PE32+
+        subsystem = PE_SUBSYSTEMS.get(
+            struct.unpack_from("<H", header, 0x5C)[0], "unknown"
+        )
+    return ExecutableInfo(
+        format="pe",
+        machine=PE_MACHINES.get(machine, "unknown"),
+        bitness=bitness,
+        binary_type="dll" if characteristics & 0x2000 else "executable",
+        subsystem=subsystem,
+    )
+
+
+def _is_elf_pie(reader: SampleReader, bitness: int, byteorder: str) -> bool:
+    """
+    Checks whether ELF shared object is a position-independent executable
+    (has PT_INTERP program header or DF_1_PIE flag)
+    """
+    offset, header_format, phdr_format, dyn_format = ELF_LAYOUTS[bitness]
+    header_format, phdr_format, dyn_format = (
+        byteorder + header_format,
+        byteorder + phdr_format,
+        byteorder + dyn_format,
+    )
+    header = reader.read(offset, struct.calcsize(header_format))
+    if len(header) < struct.calcsize(header_format):
+        return False
+    phoff, phentsize, phnum = struct.unpack(header_format, header)
+    if not struct.calcsize(phdr_format) <= phentsize <= ELF_MAX_PROGRAM_HEADER_SIZE:
+        return False
+    phnum = min(phnum, ELF_MAX_PROGRAM_HEADERS)
+    table = reader.read(phoff, phentsize * phnum)
+    dynamic = None
+    for entry in range(len(table) // phentsize):
+        p_type, p_offset, p_filesz = struct.unpack_from(
+            phdr_format, table, entry * phentsize
+        )
+        if p_type == ELF_PT_INTERP:
+            return True
+        if p_type == ELF_PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+    if dynamic is None:
+        return False
+    dyn_size = struct.calcsize(dyn_format)
+    p_offset, p_filesz = dynamic
+    entries = reader.read(p_offset, min(p_filesz, dyn_size * ELF_MAX_DYNAMIC_ENTRIES))
+    for tag, value in struct.iter_unpack(
+        dyn_format, entries[: len(entries) - len(entries) % dyn_size]
+    ):
+        if tag == ELF_DT_NULL:
+            break
+        if tag == ELF_DT_FLAGS_1:
+            return bool(value & ELF_DF_1_PIE)
+    return False
+
+
+def parse_elf(reader: SampleReader) -> Optional[ExecutableInfo]:
+    header = reader.head(20)
+    if len(header) < 20 or not header.startswith(b"\x7fELF"):
+        return None
+    bitness = {1: 32, 2: 64}.get(header[4])
+    byteorder = {1: "<", 2: ">"}.get(header[5])
+    if bitness is None or byteorder is None:
+        return None
+    elf_type, machine = struct.unpack_from(byteorder + "HH", header, 16)
+    binary_type = ELF_TYPES.get(elf_type, "unknown")
+    if elf_type == ELF_ET_DYN and _is_elf_pie(reader, bitness, byteorder):
+        binary_type = "executable"
+    return ExecutableInfo(
+        format="elf",
+        machine=ELF_MACHINES.get(machine, "unknown"),
+        bitness=bitness,
+        binary_type=binary_type,
+    )
+
+
+def parse_macho(reader: SampleReader) -> Optional[ExecutableInfo]:
+    header = reader.head(16)
+    if len(header) < 16 or header[:4] not in MACHO_MAGIC:
+        return None
+    byteorder, bitness = MACHO_MAGIC[header[:4]]
+    cputype, _, filetype = struct.unpack_from(byteorder + "III", header, 4)
+    return ExecutableInfo(
+        format="macho",
+        machine=MACHO_MACHINES.get(cputype, "unknown"),
+        bitness=bitness,
+        binary_type=MACHO_TYPES.get(filetype, "unknown"),
+    )
+
+
+def parse_executable(reader: SampleReader) -> Optional[ExecutableInfo]:
+    """
+    Returns properties of PE, ELF or Mach-O executable (None for other files)
+    """
+    for parser in (parse_pe, parse_elf, parse_macho):
+        info = parser(reader)
+        if info is not None:
+            return info
+    return None
@@ -0,0 +1,72 @@
+from typing import Dict, Iterable, Mapping, Tuple
+
+
+class KeywordScanner:
+    """
+    Multi-family keyword matcher used by content heuristics.
+
+    Families are compiled once into a table of distinct keywords, so keywords
+    shared by several families (e.g. ``createobject``) are searched only once
+    per text. CPython substring search is much faster than a combined regular
+    expression with the same keywords, so each keyword is still searched with
+    ``in``, but at most once and only until the family threshold is reached
+    (see ``benchmarks.heuristics``).
+
+    :param families: Keywords of each family
+    """
+
+    def __init__(self, families: Mapping[str, Iterable[str]]) -> None:
+        self.families: Dict[str, Tuple[str, ...]] = {
+            family: tuple(dict.fromkeys(keywords))
+            for family, keywords in families.items()
+        }
+        self.keywords: Tuple[str, ...] = tuple(
+            dict.fromkeys(
+                keyword for keywords in self.families.values() for keyword in keywords
+            )
+        )
+
+    def scan(self, text: str) -> "KeywordHits":
+        return KeywordHits(self, text)
+
+
+class KeywordHits:
+    """
+    Lazily computed keyword hits in the text.
+
+    Each keyword is searched at most once, results are shared by all families.
+    """
+
+    def __init__(self, scanner: KeywordScanner, text: str) -> None:
+        self.scanner = scanner
+        self.text = text
+        self._found: Dict[str, bool] = {}
+
+    def has_keyword(self, keyword: str) -> bool:
+        found = self._found.get(keyword)
+        if found is None:
+            found = self._found[keyword] = keyword in self.text
+        return found
+
+    def has_at_least(self, family: str, count: int) -> bool:
+        """
+        Checks whether text contains at least `count` distinct family keywords
+        """
+        hits = 0
+        for keyword in self.scanner.families[family]:
+            if self.has_keyword(keyword):
+                hits += 1
+                if hits >= count:
+                    return True
+        return False
+
+    def count(self, family: str) -> int:
+        """
+        Returns number of distinct family keywords found in the text
+        """
+        return sum(
+            1 for keyword in self.scanner.families[family] if self.has_keyword(keyword)
+        )
+
+    def counts(self) -> Dict[str, int]:
+        return {family: self.count(family) for family in self.scanner.families}
@@ -0,0 +1,188 @@
+"""
+Per-stage timing histograms and per-rule counters exported to Prometheus.
+
+Classification stages are wrapped in :py:meth:`Metrics.stage` context
+managers. Base :class:`Metrics` does nothing, so instrumentation costs only
+a method call when metrics are disabled. prometheus_client is an optional
+dependency (``pip install karton-classifier[metrics]``).
+"""
+
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, ContextManager, Optional
+
+try:
+    import prometheus_client  # type: ignore
+    from prometheus_client import multiprocess  # type: ignore
+except ImportError:
+    prometheus_client = None  # type: ignore
+
+# Classification stages (nested stages are also included in the outer ones):
+#   process    - whole task processing
+#   cache      - classification cache lookup and update
+#   download   - sample download (or creating the sample reader)
+#   magic      - libmagic (or signature sniffer)
+#   rules      - rules evaluation, including:
+#     zip        - parsing ZIP central directory
+#     cfb        - parsing OLE compound file directory
+#     encoding   - decoding text for heuristics (including chardet)
+#     heuristics - heuristics keywords scan
+#   executable - parsing executable headers
+#   archive    - listing archive members
+#   decompress - decompression peek
+#   sha256     - sample digest computed in process()
+#   send_task  - sending the derived task
+STAGES = [
+    "process",
+    "cache",
+    "download",
+    "magic",
+    "rules",
+    "zip",
+    "cfb",
+    "encoding",
+    "heuristics",
+    "executable",
+    "archive",
+    "decompress",
+    "sha256",
+    "send_task",
+]
+
+# Buckets of stage duration histograms (in seconds)
+STAGE_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Buckets of task memory peak histograms (in bytes, 64 KiB - 4 GiB)
+MEMORY_BUCKETS = tuple(float(1 << shift) for shift in range(16, 33, 2))
+
+_NULL_STAGE: ContextManager[None] = nullcontext()
+
+
+class Metrics:
+    """
+    Classification metrics that are not collected
+    """
+
+    def stage(self, name: str) -> ContextManager[None]:
+        """
+        Returns context manager measuring duration of the stage
+        """
+        return _NULL_STAGE
+
+    def rule_matched(self, rule: Optional[str]) -> None:
+        """
+        Counts sample matched by the rule (None = unrecognized sample)
+        """
+
+    def memory_peak(self, size: int) -> None:
+        """
+        Records peak size of memory allocated while processing the task
+        """
+
+
+# Shared instance used when metrics are disabled
+NO_METRICS = Metrics()
+
+
+class _StageTimer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Any) -> None:
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Metrics collected by prometheus_client.
+
+    :param registry: Registry of the collectors (default: new registry)
+    """
+
+    def __init__(self, registry: Any = None) -> None:
+        if prometheus_client is None:
+            raise RuntimeError(
+                "prometheus_client is required for metrics "
+                "(pip install karton-classifier[metrics])"
+            )
+        if registry is None:
+            registry = prometheus_client.CollectorRegistry()
+        self.registry = registry
+        self.stage_duration = prometheus_client.Histogram(
+            "karton_classifier_stage_duration_seconds",
+            "Duration of classification stages",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+            registry=registry,
+        )
+        self.rule_hits = prometheus_client.Counter(
+            "karton_classifier_rule_hits_total",
+            "Samples matched by classification rules",
+            ["rule"],
+            registry=registry,
+        )
+        self.task_memory_peak = prometheus_client.Histogram(
+            "karton_classifier_task_memory_peak_bytes",
+            "Peak size of memory allocated by Python while processing tasks",
+            buckets=MEMORY_BUCKETS,
+            registry=registry,
+        )
+        # Labelled children are resolved once
+        self._stages = {name: self.stage_duration.labels(stage=name) for name in STAGES}
+
+    def stage(self, name: str) -> ContextManager[None]:
+        if name not in self._stages:
+            self._stages[name] = self.stage_duration.labels(stage=name)
+        return _StageTimer(self._stages[name])
+
+    def rule_matched(self, rule: Optional[str]) -> None:
+        self.rule_hits.labels(rule=rule or "unrecognized").inc()
+
+    def memory_peak(self, size: int) -> None:
+        self.task_memory_peak.observe(size)
+
+
+def start_metrics_server(port: int, addr: str, registry: Any) -> None:
+    """
+    Serves metrics from the registry on http://addr:port/metrics
+    """
+    prometheus_client.start_http_server(port, addr=addr, registry=registry)
+
+
+def multiprocess_registry() -> Any:
+    """
+    Returns registry aggregating metrics of all worker processes.
+
+    Requires PROMETHEUS_MULTIPROC_DIR environment variable to be set
+    before the workers are started.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        raise RuntimeError(
+            "PROMETHEUS_MULTIPROC_DIR must be set to collect metrics from workers"
+        )
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
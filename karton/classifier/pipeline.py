@@ -0,0 +1,104 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from karton.core import Consumer, Task
+
+# Receiver thread checks the shutdown flag at least that often (in seconds)
+POLL_INTERVAL = 1
+
+
+def run_pipelined(
+    consumer: Consumer, prefetch: int, fetch: Callable[[Task], None]
+) -> None:
+    """
+    Runs consumer loop which prefetches next tasks while the current one
+    is processed.
+
+    Tasks are received by the background thread and `fetch` (e.g. download
+    of the resources) is run for up to `prefetch` tasks ahead in a thread
+    pool. Tasks are still processed one by one in the calling thread and in
+    the order they were received, so outputs and task status updates are
+    made in the same order as in the regular :py:meth:`Consumer.loop`.
+
+    Errors raised by `fetch` are ignored, so they're reported by
+    :py:meth:`Consumer.process` as usual. On graceful shutdown, no new tasks
+    are received but all tasks that were already received are processed.
+
+    Up to `prefetch` + 1 tasks are taken from the queue ahead of time.
+    If the process crashes, they're lost like the currently processed task
+    in the regular loop.
+
+    :param consumer: Karton consumer
+    :param prefetch: Number of tasks prefetched ahead of the processed one
+    :param fetch: Function preparing the task for processing
+    """
+    consumer.log.info(
+        "Service %s started (prefetching %d tasks)", consumer.identity, prefetch
+    )
+
+    old_bind = consumer.backend.register_bind(consumer._bind)
+    if not old_bind:
+        consumer.log.info("Service binds created.")
+    elif old_bind != consumer._bind:
+        consumer.log.info("Binds changed, old service instances should exit soon.")
+
+    for task_filter in consumer.filters:
+        consumer.log.info("Binding on: %s", task_filter)
+
+    consumer.backend.set_consumer_identity(consumer.identity)
+
+    # None marks the end of received tasks
+    received: "queue.Queue[Optional[Tuple[Task, Future]]]" = queue.Queue()
+    # Limits the number of received tasks including the processed one
+    slots = threading.Semaphore(prefetch + 1)
+    receiver_error: Optional[BaseException] = None
+
+    def receive(executor: ThreadPoolExecutor) -> None:
+        nonlocal receiver_error
+        try:
+            while not consumer.shutdown:
+                if not slots.acquire(timeout=POLL_INTERVAL):
+                    continue
+                if consumer.backend.get_bind(consumer.identity) != consumer._bind:
+                    consumer.log.info("Binds changed, shutting down.")
+                    break
+                task = consumer.backend.consume_routed_task(consumer.identity)
+                if task:
+                    received.put((task, executor.submit(fetch, task)))
+                else:
+                    slots.release()
+        except BaseException as e:
+            receiver_error = e
+        finally:
+            received.put(None)
+
+    with ThreadPoolExecutor(
+        max_workers=prefetch, thread_name_prefix="karton-prefetch"
+    ) as executor:
+        receiver = threading.Thread(
+            target=receive, args=(executor,), name="karton-receiver", daemon=True
+        )
+        receiver.start()
+        try:
+            while True:
+                item = received.get()
+                if item is None:
+                    break
+                task, fetched = item
+                error = fetched.exception()
+                if error is not None:
+                    consumer.log.debug(
+                        "Failed to prefetch task %s: %s", task.uid, error
+                    )
+                consumer.internal_process(task)
+                slots.release()
+        except KeyboardInterrupt as e:
+            consumer.log.info("Hard shutting down!")
+            consumer.shutdown = True
+            raise e
+        receiver.join()
+
+    if receiver_error is not None:
+        raise receiver_error
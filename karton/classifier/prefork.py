@@ -0,0 +1,130 @@
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+import traceback
+from typing import Any, Dict
+
+from karton.core.base import KartonServiceBase
+
+# Delay before restarting a crashed worker (in seconds). It's doubled after
+# each crash of a worker that didn't run for `STABLE_TIME` seconds, so
+# persistent failures (e.g. Redis being down) don't end in a fork loop.
+RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 60.0
+STABLE_TIME = 60.0
+
+
+def _run_child(service: KartonServiceBase) -> None:
+    """
+    Runs service loop in the forked process and never returns
+    """
+    exit_code = 0
+    try:
+        service.loop()
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        logging.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def run_prefork(
+    service: KartonServiceBase,
+    workers: int,
+    restart_delay: float = RESTART_DELAY,
+    max_restart_delay: float = MAX_RESTART_DELAY,
+) -> None:
+    """
+    Runs service loop in `workers` forked processes consuming the same queue.
+
+    Service must be fully initialized before calling this function, so the
+    memory allocated in the parent process (e.g. compiled magic database) is
+    shared copy-on-write by all workers. Workers that crashed are restarted
+    with exponential backoff. Workers that exited cleanly (e.g. after binds
+    have changed) are not.
+
+    SIGINT and SIGTERM received by the parent are passed to the workers
+    which shut down gracefully.
+
+    :param service: Initialized Karton service
+    :param workers: Number of worker processes
+    :param restart_delay: Initial delay before restarting crashed worker
+    :param max_restart_delay: Maximum delay before restarting crashed worker
+    """
+    stopping = False
+    # Start times of running workers
+    children: Dict[int, float] = {}
+    delay = restart_delay
+    # Handlers installed by the service (e.g. graceful shutdown of the loop)
+    original_handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+
+    def restore_handlers() -> None:
+        for signum, handler in original_handlers.items():
+            if handler is not None:
+                signal.signal(signum, handler)
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # Restarted workers are forked after `stop` has been installed
+            restore_handlers()
+            _run_child(service)
+        children[pid] = time.monotonic()
+
+    def wait_restart(delay: float) -> None:
+        # Sleeps in short steps to stop waiting as soon as stop is requested
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # Objects allocated so far won't be touched by the garbage collector,
+    # so their pages stay shared after fork
+    gc.freeze()
+    for _ in range(workers):
+        spawn()
+    service.log.info("Started %d worker processes", workers)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = children.pop(pid, None)
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                service.log.info("Worker %d exited", pid)
+                continue
+            if started is not None and time.monotonic() - started >= STABLE_TIME:
+                delay = restart_delay
+            service.log.error(
+                "Worker %d crashed (status %d), restarting in %.1f s",
+                pid,
+                status,
+                delay,
+            )
+            wait_restart(delay)
+            delay = min(delay * 2, max_restart_delay)
+            if not stopping:
+                spawn()
+    finally:
+        restore_handlers()
+        gc.unfreeze()
@@ -0,0 +1,133 @@
+"""
+Sampled profiling of task processing.
+
+Profiles are written as .pstats files (see :py:mod:`pstats`) named after
+the sample sha256 and the rule that matched it, so slow classifications
+seen in production can be analyzed offline. Memory allocated by tasks
+is measured using :py:mod:`tracemalloc`.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Optional, Tuple
+
+# Default limit of the total size of profiles kept in the directory
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+PROFILE_SUFFIX = ".pstats"
+
+
+class TaskProfiler:
+    """
+    Profiles a fraction of tasks and tasks that took too long.
+
+    Latency threshold requires every task to run under the profiler
+    (profiles of faster tasks are discarded), which slows the processing
+    down. Sampling adds the overhead only to the sampled tasks.
+
+    :param directory: Directory for the profiles
+    :param rate: Fraction of tasks that are profiled (0.0 - 1.0)
+    :param threshold: Profiles of tasks that took at least `threshold`
+                      seconds are always kept (0 = disabled)
+    :param max_size: Oldest profiles are removed when the total size
+                     of profiles exceeds `max_size` bytes
+    :param log: Logger used to report errors when saving profiles
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        rate: float = 0.0,
+        threshold: float = 0.0,
+        max_size: int = DEFAULT_MAX_SIZE,
+        log: Optional[logging.Logger] = None,
+    ) -> None:
+        self.directory = directory
+        self.rate = rate
+        self.threshold = threshold
+        self.max_size = max_size
+        self.log = log or logging.getLogger(__name__)
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, fn: Callable[[], None], tags: Callable[[], Tuple[str, str]]) -> None:
+        """
+        Calls `fn` under the profiler if the task is sampled or threshold
+        is enabled.
+
+        :param fn: Function processing the task
+        :param tags: Function returning sha256 and rule name of the processed
+                     sample (called after `fn`)
+        """
+        sampled = self.rate > 0 and random.random() < self.rate
+        if not sampled and self.threshold <= 0:
+            fn()
+            return
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profile.runcall(fn)
+        finally:
+            duration = time.perf_counter() - start
+            if sampled or duration >= self.threshold:
+                self.save(profile, *tags())
+
+    def save(self, profile: cProfile.Profile, sha256: str, rule: str) -> None:
+        name = f"{int(time.time() * 1000)}-{sha256}-{rule}{PROFILE_SUFFIX}"
+        try:
+            profile.dump_stats(os.path.join(self.directory, name))
+            self.rotate()
+        except OSError:
+            self.log.exception("Failed to save profile %s", name)
+
+    def rotate(self) -> None:
+        """
+        Removes the oldest profiles exceeding the total size limit
+        """
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX):
+                stat = entry.stat()
+                profiles.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+        total_size = sum(profile[3] for profile in profiles)
+        # The newest profile is always kept
+        for _, _, path, size in sorted(profiles)[:-1]:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+
+
+class AllocationTracer:
+    """
+    Measures the peak size of memory allocated by Python within the block.
+
+    Memory allocated by native libraries (e.g. libmagic) and memory-mapped
+    files are not included. tracemalloc is enabled only within the block,
+    unless it was already enabled (then Python 3.9+ is required to measure
+    the peak of the block instead of the peak since tracing started).
+    Tracing slows allocations down, so it's meant to be enabled on demand.
+    """
+
+    def __init__(self) -> None:
+        # Peak size of memory allocated within the block (in bytes)
+        self.peak = 0
+        self._baseline = 0
+        self._started = False
+
+    def __enter__(self) -> "AllocationTracer":
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.peak = max(tracemalloc.get_traced_memory()[1] - self._baseline, 0)
+        if self._started:
+            tracemalloc.stop()
@@ -0,0 +1,429 @@
+import contextlib
+import ctypes
+import io
+import mmap
+import tempfile
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from karton.core.resource import RemoteResource, ResourceBase
+
+from .digests import MultiDigest
+
+if TYPE_CHECKING:
+    from karton.core.backend import KartonBackend
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+# Size of chunks read while streaming the whole object from object storage
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class SampleReader:
+    """
+    Random access to the sample content.
+
+    Classification rules read only the parts of the sample they need (head,
+    tail, central directory etc.) so subclasses can avoid loading the whole
+    sample into memory.
+
+    `digests` contain hex digests computed while the sample was downloaded
+    (if any).
+    """
+
+    digests: Dict[str, str]
+
+    @property
+    def size(self) -> int:
+        raise NotImplementedError()
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Reads `length` bytes starting from `offset` (shorter at the end of sample)
+        """
+        raise NotImplementedError()
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """
+        Like :py:meth:`read`, but avoids copying the data if the reader can
+        """
+        return memoryview(self.read(offset, length))
+
+    def getvalue(self) -> bytes:
+        """
+        Returns the whole sample content
+        """
+        return self.read(0, self.size)
+
+    def head(self, length: int) -> bytes:
+        return self.read(0, length)
+
+    def tail(self, length: int) -> bytes:
+        start = max(0, self.size - length)
+        return self.read(start, self.size - start)
+
+    def open(self) -> BinaryIO:
+        """
+        Returns seekable file-like object reading from the sample
+        """
+        return cast(BinaryIO, io.BufferedReader(SampleFile(self)))
+
+    def close(self) -> None:
+        """
+        Releases resources held by the reader
+        """
+
+
+class SampleFile(io.RawIOBase):
+    """
+    Read-only file object for :class:`SampleReader`
+    """
+
+    def __init__(self, reader: SampleReader) -> None:
+        self._reader = reader
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._reader.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return self._position
+
+    def readinto(self, buffer) -> int:  # type: ignore
+        with self._reader.view(self._position, len(buffer)) as data:
+            length = len(data)
+            buffer[:length] = data
+        self._position += length
+        return length
+
+
+class BytesSampleReader(SampleReader):
+    """
+    Sample content already loaded into memory
+    """
+
+    def __init__(
+        self, content: bytes, digests: Optional[Dict[str, str]] = None
+    ) -> None:
+        self._content = content
+        self.digests = digests or {}
+
+    @property
+    def size(self) -> int:
+        return len(self._content)
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._content[offset : offset + length]
+
+    def getvalue(self) -> bytes:
+        return self._content
+
+    def open(self) -> BinaryIO:
+        return io.BytesIO(self._content)
+
+
+class RangedSampleReader(SampleReader):
+    """
+    Reads remote resource content from object storage using ranged GETs.
+
+    Content is fetched in aligned blocks that are kept for the lifetime
+    of the reader, so the same window is never downloaded twice. The whole
+    object is downloaded only when :py:meth:`getvalue` is called.
+
+    :param resource: Remote resource with known size, bound to the backend
+    :param block_size: Size of the fetched blocks
+    """
+
+    def __init__(
+        self, resource: RemoteResource, block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> None:
+        self._resource = resource
+        self._backend = cast("KartonBackend", resource.backend)
+        self._block_size = block_size
+        self._blocks: Dict[int, bytes] = {}
+        self.bytes_fetched = 0
+        self.digests = {}
+
+    @property
+    def size(self) -> int:
+        return self._resource.size
+
+    def _fetch(self, offset: int, length: int) -> bytes:
+        response = self._backend.minio.get_object(
+            self._resource.bucket, self._resource.uid, offset=offset, length=length
+        )
+        try:
+            data = response.read()
+        finally:
+            response.release_conn()
+            response.close()
+        self.bytes_fetched += len(data)
+        return data
+
+    def _missing_runs(self, first: int, last: int) -> List[Tuple[int, int]]:
+        # Groups missing blocks into contiguous runs fetched with a single GET
+        runs: List[Tuple[int, int]] = []
+        for block in range(first, last + 1):
+            if block in self._blocks:
+                continue
+            if runs and runs[-1][1] == block - 1:
+                runs[-1] = (runs[-1][0], block)
+            else:
+                runs.append((block, block))
+        return runs
+
+    def read(self, offset: int, length: int) -> bytes:
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+        if self._resource.loaded():
+            return self._resource.content[offset:end]
+        first, last = offset // self._block_size, (end - 1) // self._block_size
+        for run_first, run_last in self._missing_runs(first, last):
+            run_offset = run_first * self._block_size
+            data = self._fetch(
+                run_offset,
+                min((run_last + 1) * self._block_size, self.size) - run_offset,
+            )
+            for block in range(run_first, run_last + 1):
+                start = (block - run_first) * self._block_size
+                self._blocks[block] = data[start : start + self._block_size]
+        data = b"".join(self._blocks[block] for block in range(first, last + 1))
+        start = offset - first * self._block_size
+        return data[start : start + end - offset]
+
+    def getvalue(self) -> bytes:
+        content = self._resource.content
+        self.bytes_fetched += len(content)
+        self._blocks.clear()
+        return content
+
+
+class MappedSampleReader(SampleReader):
+    """
+    Sample content spooled to a temporary file and memory-mapped.
+
+    Reads are served from the mapping, so only the requested windows are
+    copied into the process memory while the rest of the sample stays in
+    the page cache. The temporary file is removed when the reader is closed.
+
+    File is mapped copy-on-write, which makes the mapping exportable to C
+    libraries (see :py:meth:`c_buffer`). Mapped pages are never written.
+
+    :param file: Named temporary file with the sample content
+    :param digests: Hex digests computed while the file was written
+    """
+
+    def __init__(self, file: IO[bytes], digests: Optional[Dict[str, str]] = None):
+        self._file = file
+        self._size = file.seek(0, io.SEEK_END)
+        # Empty files can't be mapped
+        self._mmap: Optional[mmap.mmap] = (
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY) if self._size else None
+        )
+        self.digests = digests or {}
+
+    @property
+    def path(self) -> str:
+        return self._file.name
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def view(self, offset: int, length: int) -> memoryview:
+        if self._mmap is None:
+            return memoryview(b"")
+        return memoryview(self._mmap)[offset : offset + length]
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._mmap is None:
+            return b""
+        return self._mmap[offset : offset + length]
+
+    @contextlib.contextmanager
+    def c_buffer(self) -> Iterator[Union[bytes, "ctypes.Array[ctypes.c_char]"]]:
+        """
+        Yields the whole content as a ctypes array backed by the mapping
+        """
+        if self._mmap is None:
+            yield b""
+            return
+        buffer = (ctypes.c_char * self._size).from_buffer(self._mmap)
+        try:
+            yield buffer
+        finally:
+            # Mapping can't be closed while the buffer is exported
+            del buffer
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Buffer is still referenced (e.g. by a traceback), mapping
+                # is released together with it
+                pass
+            self._mmap = None
+        self._file.close()
+
+
+def _is_remote_object(sample: ResourceBase) -> bool:
+    return (
+        isinstance(sample, RemoteResource)
+        and not sample.loaded()
+        and sample.backend is not None
+        and hasattr(sample.backend, "minio")
+    )
+
+
+def download_content(
+    sample: ResourceBase,
+    digest: Optional[MultiDigest] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+) -> bytes:
+    """
+    Returns the sample content.
+
+    Remote objects are streamed from object storage in chunks which are passed
+    to `digest`, so digests are computed in the same pass as the download.
+    Chunks are written into a buffer allocated up front for the whole object,
+    so the content is never held twice in memory.
+    """
+    if not _is_remote_object(sample):
+        content = sample.content
+        if digest is not None:
+            digest.update(content)
+        return content
+    buffer = io.BytesIO()
+    if sample.size:
+        # Writing the last byte allocates the whole buffer, chunks are then
+        # copied into it in place and getvalue() returns it without copying
+        buffer.seek(sample.size - 1)
+        buffer.write(b"\x00")
+        buffer.seek(0)
+    for chunk in _stream_object(cast(RemoteResource, sample), chunk_size):
+        if digest is not None:
+            digest.update(chunk)
+        buffer.write(chunk)
+    # Object may be shorter than its declared size
+    buffer.truncate()
+    return buffer.getvalue()
+
+
+def digest_content(
+    sample: ResourceBase, algorithm: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE
+) -> str:
+    """
+    Returns hex digest of the sample content.
+
+    Remote objects that are not loaded yet are streamed from object storage
+    in chunks, so the whole content is never kept in memory.
+    """
+    digest = MultiDigest([algorithm])
+    if _is_remote_object(sample):
+        for chunk in _stream_object(cast(RemoteResource, sample), chunk_size):
+            digest.update(chunk)
+    else:
+        digest.update(sample.content)
+    return digest.hexdigests()[algorithm]
+
+
+def _stream_object(remote: RemoteResource, chunk_size: int) -> Iterator[bytes]:
+    backend = cast("KartonBackend", remote.backend)
+    response = backend.minio.get_object(remote.bucket, remote.uid)
+    try:
+        yield from response.stream(chunk_size)
+    finally:
+        response.release_conn()
+        response.close()
+
+
+def spool_content(
+    sample: RemoteResource,
+    digest: Optional[MultiDigest] = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    directory: Optional[str] = None,
+) -> IO[bytes]:
+    """
+    Streams the remote sample into a named temporary file.
+
+    Only a single chunk is kept in memory at a time. Chunks are passed
+    to `digest` like in :py:func:`download_content`.
+    """
+    file = tempfile.NamedTemporaryFile(prefix="karton-classifier-", dir=directory)
+    try:
+        for chunk in _stream_object(sample, chunk_size):
+            if digest is not None:
+                digest.update(chunk)
+            file.write(chunk)
+        file.flush()
+    except BaseException:
+        file.close()
+        raise
+    return file
+
+
+def get_sample_reader(
+    sample: ResourceBase,
+    range_reads: bool = False,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    digests: Sequence[str] = (),
+    mmap_threshold: int = 0,
+    mmap_dir: Optional[str] = None,
+) -> SampleReader:
+    """
+    Returns reader for the sample resource.
+
+    Ranged reader is used only for remote resources that are not loaded yet
+    and have known size. Remote resources of at least `mmap_threshold` bytes
+    (if enabled) are spooled to a temporary file in `mmap_dir` and
+    memory-mapped. Otherwise content is loaded into memory.
+
+    If `digests` are requested, they're computed while the content is
+    downloaded (spooled samples get always at least sha256). Ranged reader
+    doesn't download the whole content, so it doesn't compute digests.
+    """
+    if range_reads and _is_remote_object(sample) and sample.size:
+        return RangedSampleReader(cast(RemoteResource, sample), block_size=block_size)
+    if (
+        mmap_threshold > 0
+        and _is_remote_object(sample)
+        and (sample.size or 0) >= mmap_threshold
+    ):
+        # sha256 is needed by the outgoing task, so it's always computed while
+        # spooling instead of downloading the whole sample again later
+        digest = MultiDigest(digests if "sha256" in digests else [*digests, "sha256"])
+        file = spool_content(
+            cast(RemoteResource, sample), digest=digest, directory=mmap_dir
+        )
+        return MappedSampleReader(file, digests=digest.hexdigests())
+    if digests:
+        digest = MultiDigest(digests)
+        content = download_content(sample, digest)
+        return BytesSampleReader(content, digests=digest.hexdigests())
+    return BytesSampleReader(sample.content)
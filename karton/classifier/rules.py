@@ -0,0 +1,806 @@
+"""
+Declarative classification rules.
+
+Rules are listed in the order of precedence and compiled once into
+:class:`RuleEngine` indexes, so each sample is checked only against rules
+that can match its libmagic description and file extension.
+"""
+
+import logging
+import re
+import struct
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .cfb import CompoundFileDirectory
+from .encoding import EncodingDetector, decode_text, is_binary
+from .keywords import KeywordHits, KeywordScanner
+from .metrics import NO_METRICS, Metrics
+from .reader import SampleReader
+from .zipindex import ZipIndex
+
+Headers = Dict[str, Optional[str]]
+
+# Size of head and tail parts used by content heuristics
+HEURISTICS_WINDOW = 2048
+
+# Samples with higher ratio of control bytes skip script heuristics
+BINARY_THRESHOLD = 0.05
+
+
+def classify_openxml(content: Union[bytes, ZipIndex]) -> Optional[str]:
+    if isinstance(content, ZipIndex):
+        zip_index = content
+    else:
+        zip_index = ZipIndex.from_content(content)
+    extensions = {"docx": "word", "pptx": "ppt", "xlsx": "xl"}
+
+    for ext, file_prefix in extensions.items():
+        if zip_index.has_prefix(file_prefix):
+            return ext
+    return None
+
+
+class ClassificationContext:
+    """
+    Sample properties checked by the rules.
+
+    Expensive properties (ZIP central directory, compound file directory,
+    decoded heuristics window) are computed lazily, at most once per sample.
+    """
+
+    def __init__(
+        self,
+        reader: SampleReader,
+        magic: str,
+        mime: str,
+        extension: str,
+        log: logging.Logger,
+        heuristics_window: int = HEURISTICS_WINDOW,
+        encoding_detectors: Optional[Sequence[EncodingDetector]] = None,
+        binary_threshold: float = BINARY_THRESHOLD,
+        metrics: Metrics = NO_METRICS,
+    ) -> None:
+        self.reader = reader
+        self.magic = magic
+        self.mime = mime
+        self.extension = extension
+        self.log = log
+        self.heuristics_window = heuristics_window
+        self.encoding_detectors = encoding_detectors
+        self.binary_threshold = binary_threshold
+        self.metrics = metrics
+        self._is_binary: Optional[bool] = None
+        # Encoding of the decoded heuristics window
+        self.encoding: Optional[str] = None
+        self._zip_index: Union[ZipIndex, Exception, None] = None
+        self._cfb_directory: Union[CompoundFileDirectory, Exception, None] = None
+        self._partial: Optional[bytes] = None
+        self._partial_str: Optional[str] = None
+        self._partial_decoded = False
+        self._keyword_hits: Optional[KeywordHits] = None
+
+    @property
+    def zip_index(self) -> ZipIndex:
+        if self._zip_index is None:
+            try:
+                with self.metrics.stage("zip"):
+                    self._zip_index = ZipIndex.from_file(self.reader.open())
+            except Exception as e:
+                self._zip_index = e
+        if isinstance(self._zip_index, Exception):
+            raise self._zip_index
+        return self._zip_index
+
+    def zip_has_file(self, path: str) -> bool:
+        try:
+            return self.zip_index.has_file(path)
+        except Exception:
+            return False
+
+    def zip_has_suffix(self, suffix: str) -> bool:
+        try:
+            return self.zip_index.has_suffix(suffix)
+        except Exception:
+            return False
+
+    @property
+    def cfb_directory(self) -> CompoundFileDirectory:
+        if self._cfb_directory is None:
+            try:
+                with self.metrics.stage("cfb"):
+                    self._cfb_directory = CompoundFileDirectory.from_file(
+                        self.reader.open()
+                    )
+            except Exception as e:
+                self._cfb_directory = e
+        if isinstance(self._cfb_directory, Exception):
+            raise self._cfb_directory
+        return self._cfb_directory
+
+    def cfb_extension(self) -> Optional[str]:
+        try:
+            return self.cfb_directory.guess_extension()
+        except Exception:
+            return None
+
+    @property
+    def partial(self) -> bytes:
+        """
+        Head and tail of the sample used by content heuristics
+        """
+        if self._partial is None:
+            self._partial = self.reader.head(self.heuristics_window) + self.reader.tail(
+                self.heuristics_window
+            )
+        return self._partial
+
+    @property
+    def partial_str(self) -> Optional[str]:
+        """
+        Lowercased text of :py:attr:`partial` or None if it can't be decoded
+        """
+        if not self._partial_decoded:
+            self._partial_decoded = True
+            with self.metrics.stage("encoding"):
+                decoded = decode_text(self.partial, self.magic, self.encoding_detectors)
+            if decoded is None:
+                self.log.warning("Heuristics disabled - unknown encoding")
+            else:
+                text, self.encoding = decoded
+                self._partial_str = text.lower()
+        return self._partial_str
+
+    @property
+    def is_binary(self) -> bool:
+        """
+        Whether head of the sample is clearly not a text
+        """
+        if self._is_binary is None:
+            self._is_binary = is_binary(
+                self.reader.head(self.heuristics_window),
+                self.magic,
+                self.binary_threshold,
+            )
+        return self._is_binary
+
+    @property
+    def script_text(self) -> Optional[str]:
+        """
+        Text scanned by script heuristics, None for binary samples
+        """
+        if self.is_binary:
+            return None
+        return self.partial_str
+
+    @property
+    def keyword_hits(self) -> Optional[KeywordHits]:
+        """
+        Heuristics keywords found in :py:attr:`script_text`
+        """
+        if self._keyword_hits is None and self.script_text is not None:
+            with self.metrics.stage("heuristics"):
+                self._keyword_hits = KEYWORD_SCANNER.scan(self.script_text)
+        return self._keyword_hits
+
+
+class Rule:
+    """
+    Classification rule.
+
+    Rule is a candidate for the sample if its libmagic description starts with
+    one of `magic_prefixes` or contains one of `magic_substrings`, or if file
+    extension is one of `extensions` or starts with one of `extension_prefixes`.
+    Rules with `always` flag are candidates for all samples.
+
+    Candidate matches if `condition` (if any) is met. Matched rule returns
+    headers returned by `match` function or a copy of constant `headers`.
+    `match` may also return None if the rule doesn't match after all.
+
+    :param name: Rule name
+    :param headers: Constant headers of matched samples
+    :param match: Function returning headers of matched samples
+    :param condition: Additional condition that must be met by the candidate
+    """
+
+    def __init__(
+        self,
+        name: str,
+        headers: Optional[Headers] = None,
+        match: Optional[Callable[[ClassificationContext], Optional[Headers]]] = None,
+        condition: Optional[Callable[[ClassificationContext], bool]] = None,
+        magic_prefixes: Sequence[str] = (),
+        magic_substrings: Sequence[str] = (),
+        extensions: Sequence[str] = (),
+        extension_prefixes: Sequence[str] = (),
+        always: bool = False,
+    ) -> None:
+        if (headers is None) == (match is None):
+            raise ValueError(f"Rule {name} must have either headers or match")
+        self.name = name
+        self.headers = headers
+        self._match = match
+        self.condition = condition
+        self.magic_prefixes = tuple(magic_prefixes)
+        self.magic_substrings = tuple(magic_substrings)
+        self.extensions = tuple(extensions)
+        self.extension_prefixes = tuple(extension_prefixes)
+        self.always = always
+
+    def match(self, ctx: ClassificationContext) -> Optional[Headers]:
+        if self.condition is not None and not self.condition(ctx):
+            return None
+        if self._match is not None:
+            return self._match(ctx)
+        return dict(self.headers or {})
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r})"
+
+
+class _TrieNode:
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.values: Set[int] = set()
+
+
+class PrefixTrie:
+    """
+    Trie mapping string prefixes to sets of values
+    """
+
+    def __init__(self) -> None:
+        self._root = _TrieNode()
+
+    def add(self, prefix: str, value: int) -> None:
+        if not prefix:
+            raise ValueError("Prefix can't be empty")
+        node = self._root
+        for char in prefix:
+            node = node.children.setdefault(char, _TrieNode())
+        node.values.add(value)
+
+    def find(self, string: str) -> Set[int]:
+        """
+        Returns values of all prefixes of the string
+        """
+        found: Set[int] = set()
+        node = self._root
+        for char in string:
+            next_node = node.children.get(char)
+            if next_node is None:
+                break
+            node = next_node
+            found.update(node.values)
+        return found
+
+
+class RuleTrace(NamedTuple):
+    """
+    Evaluation of a single rule.
+
+    Lazily computed context properties (ZIP central directory, decoded text...)
+    are accounted to the first rule that used them.
+    """
+
+    rule: str
+    matched: bool
+    # Time spent in the rule (in seconds)
+    duration: float
+
+
+class RuleEngine:
+    """
+    Rules compiled into indexes of magic prefixes, magic substrings, extensions
+    and extension prefixes.
+
+    Candidate rules are evaluated in the original order, so the precedence
+    of the rules doesn't depend on the way they're indexed.
+
+    :param rules: Rules ordered by precedence
+    """
+
+    def __init__(self, rules: Iterable[Rule]) -> None:
+        self.rules: List[Rule] = list(rules)
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Rule names must be unique")
+        self._magic_prefixes = PrefixTrie()
+        self._magic_substrings: Dict[str, Set[int]] = {}
+        self._extensions: Dict[str, Set[int]] = {}
+        self._extension_prefixes = PrefixTrie()
+        self._always: Set[int] = set()
+        for index, rule in enumerate(self.rules):
+            for prefix in rule.magic_prefixes:
+                self._magic_prefixes.add(prefix, index)
+            for substring in rule.magic_substrings:
+                self._magic_substrings.setdefault(substring, set()).add(index)
+            for extension in rule.extensions:
+                self._extensions.setdefault(extension, set()).add(index)
+            for prefix in rule.extension_prefixes:
+                self._extension_prefixes.add(prefix, index)
+            if rule.always:
+                self._always.add(index)
+
+    def candidates(self, magic: str, extension: str) -> List[Rule]:
+        indexes = set(self._always)
+        indexes.update(self._magic_prefixes.find(magic))
+        for substring, rule_indexes in self._magic_substrings.items():
+            if substring in magic:
+                indexes.update(rule_indexes)
+        indexes.update(self._extensions.get(extension, ()))
+        indexes.update(self._extension_prefixes.find(extension))
+        return [self.rules[index] for index in sorted(indexes)]
+
+    def match(
+        self, ctx: ClassificationContext, trace: Optional[List[RuleTrace]] = None
+    ) -> Optional[Tuple[Rule, Headers]]:
+        """
+        Returns the first matching rule and headers of the sample
+
+        :param ctx: Classification context
+        :param trace: List extended with evaluated rules in order (optional)
+        """
+        for rule in self.candidates(ctx.magic, ctx.extension):
+            if trace is None:
+                headers = rule.match(ctx)
+            else:
+                start = time.perf_counter()
+                headers = rule.match(ctx)
+                trace.append(
+                    RuleTrace(
+                        rule.name, headers is not None, time.perf_counter() - start
+                    )
+                )
+            if headers is not None:
+                return rule, headers
+        return None
+
+
+def match_pe(ctx: ClassificationContext) -> Headers:
+    headers: Headers = {"kind": "runnable", "platform": "win32", "extension": "exe"}
+    if ctx.magic.startswith("PE32+"):
+        headers["platform"] = "win64"  # 64-bit only executable
+    if "(DLL)" in ctx.magic:
+        headers["extension"] = "dll"
+    return headers
+
+
+def has_dmg_trailer(ctx: ClassificationContext) -> bool:
+    if ctx.reader.size <= 512:
+        return False
+    trailer = ctx.reader.tail(512)
+    return trailer[:4] == b"koly" and trailer[8:12] == b"\x00\x00\x02\x00"
+
+
+def with_extension(headers: Headers) -> Callable[[ClassificationContext], Headers]:
+    """
+    Returns match function setting extension of the sample file name
+    """
+
+    def match(ctx: ClassificationContext) -> Headers:
+        return {**headers, "extension": ctx.extension}
+
+    return match
+
+
+OFFICE_EXTENSIONS = {
+    "doc": "Microsoft Word",
+    "xls": "Microsoft Excel",
+    "ppt": "Microsoft PowerPoint",
+}
+
+
+def match_composite_document(ctx: ClassificationContext) -> Headers:
+    # MSI installers are also CDFs
+    if "MSI Installer" in ctx.magic:
+        return {"kind": "runnable", "platform": "win32", "extension": "msi"}
+    # If not MSI, treat it like Office document
+    headers: Headers = {"kind": "document", "platform": "win32"}
+    for ext, typepart in OFFICE_EXTENSIONS.items():
+        if f"Name of Creating Application: {typepart}" in ctx.magic:
+            headers["extension"] = ext
+            return headers
+    # libmagic may omit the summary information (e.g. when it gets only
+    # the magic window), so the type is guessed from the directory streams
+    extension = ctx.cfb_extension()
+    if extension == "msi":
+        return {"kind": "runnable", "platform": "win32", "extension": "msi"}
+    if extension is not None:
+        headers["extension"] = extension
+        return headers
+    if ctx.extension[:3] in OFFICE_EXTENSIONS:
+        headers["extension"] = ctx.extension
+    else:
+        headers["extension"] = "doc"
+    return headers
+
+
+def match_openxml(ctx: ClassificationContext) -> Optional[Headers]:
+    try:
+        extn = classify_openxml(ctx.zip_index)
+        if extn:
+            return {"kind": "document", "platform": "win32", "extension": extn}
+    except Exception:
+        ctx.log.exception("Error while trying to classify OOXML")
+    return None
+
+
+ARCHIVE_MAGIC = {
+    "7z": ["7-zip archive data"],
+    "ace": ["ACE archive data"],
+    "bz2": ["bzip2 compressed data"],
+    "cab": ["Microsoft Cabinet archive data"],
+    "gz": ["gzip compressed"],
+    "iso": ["ISO 9660 CD-ROM"],
+    "lz": ["lzip compressed data"],
+    "tar": ["tar archive", "POSIX tar archive"],
+    "rar": ["RAR archive data"],
+    "udf": ["UDF filesystem data"],
+    "xz": ["XZ compressed data"],
+    "zip": ["Zip archive data"],
+    "zlib": ["zlib compressed data"],
+}
+
+ARCHIVE_EXTENSIONS = [
+    "ace",
+    "zip",
+    "rar",
+    "tar",
+    "cab",
+    "gz",
+    "7z",
+    "bz2",
+    "arj",
+    "iso",
+    "xz",
+    "lz",
+    "udf",
+    "zlib",
+]
+
+
+def archive_headers(extension: str) -> Headers:
+    headers: Headers = {"kind": "archive", "extension": extension}
+    if extension == "xz":
+        # libmagic >= 5.40 generates correct MIME type for XZ archives
+        headers["mime"] = "application/x-xz"
+    return headers
+
+
+def match_archive_extension(ctx: ClassificationContext) -> Headers:
+    return archive_headers(ctx.extension)
+
+
+EMAIL_MAGIC = {
+    "msg": ["Microsoft Outlook Message"],
+    "eml": ["multipart/mixed", "RFC 822 mail", "SMTP mail"],
+}
+
+VBS_KEYWORDS = [
+    "end function",
+    "end if",
+    "array(",
+    "sub ",
+    "on error ",
+    "createobject",
+    "execute",
+]
+JS_KEYWORDS = [
+    "function ",
+    "function(",
+    "this.",
+    "this[",
+    "new ",
+    "createobject",
+    "activexobject",
+    "var ",
+    "catch",
+]
+HTML_KEYWORDS = ["<!doctype", "<html", "<script"]
+PS_KEYWORDS = [
+    "powershell",
+    "-nop",
+    "bypass",
+    "new-object",
+    "invoke-expression",
+    "frombase64string(",
+    "| iex",
+    "|iex",
+]
+
+JSE_PATTERN = re.compile("#@~\\^[a-zA-Z0-9+/]{6}==")
+
+
+HEURISTICS_KEYWORDS = {
+    "html": HTML_KEYWORDS,
+    "vbs": VBS_KEYWORDS,
+    "ps1": PS_KEYWORDS,
+    "js": JS_KEYWORDS,
+}
+
+KEYWORD_SCANNER = KeywordScanner(HEURISTICS_KEYWORDS)
+
+
+def has_keywords(family: str, count: int) -> Callable[[ClassificationContext], bool]:
+    """
+    Returns condition met if heuristics window contains at least `count`
+    keywords of the family
+    """
+
+    def condition(ctx: ClassificationContext) -> bool:
+        keyword_hits = ctx.keyword_hits
+        return keyword_hits is not None and keyword_hits.has_at_least(family, count)
+
+    return condition
+
+
+def has_pe_header(ctx: ClassificationContext) -> bool:
+    partial = ctx.partial
+    if len(partial) <= 0x40:
+        return False
+    pe_offs = struct.unpack("<H", partial[0x3C:0x3E])[0]
+    return partial[pe_offs : pe_offs + 2] == b"PE"
+
+
+def is_text(ctx: ClassificationContext) -> bool:
+    # Kinds of text files are assigned only if heuristics window was decoded.
+    # Binary gate doesn't apply, so e.g. pcap files are still recognized.
+    return ctx.partial_str is not None
+
+
+DUMP_HEADERS: Headers = {"kind": "dump", "platform": "win32", "extension": "exe"}
+
+CLASSIFICATION_RULES = [
+    # Is PE file?
+    Rule("pe", match=match_pe, magic_prefixes=["PE32", "MS-DOS executable PE32"]),
+    # ZIP-contained files?
+    Rule(
+        "apk",
+        headers={"kind": "runnable", "platform": "android", "extension": "apk"},
+        condition=lambda ctx: ctx.extension == "apk"
+        or ctx.zip_has_file("AndroidManifest.xml"),
+        magic_prefixes=["Zip archive data", "Java archive data (JAR)"],
+    ),
+    Rule(
+        "jar",
+        # Default platform should be Windows
+        headers={"kind": "runnable", "platform": "win32", "extension": "jar"},
+        condition=lambda ctx: ctx.extension == "jar"
+        or ctx.zip_has_file("META-INF/MANIFEST.MF"),
+        magic_prefixes=["Zip archive data", "Java archive data (JAR)"],
+    ),
+    # Dalvik Android files?
+    Rule(
+        "dex",
+        headers={"kind": "runnable", "platform": "android", "extension": "dex"},
+        magic_prefixes=["Dalvik dex file"],
+        extensions=["dex"],
+    ),
+    # Shockwave Flash?
+    Rule(
+        "swf",
+        headers={"kind": "runnable", "platform": "win32", "extension": "swf"},
+        magic_prefixes=["Macromedia Flash"],
+        extensions=["swf"],
+    ),
+    # Windows LNK?
+    Rule(
+        "lnk",
+        headers={"kind": "runnable", "platform": "win32", "extension": "lnk"},
+        magic_prefixes=["MS Windows shortcut"],
+        extensions=["lnk"],
+    ),
+    # Is ELF file?
+    Rule(
+        "elf",
+        headers={"kind": "runnable", "platform": "linux"},
+        magic_prefixes=["ELF"],
+    ),
+    # Is PKG file?
+    Rule(
+        "pkg",
+        headers={"kind": "runnable", "platform": "macos", "extension": "pkg"},
+        magic_prefixes=["xar archive"],
+        extensions=["pkg"],
+    ),
+    # Is DMG file? (recognized by extension or by trailer)
+    Rule(
+        "dmg",
+        headers={"kind": "runnable", "platform": "macos", "extension": "dmg"},
+        condition=lambda ctx: ctx.extension == "dmg" or has_dmg_trailer(ctx),
+        always=True,
+    ),
+    # Is mach-o file?
+    Rule(
+        "macho",
+        headers={"kind": "runnable", "platform": "macos"},
+        magic_prefixes=["Mach-O"],
+    ),
+    # macos app within zip
+    Rule(
+        "mac_app",
+        headers={"kind": "runnable", "platform": "macos", "extension": "app"},
+        condition=lambda ctx: ctx.zip_has_suffix(".app/contents/info.plist"),
+        magic_prefixes=["Zip archive data"],
+    ),
+    # Windows scripts (per extension)
+    Rule(
+        "win_script_extension",
+        match=with_extension({"kind": "script", "platform": "win32"}),
+        extensions=[
+            "vbs",
+            "vbe",
+            "js",
+            "jse",
+            "wsh",
+            "wsf",
+            "hta",
+            "cmd",
+            "bat",
+            "ps1",
+        ],
+    ),
+    # Check RTF by libmagic
+    Rule(
+        "rtf",
+        headers={"kind": "document", "platform": "win32", "extension": "rtf"},
+        magic_prefixes=["Rich Text Format"],
+    ),
+    # Check Composite Document (msi/doc/xls/ppt) by libmagic and extension
+    Rule(
+        "composite_document",
+        match=match_composite_document,
+        magic_prefixes=["Composite Document File"],
+    ),
+    # Check docx/xlsx/pptx by libmagic
+    *[
+        Rule(
+            f"{ext}x",
+            headers={"kind": "document", "platform": "win32", "extension": ext + "x"},
+            magic_prefixes=[typepart],
+        )
+        for ext, typepart in OFFICE_EXTENSIONS.items()
+    ],
+    # Check RTF by extension
+    Rule(
+        "rtf_extension",
+        headers={"kind": "document", "platform": "win32", "extension": "rtf"},
+        extensions=["rtf"],
+    ),
+    # Finally check document type only by extension
+    Rule(
+        "office_extension",
+        match=with_extension({"kind": "document", "platform": "win32"}),
+        extension_prefixes=list(OFFICE_EXTENSIONS.keys()),
+    ),
+    # Unclassified Open XML documents
+    Rule("ooxml", match=match_openxml, magic_prefixes=["Microsoft OOXML"]),
+    # PDF files
+    Rule(
+        "pdf",
+        headers={"kind": "document", "platform": "win32", "extension": "pdf"},
+        magic_prefixes=["PDF document"],
+        extensions=["pdf"],
+    ),
+    # Archives
+    *[
+        Rule(f"archive_{ext}", headers=archive_headers(ext), magic_prefixes=assocs)
+        for ext, assocs in ARCHIVE_MAGIC.items()
+    ],
+    Rule(
+        "archive_extension",
+        match=match_archive_extension,
+        extensions=ARCHIVE_EXTENSIONS,
+    ),
+    # E-mail
+    *[
+        Rule(
+            f"email_{ext}",
+            headers={"kind": "archive", "extension": ext},
+            magic_substrings=patterns,
+        )
+        for ext, patterns in EMAIL_MAGIC.items()
+    ],
+    Rule(
+        "email_extension",
+        match=with_extension({"kind": "archive"}),
+        extensions=list(EMAIL_MAGIC.keys()),
+    ),
+    # HTML
+    Rule("html", headers={"kind": "html"}, magic_prefixes=["HTML document"]),
+    # Linux scripts
+    Rule(
+        "linux_script",
+        match=with_extension({"kind": "script", "platform": "linux"}),
+        condition=lambda ctx: ctx.extension == "sh"
+        or ("script" in ctx.magic and "executable" in ctx.magic),
+        magic_substrings=["script"],
+        extensions=["sh"],
+    ),
+    # Dumped PE file heuristics (PE not recognized by libmagic)
+    Rule(
+        "dump_strings",
+        headers=DUMP_HEADERS,
+        condition=lambda ctx: b".text" in ctx.partial
+        and b"This program cannot be run" in ctx.partial,
+        always=True,
+    ),
+    Rule("dump_pe_header", headers=DUMP_HEADERS, condition=has_pe_header, always=True),
+    Rule(
+        "dump_mz",
+        headers=DUMP_HEADERS,
+        condition=lambda ctx: ctx.partial.startswith(b"MZ"),
+        always=True,
+    ),
+    # Heuristics for scripts
+    Rule(
+        "html_heuristics",
+        headers={"kind": "html"},
+        condition=has_keywords("html", 2),
+        always=True,
+    ),
+    Rule(
+        "vbs_heuristics",
+        headers={"kind": "script", "platform": "win32", "extension": "vbs"},
+        condition=has_keywords("vbs", 2),
+        always=True,
+    ),
+    Rule(
+        "ps1_heuristics",
+        headers={"kind": "script", "platform": "win32", "extension": "ps1"},
+        condition=has_keywords("ps1", 1),
+        always=True,
+    ),
+    Rule(
+        "js_heuristics",
+        headers={"kind": "script", "platform": "win32", "extension": "js"},
+        condition=has_keywords("js", 2),
+        always=True,
+    ),
+    Rule(
+        "jse_heuristics",
+        # jse is more possible than vbe
+        headers={"kind": "script", "platform": "win32", "extension": "jse"},
+        condition=lambda ctx: ctx.script_text is not None
+        and JSE_PATTERN.match(ctx.script_text) is not None,
+        always=True,
+    ),
+    # Text files
+    Rule(
+        "ascii", headers={"kind": "ascii"}, condition=is_text, magic_prefixes=["ASCII"]
+    ),
+    Rule(
+        "iso-8859-1",
+        headers={"kind": "iso-8859-1"},
+        condition=is_text,
+        magic_prefixes=["ISO-8859"],
+    ),
+    Rule(
+        "utf-8", headers={"kind": "utf-8"}, condition=is_text, magic_prefixes=["UTF-8"]
+    ),
+    Rule("pgp", headers={"kind": "pgp"}, condition=is_text, magic_prefixes=["PGP"]),
+    Rule(
+        "pcap",
+        headers={"kind": "pcap"},
+        condition=is_text,
+        magic_prefixes=["pcap capture file"],
+    ),
+    Rule(
+        "pcapng",
+        headers={"kind": "pcapng"},
+        condition=lambda ctx: "ng capture file" in ctx.magic and is_text(ctx),
+        magic_prefixes=["pcap"],
+    ),
+]
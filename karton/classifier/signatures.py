@@ -0,0 +1,159 @@
+"""
+Pure-Python signature sniffer for the most common sample formats.
+
+Formats with a fixed signature (tar, PE, ELF, Mach-O, PDF, RTF, ISO 9660)
+are recognized from a few bytes at known offsets. Sniffer gives a synthetic
+libmagic-like description containing only the parts consulted by the
+classification rules, so the rules are still applied in order (extension
+rules, DMG trailer etc.) without calling libmagic. MIME types are the ones
+reported by the loaded libmagic version (PE files are `application/x-dosexec`
+before 5.41).
+
+Formats that libmagic describes by their content (ZIP-based formats like
+OOXML/ODF/JAR, OLE compound files) are ambiguous and are left to libmagic.
+"""
+
+import functools
+import struct
+from typing import Callable, List, Optional, Tuple
+
+import magic as pymagic  # type: ignore
+
+from .reader import SampleReader
+
+# Function returning (description, MIME type) of the sample or None
+# if the format wasn't recognized with high confidence.
+Sniffer = Callable[[SampleReader, bytes], Optional[Tuple[str, str]]]
+
+# Size of the sample head passed to the sniffers
+SNIFF_WINDOW = 64
+
+PE_MIME = "application/vnd.microsoft.portable-executable"
+LEGACY_PE_MIME = "application/x-dosexec"
+# First libmagic version reporting PE_MIME
+PE_MIME_VERSION = 541
+
+ELF_MIME = {
+    1: "application/x-object",
+    2: "application/x-executable",
+    3: "application/x-sharedlib",
+    4: "application/x-coredump",
+}
+
+MACHO_SIGNATURES = {
+    b"\xfe\xed\xfa\xce": "Mach-O",
+    b"\xce\xfa\xed\xfe": "Mach-O",
+    b"\xfe\xed\xfa\xcf": "Mach-O",
+    b"\xcf\xfa\xed\xfe": "Mach-O 64-bit",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_pe_mime() -> str:
+    """
+    Returns MIME type of PE files reported by the loaded libmagic
+    """
+    try:
+        version = pymagic.version()
+    except Exception:
+        # version() is not available in older libmagic releases
+        return LEGACY_PE_MIME
+    return PE_MIME if version >= PE_MIME_VERSION else LEGACY_PE_MIME
+
+
+def sniff_pe(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    if not head.startswith(b"MZ") or len(head) < 0x40:
+        return None
+    pe_offset = struct.unpack("<I", head[0x3C:0x40])[0]
+    # Signature, file header and optional header magic
+    pe_header = reader.read(pe_offset, 26)
+    if len(pe_header) < 26 or not pe_header.startswith(b"PE\x00\x00"):
+        return None
+    characteristics, optional_magic = struct.unpack("<HH", pe_header[22:26])
+    if optional_magic == 0x10B:
+        magic = "PE32 executable"
+    elif optional_magic == 0x20B:
+        magic = "PE32+ executable"
+    else:
+        return None
+    if characteristics & 0x2000:
+        magic += " (DLL)"
+    return magic, get_pe_mime()
+
+
+def sniff_elf(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    if not head.startswith(b"\x7fELF") or len(head) < 18:
+        return None
+    byteorder = {1: "<", 2: ">"}.get(head[5], "<")
+    elf_type = struct.unpack(byteorder + "H", head[16:18])[0]
+    return "ELF", ELF_MIME.get(elf_type, "application/octet-stream")
+
+
+def sniff_macho(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    magic = MACHO_SIGNATURES.get(head[:4])
+    if magic is None:
+        return None
+    return magic, "application/x-mach-binary"
+
+
+def sniff_pdf(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    if not head.startswith(b"%PDF-"):
+        return None
+    return "PDF document", "application/pdf"
+
+
+def sniff_rtf(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    # libmagic needs at least one byte after the signature
+    if not head.startswith(b"{\\rtf") or len(head) < 6:
+        return None
+    return "Rich Text Format data", "text/rtf"
+
+
+def sniff_tar(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    header = reader.read(0, 512)
+    if len(header) < 512 or header[257:263] not in (b"ustar\x00", b"ustar "):
+        return None
+    # Checksum of the header with the checksum field filled with spaces
+    try:
+        checksum = int(header[148:156].strip(b" \x00") or b"-1", 8)
+    except ValueError:
+        return None
+    if checksum != sum(header[:148]) + 8 * 0x20 + sum(header[156:]):
+        return None
+    return "POSIX tar archive", "application/x-tar"
+
+
+def sniff_iso(reader: SampleReader, head: bytes) -> Optional[Tuple[str, str]]:
+    if reader.read(32769, 5) != b"CD001":
+        return None
+    # UDF bridge discs and hybrid images with boot sector are described
+    # differently
+    if b"NSR0" in reader.read(32768, 2048 * 16) or reader.read(510, 2) == b"\x55\xaa":
+        return None
+    return "ISO 9660 CD-ROM filesystem data", "application/x-iso9660-image"
+
+
+# Sniffers in the order of libmagic checks (tar headers are checked before
+# the magic database, then formats identified at offset 0)
+SIGNATURE_SNIFFERS: List[Sniffer] = [
+    sniff_tar,
+    sniff_pe,
+    sniff_elf,
+    sniff_macho,
+    sniff_pdf,
+    sniff_rtf,
+    sniff_iso,
+]
+
+
+def sniff(reader: SampleReader) -> Optional[Tuple[str, str]]:
+    """
+    Returns synthetic (description, MIME type) of the sample if its format
+    was recognized by a signature
+    """
+    head = reader.head(SNIFF_WINDOW)
+    for sniffer in SIGNATURE_SNIFFERS:
+        result = sniffer(reader, head)
+        if result is not None:
+            return result
+    return None
@@ -0,0 +1,53 @@
+from bisect import bisect_left
+from io import BytesIO
+from typing import BinaryIO, Iterable, List, Sequence
+from zipfile import ZipFile, ZipInfo
+
+
+def _has_prefix(sorted_names: List[str], prefix: str) -> bool:
+    pos = bisect_left(sorted_names, prefix)
+    return pos < len(sorted_names) and sorted_names[pos].startswith(prefix)
+
+
+class ZipIndex:
+    """
+    Index of file names from the ZIP central directory.
+
+    Central directory is decoded once and then all ZIP-based checks are answered
+    using a set of names and sorted lists of names (for prefix lookups)
+    and reversed lowercased names (for case-insensitive suffix lookups).
+
+    Entries of the central directory are kept in :py:attr:`infos`, so the
+    archive listing doesn't need to decode it again.
+
+    :param names: File names stored in the archive
+    :param infos: Central directory entries (if available)
+    """
+
+    def __init__(self, names: Iterable[str], infos: Sequence[ZipInfo] = ()) -> None:
+        self.names = frozenset(names)
+        self.infos = list(infos)
+        self._sorted_names = sorted(self.names)
+        self._sorted_reversed_names = sorted(name.lower()[::-1] for name in self.names)
+
+    @classmethod
+    def from_file(cls, fileobj: BinaryIO) -> "ZipIndex":
+        with ZipFile(fileobj) as zipfile:
+            infos = zipfile.infolist()
+        return cls((info.filename for info in infos), infos)
+
+    @classmethod
+    def from_content(cls, content: bytes) -> "ZipIndex":
+        return cls.from_file(BytesIO(content))
+
+    def has_file(self, path: str) -> bool:
+        return path in self.names
+
+    def has_prefix(self, prefix: str) -> bool:
+        return _has_prefix(self._sorted_names, prefix)
+
+    def has_suffix(self, suffix: str) -> bool:
+        """
+        Checks whether any name ends with given suffix (case-insensitive)
+        """
+        return _has_prefix(self._sorted_reversed_names, suffix.lower()[::-1])
@@ -21,6 +21,9 @@ setup(
     long_description=open("README.md", "r").read(),
     long_description_content_type="text/markdown",
     install_requires=open("requirements.txt").read().splitlines(),
+    extras_require={
+        "metrics": ["prometheus-client>=0.9.0"],
+    },
     entry_points={
         'console_scripts': [
             'karton-classifier=karton.classifier:Classifier.main'
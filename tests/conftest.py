@@ -43,13 +43,14 @@ if expected_libmagic:
             f"Preloaded libmagic version is {magic_version}, but {expected_version} was expected"
         )
 
-    get_magic = pymagic.Magic(mime=False, magic_file=str(database_file))
-    get_mime = pymagic.Magic(mime=True, magic_file=str(database_file))
+    magic_file = str(database_file)
 else:
     import magic as pymagic
 
-    get_magic = pymagic.Magic(mime=False)
-    get_mime = pymagic.Magic(mime=True)
+    magic_file = None
+
+get_magic = pymagic.Magic(mime=False, magic_file=magic_file)
+get_mime = pymagic.Magic(mime=True, magic_file=magic_file)
 
 
 def magic_from_content(content, mime):
@@ -59,6 +60,7 @@ def magic_from_content(content, mime):
 from karton.core.test import ConfigMock, KartonBackendMock
 
 from karton.classifier import Classifier
+from karton.classifier.classifier import MagicBackend
 
 
 @pytest.fixture(scope="class")
@@ -71,3 +73,14 @@ def karton_classifier(request):
     )
     request.cls.magic_from_content = _magic_from_content
     request.cls.karton = classifier
+
+
+@pytest.fixture(scope="session")
+def magic_backend():
+    # MagicBackend with the same libmagic and database as magic_from_content
+    return MagicBackend(magic_file)
+
+
+@pytest.fixture(scope="class")
+def karton_magic_backend(request, magic_backend):
+    request.cls.magic_backend = magic_backend
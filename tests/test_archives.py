@@ -0,0 +1,360 @@
+import io
+import lzma
+import struct
+import zipfile
+
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.archives import (
+    MAX_RAR_BLOCKS_PER_MEMBER,
+    RAR4_SIGNATURE,
+    RAR5_SIGNATURE,
+    ArchiveMember,
+    list_archive,
+)
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.zipindex import ZipIndex
+
+from .mock_helper import mock_resource, mock_task, tests_dir
+
+
+def make_zip(names):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"" if name.endswith("/") else name.encode())
+    return output.getvalue()
+
+
+def number_7z(value):
+    if value < 0x80:
+        return bytes([value])
+    if value < 0x4000:
+        return bytes([0x80 | value >> 8, value & 0xFF])
+    return b"\xff" + struct.pack("<Q", value)
+
+
+def make_7z(files, header_coder=None):
+    """
+    Stored 7z archive with `files` (name: content or None for directories).
+    Header is LZMA2-compressed if `header_coder` is "lzma2" or encoded with
+    AES if it's "aes" (only the header structure, not real encryption).
+    """
+    data = b"".join(content for content in files.values() if content is not None)
+    sizes = [len(content) for content in files.values() if content is not None]
+    streams = number_7z(0x06) + b"\x00\x01\x09" + number_7z(len(data)) + b"\x00"
+    # Single folder with a copy coder
+    streams += b"\x07\x0b\x01\x00\x01\x01\x00\x0c" + number_7z(len(data)) + b"\x00"
+    streams += b"\x08\x0d" + number_7z(len(sizes))
+    streams += b"\x09" + b"".join(number_7z(size) for size in sizes[:-1]) + b"\x00"
+    names = "".join(f"{name}\x00" for name in files).encode("utf-16-le")
+    files_info = number_7z(len(files))
+    files_info += b"\x11" + number_7z(len(names) + 1) + b"\x00" + names
+    empty = [content is None for content in files.values()]
+    if any(empty):
+        vector = bytearray((len(files) + 7) // 8)
+        for index, is_empty in enumerate(empty):
+            vector[index // 8] |= is_empty << (7 - index % 8)
+        files_info += b"\x0e" + number_7z(len(vector)) + bytes(vector)
+    header = b"\x01\x04" + streams + b"\x00\x05" + files_info + b"\x00\x00"
+    if header_coder is not None:
+        if header_coder == "lzma2":
+            coder = b"\x21\x21\x01\x16"
+            packed = lzma.compress(
+                header,
+                format=lzma.FORMAT_RAW,
+                filters=[{"id": lzma.FILTER_LZMA2, "dict_size": 1 << 22}],
+            )
+        else:
+            coder = b"\x24\x06\xf1\x07\x01\x00"
+            packed = bytes(len(header))
+        encoded = b"\x17\x06" + number_7z(len(data)) + b"\x01\x09"
+        encoded += number_7z(len(packed)) + b"\x00\x07\x0b\x01\x00\x01" + coder
+        encoded += b"\x0c" + number_7z(len(header)) + b"\x00\x00"
+        data, header = data + packed, encoded
+    start_header = b"7z\xbc\xaf\x27\x1c\x00\x04" + bytes(4)
+    start_header += struct.pack("<QQI", len(data), len(header), 0)
+    return start_header + data + header
+
+
+def make_7z_header(header):
+    start_header = b"7z\xbc\xaf\x27\x1c\x00\x04" + bytes(4)
+    return start_header + struct.pack("<QQI", 0, len(header), 0) + header
+
+
+def vint_rar5(value):
+    result = bytearray()
+    while True:
+        result.append(value & 0x7F | (0x80 if value > 0x7F else 0))
+        value >>= 7
+        if not value:
+            return bytes(result)
+
+
+def block_rar5(block_type, fields=b"", extra=b"", data=b""):
+    flags = (0x01 if extra else 0) | (0x02 if data else 0)
+    header = vint_rar5(block_type) + vint_rar5(flags)
+    if extra:
+        header += vint_rar5(len(extra))
+    if data:
+        header += vint_rar5(len(data))
+    header += fields + extra
+    return bytes(4) + vint_rar5(len(header)) + header + data
+
+
+def file_rar5(name, size, is_dir=False, encrypted=False):
+    fields = vint_rar5(0x01 if is_dir else 0) + vint_rar5(size)
+    fields += b"\x00\x00\x00" + vint_rar5(len(name)) + name.encode()
+    # File encryption record
+    extra = b"\x02\x01\x00" if encrypted else b""
+    return block_rar5(2, fields, extra)
+
+
+def make_rar5(*blocks):
+    return RAR5_SIGNATURE + block_rar5(1, b"\x00") + b"".join(blocks)
+
+
+def block_rar4(block_type, flags=0, fields=b""):
+    return struct.pack("<HBHH", 0, block_type, flags, 7 + len(fields)) + fields
+
+
+def make_rar4(*blocks, main_flags=0):
+    main = block_rar4(0x73, main_flags, bytes(6))
+    return RAR4_SIGNATURE + main + b"".join(blocks)
+
+
+@pytest.mark.parametrize(
+    "filename,archive_format,member",
+    [
+        (
+            "archive.zip",
+            "zip",
+            ArchiveMember("ServiceContractAgreement_276995793_05012020.vbs", 37898018),
+        ),
+        ("archive.7z", "7z", ArchiveMember("Final Payment Proof.exe", 196608)),
+        (
+            "archive.rar",
+            "rar",
+            ArchiveMember("Amended sales contract for may.pdf.scr", 94208),
+        ),
+    ],
+)
+def test_list_testdata(filename, archive_format, member):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    listing = list_archive(BytesSampleReader(content))
+    assert listing.format == archive_format
+    assert listing.members == [member]
+    assert listing.total == 1
+    assert not listing.encrypted
+
+
+@pytest.mark.parametrize("filename", ["archive.gz", "archive.tar", "document.pdf"])
+def test_list_other_formats(filename):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    assert list_archive(BytesSampleReader(content)) is None
+
+
+def test_list_zip_limit():
+    content = make_zip(["dir/", "dir/a.exe", "b.txt", "c.js"])
+    listing = list_archive(BytesSampleReader(content), limit=2)
+    assert listing.members == [
+        ArchiveMember("dir/", 0, is_dir=True),
+        ArchiveMember("dir/a.exe", 9),
+    ]
+    assert listing.total == 4
+
+
+def test_list_truncated_rar():
+    content = (tests_dir / "testdata" / "archive.rar").read_bytes()
+    # End of archive block is missing, so the total count is not known
+    listing = list_archive(BytesSampleReader(content[:100]))
+    assert listing.format == "rar"
+    assert listing.total is None
+
+
+def test_list_zip_index():
+    content = make_zip(["a.exe", "b.txt"])
+    # Central directory decoded for the rules is reused
+    zip_index = ZipIndex.from_content(make_zip(["c.js"]))
+    listing = list_archive(BytesSampleReader(content), get_zip_index=lambda: zip_index)
+    assert listing.members == [ArchiveMember("c.js", 4)]
+    assert listing.total == 1
+
+
+def test_list_zip_encrypted():
+    content = bytearray(make_zip(["secret.exe", "readme.txt"]))
+    # Encryption flag of the first central directory entry
+    content[content.index(b"PK\x01\x02") + 8] |= 0x1
+    listing = list_archive(BytesSampleReader(bytes(content)))
+    assert listing.members == [
+        ArchiveMember("secret.exe", 10, encrypted=True),
+        ArchiveMember("readme.txt", 10),
+    ]
+
+
+@pytest.mark.parametrize("header_coder", [None, "lzma2"])
+def test_list_7z(header_coder):
+    files = {"dir/a.exe": b"MZ", "dir/b.txt": b"text", "empty": b"", "dir": None}
+    listing = list_archive(BytesSampleReader(make_7z(files, header_coder)))
+    assert listing.format == "7z"
+    assert listing.members == [
+        ArchiveMember("dir/a.exe", 2),
+        ArchiveMember("dir/b.txt", 4),
+        ArchiveMember("empty", 0),
+        ArchiveMember("dir", 0, is_dir=True),
+    ]
+    assert listing.total == 4
+    assert not listing.encrypted
+
+
+def test_list_7z_limit():
+    files = {f"{index}.exe": b"MZ" for index in range(5)}
+    listing = list_archive(BytesSampleReader(make_7z(files, "lzma2")), limit=2)
+    assert listing.members == [ArchiveMember("0.exe", 2), ArchiveMember("1.exe", 2)]
+    assert listing.total == 5
+
+
+def test_list_7z_encrypted():
+    content = make_7z({"a.exe": b"MZ"}, "aes")
+    listing = list_archive(BytesSampleReader(content))
+    assert listing.format == "7z"
+    assert listing.members == []
+    assert listing.total is None
+    assert listing.encrypted
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        # FILES_INFO with 300M files
+        b"\x01\x05" + number_7z(300_000_000) + b"\x00\x00",
+        # PACK_INFO with 300M pack streams
+        b"\x01\x04\x06\x00" + number_7z(300_000_000) + b"\x00\x00\x00",
+        # UNPACK_INFO with 300M folders
+        b"\x01\x04\x07\x0b" + number_7z(300_000_000) + b"\x00\x00\x00",
+    ],
+)
+def test_list_7z_oversized_count(header):
+    # Counts are checked before allocating anything for the items
+    with pytest.raises(ValueError):
+        list_archive(BytesSampleReader(make_7z_header(header)))
+
+
+def test_list_rar5():
+    content = make_rar5(
+        file_rar5("dir", 0, is_dir=True),
+        file_rar5("dir/a.exe", 1024),
+        file_rar5("dir/b.exe", 2048, encrypted=True),
+        # Service block (e.g. comment) with data
+        block_rar5(3, data=b"comment"),
+        block_rar5(5, b"\x00"),
+    )
+    listing = list_archive(BytesSampleReader(content))
+    assert listing.format == "rar"
+    assert listing.members == [
+        ArchiveMember("dir", 0, is_dir=True),
+        ArchiveMember("dir/a.exe", 1024),
+        ArchiveMember("dir/b.exe", 2048, encrypted=True),
+    ]
+    assert listing.total == 3
+
+
+def test_list_rar5_encrypted_headers():
+    # Archive encryption header precedes the main archive header
+    content = RAR5_SIGNATURE + block_rar5(4, bytes(3)) + bytes(32)
+    listing = list_archive(BytesSampleReader(content))
+    assert listing.members == []
+    assert listing.total is None
+    assert listing.encrypted
+
+
+def test_list_rar4_encrypted_headers():
+    content = make_rar4(bytes(64), main_flags=0x80)
+    listing = list_archive(BytesSampleReader(content))
+    assert listing.format == "rar"
+    assert listing.total is None
+    assert listing.encrypted
+
+
+@pytest.mark.parametrize(
+    "make_rar,service_block,end_block",
+    [
+        (make_rar4, block_rar4(0x75), block_rar4(0x7B)),
+        (make_rar5, block_rar5(3), block_rar5(5, b"\x00")),
+    ],
+)
+def test_list_rar_walk_limit(make_rar, service_block, end_block):
+    # Service blocks are walked, but there are only a few per member
+    blocks = [service_block] * MAX_RAR_BLOCKS_PER_MEMBER
+    listing = list_archive(BytesSampleReader(make_rar(*blocks, end_block)), limit=1)
+    assert listing.total == 0
+    # Long run of tiny blocks can't keep the walk going
+    blocks = [service_block] * 100000
+    listing = list_archive(BytesSampleReader(make_rar(*blocks, end_block)), limit=1)
+    assert listing.members == []
+    assert listing.total is None
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierArchiveListing(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"archive_listing": "true"}})
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def test_archive_payload(self):
+        res = self.run_task(mock_task(mock_resource("archive.rar")))
+        self.assertEqual(res[0].headers["kind"], "archive")
+        self.assertEqual(
+            res[0].get_payload("archive"),
+            {
+                "format": "rar",
+                "count": 1,
+                "encrypted": False,
+                "members": [
+                    {
+                        "name": "Amended sales contract for may.pdf.scr",
+                        "size": 94208,
+                        "is_dir": False,
+                        "encrypted": False,
+                        "type": "runnable:win32:scr",
+                    }
+                ],
+            },
+        )
+
+    def test_member_types(self):
+        content = make_zip(["docs/", "docs/invoice.docx", "run.vbs", "a.dat"])
+        res = self.run_task(mock_task(Resource("file.zip", content)))
+        members = res[0].get_payload("archive")["members"]
+        self.assertEqual(
+            [member["type"] for member in members],
+            [None, "document:win32:docx", "script:win32:vbs", None],
+        )
+
+    def test_invalid_listing(self):
+        header = b"\x01\x05" + number_7z(300_000_000) + b"\x00\x00"
+        res = self.run_task(mock_task(Resource("file.7z", make_7z_header(header))))
+        self.assertEqual(res[0].headers["kind"], "archive")
+        self.assertFalse(res[0].has_payload("archive"))
+
+    def test_not_archive(self):
+        res = self.run_task(mock_task(mock_resource("runnable.jar")))
+        self.assertEqual(res[0].headers["kind"], "runnable")
+        self.assertFalse(res[0].has_payload("archive"))
+
+    def test_listing_disabled(self):
+        self.karton = Classifier(
+            magic=self.magic_from_content,
+            config=ConfigMock(),
+            backend=self.backend,
+        )
+        res = self.run_task(mock_task(mock_resource("archive.7z")))
+        self.assertEqual(res[0].headers["kind"], "archive")
+        self.assertFalse(res[0].has_payload("archive"))
@@ -0,0 +1,85 @@
+import argparse
+import io
+import json
+import tarfile
+from unittest import mock
+
+from karton.classifier.batch import run_batch
+
+from .mock_helper import tests_dir
+
+testdata_dir = tests_dir / "testdata"
+
+
+def make_args(**kwargs):
+    args = argparse.Namespace(
+        paths=[],
+        tar=[],
+        paths_from=None,
+        workers=2,
+        chunksize=4,
+        config_file=None,
+        trace=False,
+    )
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+def run(args):
+    output = io.StringIO()
+    count = run_batch(args, output=output)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(results) == count
+    return {result["path"]: result for result in results}
+
+
+def test_batch_directory():
+    results = run(make_args(paths=[str(testdata_dir)]))
+    assert len(results) == len(list(testdata_dir.iterdir()))
+
+    exe = results[str(testdata_dir / "runnable.exe")]
+    assert exe["tag"] == "runnable:win32:exe"
+    assert exe["headers"]["stage"] == "recognized"
+    assert exe["magic"].startswith("PE32 executable")
+    assert len(exe["sha256"]) == 64
+
+
+def test_batch_paths_from(tmp_path):
+    paths_file = tmp_path / "paths.txt"
+    paths_file.write_text(
+        "\n".join(str(testdata_dir / name) for name in ["script.js", "missing"])
+    )
+    results = run(make_args(paths_from=str(paths_file)))
+    assert results[str(testdata_dir / "script.js")]["tag"] == "script:win32:js"
+    assert "error" in results[str(testdata_dir / "missing")]
+
+
+def test_batch_tar(tmp_path):
+    tar_path = str(tmp_path / "samples.tar.gz")
+    with tarfile.open(tar_path, "w:gz") as archive:
+        archive.add(str(testdata_dir / "document.pdf"), arcname="a/document.pdf")
+        archive.add(str(testdata_dir / "misc.html"), arcname="misc.html")
+    results = run(make_args(tar=[tar_path]))
+    assert results[f"{tar_path}:a/document.pdf"]["tag"] == "document:win32:pdf"
+    assert results[f"{tar_path}:misc.html"]["tag"] == "misc:html"
+
+
+def test_batch_trace():
+    paths = [str(testdata_dir / name) for name in ["runnable.exe", "script.js"]]
+    results = run(make_args(paths=paths))
+    assert "trace" not in results[paths[0]]
+    results = run(make_args(paths=paths, trace=True))
+    trace = results[paths[0]]["trace"]
+    assert trace == [{"rule": "pe", "matched": True, "duration_ms": mock.ANY}]
+    trace = results[paths[1]]["trace"]
+    assert trace[-1]["rule"] == "win_script_extension"
+    assert [entry["matched"] for entry in trace] == [False] * (len(trace) - 1) + [True]
+
+
+def test_batch_redis_cache(tmp_path):
+    config_file = tmp_path / "karton.ini"
+    config_file.write_text("[classifier]\ncache_backend = redis\ncache_size = 16\n")
+    path = str(testdata_dir / "runnable.exe")
+    results = run(make_args(paths=[path], config_file=str(config_file)))
+    assert results[path]["tag"] == "runnable:win32:exe"
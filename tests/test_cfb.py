@@ -0,0 +1,113 @@
+import struct
+
+import pytest
+
+from karton.classifier.cfb import CompoundFileDirectory
+
+from .mock_helper import tests_dir
+
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+
+
+def directory_entry(name, object_type, left=NOSTREAM, right=NOSTREAM, child=NOSTREAM):
+    encoded = (name + "\x00").encode("utf-16-le") if name else b""
+    return (
+        encoded.ljust(64, b"\x00")
+        + struct.pack("<HBB", len(encoded), object_type, 1)
+        + struct.pack("<III", left, right, child)
+        + bytes(16)
+        + bytes(128 - 96)
+    )
+
+
+def make_cfb(names, nested=()):
+    """
+    Compound file with root storage containing `names` and a storage
+    containing `nested` names
+    """
+    entries = [directory_entry("Root Entry", 5, child=1 if names else NOSTREAM)]
+    # Root children are chained using right siblings
+    for index, name in enumerate(names, start=1):
+        right = index + 1 if index < len(names) else NOSTREAM
+        if name == "Storage" and nested:
+            child = len(names) + 1
+            entries.append(directory_entry(name, 1, right=right, child=child))
+        else:
+            entries.append(directory_entry(name, 2, right=right))
+    for index, name in enumerate(nested, start=len(names) + 1):
+        right = index + 1 if index < len(names) + len(nested) else NOSTREAM
+        entries.append(directory_entry(name, 2, right=right))
+    directory = b"".join(entries)
+    directory += bytes(-len(directory) % 512)
+    directory_sectors = len(directory) // 512
+    # Sector 0 is FAT, next ones are the directory
+    fat = [FATSECT] + [sector + 1 for sector in range(1, directory_sectors)]
+    fat += [ENDOFCHAIN]
+    fat_sector = struct.pack(f"<{len(fat)}I", *fat).ljust(512, b"\xff")
+    header = (
+        b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+        + bytes(16)
+        + struct.pack("<HHHHH", 0x3E, 3, 0xFFFE, 9, 6)
+        + bytes(10)
+        + struct.pack("<IIIIIIII", 1, 1, 0, 0x1000, ENDOFCHAIN, 0, ENDOFCHAIN, 0)
+        + struct.pack("<109I", 0, *([NOSTREAM] * 108))
+    )
+    return header + fat_sector + directory
+
+
+@pytest.mark.parametrize(
+    "filename,expected",
+    [("document.doc", "doc"), ("document.xls", "xls"), ("runnable.msi", "msi")],
+)
+def test_testdata(filename, expected):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    assert CompoundFileDirectory.from_content(content).guess_extension() == expected
+
+
+@pytest.mark.parametrize(
+    "names,expected",
+    [
+        (["WordDocument", "1Table"], "doc"),
+        (["\x05SummaryInformation", "Workbook"], "xls"),
+        (["Book"], "xls"),
+        (["Current User", "PowerPoint Document", "Pictures"], "ppt"),
+        (["Contents"], None),
+        ([], None),
+    ],
+)
+def test_streams(names, expected):
+    directory = CompoundFileDirectory.from_content(make_cfb(names))
+    assert directory.names == set(names)
+    assert directory.guess_extension() == expected
+
+
+def test_nested_streams_are_ignored():
+    # e.g. Excel sheet embedded in other document
+    directory = CompoundFileDirectory.from_content(
+        make_cfb(["Contents", "Storage"], nested=["Workbook"])
+    )
+    assert directory.has_entry("Storage")
+    assert not directory.has_entry("Workbook")
+    assert directory.guess_extension() is None
+
+
+def test_multiple_directory_sectors():
+    names = [f"Stream{index}" for index in range(20)] + ["PowerPoint Document"]
+    directory = CompoundFileDirectory.from_content(make_cfb(names))
+    assert len(directory.names) == 21
+    assert directory.guess_extension() == "ppt"
+
+
+def test_invalid():
+    content = make_cfb(["WordDocument"])
+    with pytest.raises(ValueError):
+        CompoundFileDirectory.from_content(b"PK\x03\x04" + content[4:])
+    # Truncated directory
+    with pytest.raises(ValueError):
+        CompoundFileDirectory.from_content(content[:1024])
+    # Cyclic directory chain
+    cyclic = content[:512] + struct.pack("<II", FATSECT, 1) + content[520:]
+    with pytest.raises(ValueError):
+        CompoundFileDirectory.from_content(cyclic)
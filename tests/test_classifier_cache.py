@@ -0,0 +1,234 @@
+import pytest
+from karton.core import Resource, Task
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.cache import (
+    PURGE_INTERVAL,
+    REDIS_DEFAULT_TTL,
+    LRUClassificationCache,
+    RedisClassificationCache,
+    SQLiteClassificationCache,
+    get_fingerprint,
+)
+
+from .mock_helper import mock_resource, mock_task
+
+
+class ClockMock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = LRUClassificationCache(maxsize=2)
+    cache.set("a", {"kind": "a"})
+    cache.set("b", None)
+    assert cache.get("a") == (True, {"kind": "a"})
+    cache.set("c", {"kind": "c"})
+    # "b" is the least recently used one
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, {"kind": "a"})
+    assert cache.get("c") == (True, {"kind": "c"})
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_unrecognized():
+    cache = LRUClassificationCache(maxsize=2)
+    cache.set("a", None)
+    assert cache.get("a") == (True, None)
+
+
+def test_lru_ttl():
+    clock = ClockMock()
+    cache = LRUClassificationCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", {"kind": "a"})
+    clock.now = 5
+    assert cache.get("a") == (True, {"kind": "a"})
+    clock.now = 11
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+def test_sqlite_shared(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SQLiteClassificationCache(path, fingerprint="1.0:540")
+    second = SQLiteClassificationCache(path, fingerprint="1.0:540")
+    first.set("a", {"kind": "a"})
+    first.set("b", None)
+    assert second.get("a") == (True, {"kind": "a"})
+    assert second.get("b") == (True, None)
+    assert second.get("c") == (False, None)
+    assert (second.hits, second.misses) == (2, 1)
+
+
+def test_sqlite_fingerprint(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteClassificationCache(path, fingerprint="1.0:540").set("a", {"kind": "a"})
+    upgraded = SQLiteClassificationCache(path, fingerprint="1.1:540")
+    assert upgraded.get("a") == (False, None)
+    # Stale entries are removed when cache is opened with new fingerprint
+    old = SQLiteClassificationCache(path, fingerprint="1.0:540")
+    assert old.get("a") == (False, None)
+
+
+def test_sqlite_purge(tmp_path):
+    clock = ClockMock()
+    cache = SQLiteClassificationCache(
+        str(tmp_path / "cache.db"), ttl=10, fingerprint="1.0:540", clock=clock
+    )
+    cache.set("a", {"kind": "a"})
+    clock.now = PURGE_INTERVAL - 5
+    cache.set("b", {"kind": "b"})
+    count = "SELECT COUNT(*) FROM classification"
+    # Expired entries are kept until the purge interval passes
+    assert cache.db.execute(count).fetchone() == (2,)
+    clock.now = PURGE_INTERVAL
+    cache.set("c", {"kind": "c"})
+    assert cache.db.execute(count).fetchone() == (2,)
+    assert cache.get("b") == (True, {"kind": "b"})
+
+
+def test_sqlite_ttl(tmp_path):
+    clock = ClockMock()
+    cache = SQLiteClassificationCache(
+        str(tmp_path / "cache.db"), ttl=10, fingerprint="1.0:540", clock=clock
+    )
+    cache.set("a", {"kind": "a"})
+    clock.now = 5
+    assert cache.get("a") == (True, {"kind": "a"})
+    clock.now = 11
+    assert cache.get("a") == (False, None)
+
+
+class RedisMock:
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def setex(self, name, ttl, value):
+        self.values[name] = value
+        self.expires[name] = ttl
+
+
+def test_redis_shared():
+    redis = RedisMock()
+    first = RedisClassificationCache(redis, fingerprint="1.0:540")
+    second = RedisClassificationCache(redis, fingerprint="1.0:540")
+    upgraded = RedisClassificationCache(redis, fingerprint="1.1:540")
+    first.set("a", {"kind": "a"})
+    first.set("b", None)
+    assert second.get("a") == (True, {"kind": "a"})
+    assert second.get("b") == (True, None)
+    assert upgraded.get("a") == (False, None)
+    assert sorted(redis.values) == [
+        "karton.classifier.cache:1.0:540:a",
+        "karton.classifier.cache:1.0:540:b",
+    ]
+    # Entries expire even if no TTL is configured
+    assert redis.expires == {
+        "karton.classifier.cache:1.0:540:a": REDIS_DEFAULT_TTL,
+        "karton.classifier.cache:1.0:540:b": REDIS_DEFAULT_TTL,
+    }
+
+
+def test_redis_ttl():
+    redis = RedisMock()
+    cache = RedisClassificationCache(redis, ttl=10, fingerprint="1.0:540")
+    cache.set("a", {"kind": "a"})
+    cache.set("b", {"kind": "b"})
+    # Every entry expires on its own
+    assert redis.expires == {
+        "karton.classifier.cache:1.0:540:a": 10,
+        "karton.classifier.cache:1.0:540:b": 10,
+    }
+
+
+@pytest.mark.parametrize("ttl", [None, 0, -1])
+def test_redis_ttl_required(ttl):
+    with pytest.raises(ValueError):
+        RedisClassificationCache(RedisMock(), ttl=ttl, fingerprint="1.0:540")
+
+
+def test_fingerprint_options():
+    assert get_fingerprint() == get_fingerprint({})
+    assert get_fingerprint({"a": 1, "b": 2}) == get_fingerprint({"b": 2, "a": 1})
+    assert get_fingerprint({"a": 1}) != get_fingerprint({"a": 2})
+    assert get_fingerprint({"a": 1}).startswith(get_fingerprint() + ":")
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierCache(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"cache_size": "16"}})
+        self.backend = KartonBackendMock()
+        self.magic_calls = 0
+
+        def magic(content, mime):
+            self.magic_calls += 1
+            return self.magic_from_content(content, mime)
+
+        self.karton = Classifier(magic=magic, config=self.config, backend=self.backend)
+
+    def test_process_cached(self):
+        resource = mock_resource("runnable.exe")
+        magic = self.magic_from_content(resource.content, mime=False)
+        mime = self.magic_from_content(resource.content, mime=True)
+        expected = Task(
+            headers={
+                "type": "sample",
+                "stage": "recognized",
+                "origin": "karton.classifier",
+                "quality": "high",
+                "kind": "runnable",
+                "mime": mime,
+                "extension": "exe",
+                "platform": "win32",
+            },
+            payload={
+                "sample": resource,
+                "tags": ["runnable:win32:exe"],
+                "magic": magic,
+            },
+        )
+        self.assertTasksEqual(self.run_task(mock_task(resource)), [expected])
+        self.assertTasksEqual(self.run_task(mock_task(resource)), [expected])
+        self.assertEqual(self.magic_calls, 2)
+        self.assertEqual((self.karton.cache.hits, self.karton.cache.misses), (1, 1))
+
+    def test_process_cached_extension(self):
+        # Same content with different extension is classified separately
+        script = Resource("file.vbs", b"ffafafffa", sha256="sha256")
+        text = Resource("file.txt", b"ffafafffa", sha256="sha256")
+        script_res = self.run_task(mock_task(script))
+        text_res = self.run_task(mock_task(text))
+        self.assertEqual(script_res[0].headers["kind"], "script")
+        self.assertEqual(text_res[0].headers["kind"], "ascii")
+        self.assertEqual((self.karton.cache.hits, self.karton.cache.misses), (0, 2))
+
+    def test_cache_fingerprint_options(self):
+        config = ConfigMock()
+        config.config.read_dict({"classifier": {"signature_sniffer": "true"}})
+        karton = Classifier(
+            magic=self.magic_from_content, config=config, backend=self.backend
+        )
+        self.assertNotEqual(
+            get_fingerprint(karton._get_cache_options()),
+            get_fingerprint(self.karton._get_cache_options()),
+        )
+
+    def test_redis_default_ttl(self):
+        config = ConfigMock()
+        config.config.read_dict({"classifier": {"cache_backend": "redis"}})
+        self.backend.redis = RedisMock()
+        karton = Classifier(
+            magic=self.magic_from_content, config=config, backend=self.backend
+        )
+        self.assertEqual(karton.cache.ttl, REDIS_DEFAULT_TTL)
@@ -1,5 +1,5 @@
 import pytest
-from karton.core import Task
+from karton.core import Resource, Task
 from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
 
 from .mock_helper import mock_resource, mock_task
@@ -35,6 +35,12 @@ class TestClassifier(KartonTestCase):
         )
         self.assertTasksEqual(res, [expected])
 
+    def test_process_document_doc_misnamed(self):
+        # libmagic doesn't say it's Word, WordDocument stream does
+        content = mock_resource("document.doc").content
+        res = self.run_task(mock_task(Resource("document.xlsm", content)))
+        self.assertEqual(res[0].headers["extension"], "doc")
+
     def test_process_document_docx(self):
         resource = mock_resource("document.docx")
         magic = self.magic_from_content(resource.content, mime=False)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from karton.core import Resource, Task
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+
+from .mock_helper import mock_resource, mock_task
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierMagicWindow(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"magic_window": "4096"}})
+        self.backend = KartonBackendMock()
+        self.magic_calls = []
+
+        def magic(content, mime):
+            self.magic_calls.append(len(content))
+            return self.magic_from_content(content, mime)
+
+        self.karton = Classifier(magic=magic, config=self.config, backend=self.backend)
+
+    def test_process_window_head(self):
+        content = mock_resource("runnable.exe").content + os.urandom(1024 * 1024)
+        resource = Resource("file", content, sha256="sha256")
+        magic = self.magic_from_content(content[:4096], mime=False)
+        mime = self.magic_from_content(content[:4096], mime=True)
+        res = self.run_task(mock_task(resource))
+
+        expected = Task(
+            headers={
+                "type": "sample",
+                "stage": "recognized",
+                "origin": "karton.classifier",
+                "quality": "high",
+                "kind": "runnable",
+                "mime": mime,
+                "extension": "exe",
+                "platform": "win32",
+            },
+            payload={
+                "sample": resource,
+                "tags": ["runnable:win32:exe"],
+                "magic": magic,
+            },
+        )
+        self.assertTasksEqual(res, [expected])
+        self.assertEqual(self.magic_calls, [4096, 4096])
+
+    def test_process_window_fallback(self):
+        resource = Resource("file", b"\x00" * 1024 * 1024, sha256="sha256")
+        res = self.run_task(mock_task(resource))
+
+        expected = Task(
+            headers={
+                "type": "sample",
+                "stage": "unrecognized",
+                "origin": "karton.classifier",
+                "kind": "unknown",
+                "quality": "high",
+            },
+            payload={
+                "sample": resource,
+            },
+        )
+        self.assertTasksEqual(res, [expected])
+        self.assertEqual(self.magic_calls, [4096] * 4 + [1024 * 1024] * 2)
+
+    def test_process_window_small_sample(self):
+        resource = Resource("file", b"A" * 8192, sha256="sha256")
+        self.run_task(mock_task(resource))
+        self.assertEqual(self.magic_calls, [8192, 8192])
+
+    def test_process_window_composite_document(self):
+        # libmagic can't read summary information from the window,
+        # document type is read from the compound file directory
+        for filename, extension in [("document.xls", "xls"), ("runnable.msi", "msi")]:
+            resource = Resource("file", mock_resource(filename).content)
+            res = self.run_task(mock_task(resource))
+            self.assertEqual(res[0].headers["extension"], extension)
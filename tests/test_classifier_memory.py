@@ -0,0 +1,145 @@
+import gzip
+import tempfile
+from io import BytesIO
+from zipfile import ZIP_STORED, ZipFile, ZipInfo
+
+import pytest
+from karton.core import Resource, Task
+from karton.core.resource import RemoteResource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.profiling import AllocationTracer
+
+from .mock_helper import mock_resource, mock_task, tests_dir
+from .test_classifier_range_reads import MinioMock, ResponseMock
+
+# Size of synthetic samples
+SAMPLE_SIZE = 64 * 1024 * 1024
+
+# Peak size of memory allocated while processing a sample, relative to its size.
+# Samples are already loaded or spooled to a file, so anything close to 1.0
+# means that the whole sample has been copied (or downloaded into memory).
+MAX_PEAK_RATIO = 0.25
+
+
+class DownloadResponseMock(ResponseMock):
+    def read(self):
+        # Downloaded content is a new object like in a real download
+        return bytes(memoryview(super().read()))
+
+
+class DownloadMinioMock(MinioMock):
+    def get_object(self, bucket, object_uid, offset=0, length=0):
+        response = super().get_object(bucket, object_uid, offset, length)
+        return DownloadResponseMock(response._data)
+
+
+def padded(filename):
+    content = mock_resource(filename).content
+    return content + bytes(SAMPLE_SIZE - len(content))
+
+
+def zipped(filename=None, member="payload.bin"):
+    content = BytesIO()
+    with ZipFile(content, "w", compression=ZIP_STORED) as output:
+        if filename is not None:
+            with ZipFile(tests_dir / "testdata" / filename) as source:
+                for info in source.infolist():
+                    output.writestr(info, source.read(info))
+        output.writestr(ZipInfo(member), bytes(SAMPLE_SIZE))
+    return content.getvalue()
+
+
+def script():
+    content = mock_resource("script.js").content
+    return (content * (SAMPLE_SIZE // len(content) + 1))[:SAMPLE_SIZE]
+
+
+def compressed():
+    # Compressed tarball followed by garbage
+    content = gzip.compress(mock_resource("archive.tar").content)
+    return content + bytes(SAMPLE_SIZE - len(content))
+
+
+SAMPLES = {
+    "pe": ("sample.exe", lambda: padded("runnable.exe"), "runnable"),
+    "zip": ("sample.zip", zipped, "archive"),
+    "jar": ("sample.jar", lambda: zipped("runnable.jar", "resource.bin"), "runnable"),
+    "docx": (
+        "sample.docx",
+        lambda: zipped("document.docx", "word/media/image1.bin"),
+        "document",
+    ),
+    "doc": ("sample.doc", lambda: padded("document.doc"), "document"),
+    "pdf": ("sample.pdf", lambda: padded("document.pdf"), "document"),
+    "script": ("sample", script, "script"),
+    "gz": ("sample.tar.gz", compressed, "archive"),
+    "unrecognized": ("sample", lambda: bytes(SAMPLE_SIZE), "unknown"),
+}
+
+
+@pytest.mark.usefixtures("karton_magic_backend")
+class TestClassifierMemory(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict(
+            {
+                "classifier": {
+                    "executable_info": "true",
+                    "archive_listing": "true",
+                    "decompress_peek": "true",
+                }
+            }
+        )
+        # MagicBackend reads memory-mapped samples without copying them
+        self.karton = Classifier(
+            magic=self.magic_backend, config=self.config, backend=KartonBackendMock()
+        )
+
+    def assertPeakAllocation(self, task, kind):
+        size = task.get_resource("sample").size
+        with AllocationTracer() as tracer:
+            res = self.run_task(task)
+        self.assertEqual(res[0].headers.get("kind"), kind)
+        self.assertLess(tracer.peak, size * MAX_PEAK_RATIO)
+
+    def test_peak_allocation(self):
+        for sample, (name, content, kind) in SAMPLES.items():
+            with self.subTest(sample):
+                self.assertPeakAllocation(
+                    mock_task(Resource(name, content(), sha256="sha256")), kind
+                )
+
+    def test_peak_allocation_sha256(self):
+        # sha256 of the sample is computed when not provided by the producer
+        task = mock_task(Resource("sample.exe", padded("runnable.exe")))
+        del task.get_resource("sample").metadata["sha256"]
+        self.assertPeakAllocation(task, "runnable")
+
+    def test_peak_allocation_mmap(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.config.config.read_dict(
+                {"classifier": {"mmap_threshold": "1024", "mmap_dir": tmp_dir}}
+            )
+            backend = KartonBackendMock()
+            backend.minio = DownloadMinioMock(backend.buckets)
+            self.karton = Classifier(
+                magic=self.magic_backend, config=self.config, backend=backend
+            )
+            for sample, (name, content, kind) in SAMPLES.items():
+                with self.subTest(sample):
+                    data = content()
+                    backend.buckets[backend.default_bucket_name] = {sample: data}
+                    task = Task({"type": "sample", "kind": "raw"})
+                    task.add_payload(
+                        "sample",
+                        RemoteResource(
+                            name,
+                            bucket=backend.default_bucket_name,
+                            uid=sample,
+                            size=len(data),
+                            backend=backend,
+                        ),
+                    )
+                    self.assertPeakAllocation(task, kind)
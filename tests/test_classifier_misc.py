@@ -1,7 +1,9 @@
 import pytest
-from karton.core import Task
+from karton.core import Resource, Task
 from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
 
+from karton.classifier import Classifier
+
 from .mock_helper import mock_resource, mock_task
 
 
@@ -54,3 +56,48 @@ class TestClassifier(KartonTestCase):
             },
         )
         self.assertTasksEqual(res, [expected])
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierTrace(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict(
+            {"classifier": {"trace_rules": "true", "cache_size": "10"}}
+        )
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def test_trace_payload(self):
+        res = self.run_task(mock_task(mock_resource("document.pdf")))
+        trace = res[0].get_payload("trace")
+        self.assertEqual(trace["rule"], "pdf")
+        self.assertEqual(trace["rules"][-1]["rule"], "pdf")
+        self.assertTrue(trace["rules"][-1]["matched"])
+        self.assertFalse(any(entry["matched"] for entry in trace["rules"][:-1]))
+        # Rules are not evaluated for cached results
+        res = self.run_task(mock_task(mock_resource("document.pdf")))
+        self.assertEqual(res[0].get_payload("trace"), {"rule": None, "rules": []})
+
+    def test_trace_unrecognized(self):
+        res = self.run_task(mock_task(Resource("file", bytes(100))))
+        trace = res[0].get_payload("trace")
+        self.assertIsNone(trace["rule"])
+        self.assertIn("dmg", [entry["rule"] for entry in trace["rules"]])
+
+    def test_explain(self):
+        karton = Classifier(
+            magic=self.magic_from_content, config=ConfigMock(), backend=self.backend
+        )
+        sample_class, trace = karton.explain(mock_task(mock_resource("runnable.jar")))
+        self.assertEqual(sample_class["extension"], "jar")
+        self.assertEqual(
+            [(entry.rule, entry.matched) for entry in trace],
+            [("apk", False), ("jar", True)],
+        )
+        # Trace payload is added only if enabled
+        self.karton = karton
+        res = self.run_task(mock_task(mock_resource("runnable.jar")))
+        self.assertFalse(res[0].has_payload("trace"))
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from zipfile import ZIP_STORED, ZipFile
+
+import pytest
+from karton.core import Task
+from karton.core.resource import RemoteResource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.reader import (
+    BytesSampleReader,
+    MappedSampleReader,
+    spool_content,
+)
+
+from .mock_helper import mock_resource, tests_dir
+from .test_classifier_range_reads import MinioMock
+
+
+def test_mapped_sample_reader(tmp_path):
+    backend = KartonBackendMock()
+    backend.minio = MinioMock(backend.buckets)
+    zip_content = BytesIO()
+    with ZipFile(zip_content, "w", compression=ZIP_STORED) as zipfile:
+        zipfile.writestr("payload.bin", os.urandom(10000))
+    content = zip_content.getvalue()
+    backend.buckets["bucket"]["uid"] = content
+    resource = RemoteResource("sample", bucket="bucket", uid="uid", backend=backend)
+
+    reader = MappedSampleReader(
+        spool_content(resource, chunk_size=1024, directory=str(tmp_path))
+    )
+    assert reader.size == len(content)
+    assert reader.head(100) == content[:100]
+    assert reader.tail(100) == content[-100:]
+    assert reader.read(len(content) - 10, 100) == content[-10:]
+    assert bytes(reader.view(10, 20)) == content[10:30]
+    assert reader.getvalue() == content
+    with reader.c_buffer() as buffer:
+        assert buffer.raw == content
+    del buffer
+    with ZipFile(reader.open()) as zipfile:
+        assert zipfile.namelist() == ["payload.bin"]
+    assert len(os.listdir(tmp_path)) == 1
+    reader.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_mapped_sample_reader_empty():
+    reader = MappedSampleReader(tempfile.NamedTemporaryFile())
+    assert reader.size == 0
+    assert reader.head(100) == b""
+    assert reader.open().read() == b""
+    reader.close()
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierMmap(KartonTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config = ConfigMock()
+        self.config.config.read_dict(
+            {
+                "classifier": {
+                    "mmap_threshold": "1024",
+                    "mmap_dir": self.tmp_dir.name,
+                    "digests": "md5",
+                }
+            }
+        )
+        self.backend = KartonBackendMock()
+        self.backend.minio = MinioMock(self.backend.buckets)
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def remote_task(self, name, content):
+        bucket = self.backend.default_bucket_name
+        self.backend.buckets[bucket][name] = content
+        resource = RemoteResource(
+            name, bucket=bucket, uid=name, size=len(content), backend=self.backend
+        )
+        task = Task({"type": "sample", "kind": "raw"})
+        task.add_payload("sample", resource)
+        return task
+
+    def assertClassified(self, task, headers):
+        res = self.run_task(task)
+        self.assertEqual(len(res), 1)
+        for key, value in headers.items():
+            self.assertEqual(res[0].headers.get(key), value)
+        self.assertFalse(task.get_resource("sample").loaded())
+        # Temporary file is removed after classification
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+        return res[0]
+
+    def test_mmap_pe(self):
+        content = mock_resource("runnable.exe").content + os.urandom(1024 * 1024)
+        res = self.assertClassified(
+            self.remote_task("sample.bin", content),
+            {"kind": "runnable", "platform": "win32", "extension": "exe"},
+        )
+        metadata = res.get_resource("sample").metadata
+        self.assertEqual(metadata["sha256"], hashlib.sha256(content).hexdigest())
+        self.assertEqual(metadata["md5"], hashlib.md5(content).hexdigest())
+        self.assertEqual(self.backend.minio.requests, [(0, 0)])
+
+    def test_mmap_jar(self):
+        zip_content = BytesIO()
+        with ZipFile(zip_content, "w", compression=ZIP_STORED) as zipfile:
+            zipfile.writestr("META-INF/MANIFEST.MF", b"Manifest-Version: 1.0\n")
+            zipfile.writestr("payload.bin", os.urandom(1024 * 1024))
+        self.assertClassified(
+            self.remote_task("sample", zip_content.getvalue()),
+            {"kind": "runnable", "platform": "win32", "extension": "jar"},
+        )
+
+    def test_mmap_default_digests(self):
+        self.config.config.remove_option("classifier", "digests")
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+        content = mock_resource("runnable.exe").content + os.urandom(1024 * 1024)
+        res = self.assertClassified(
+            self.remote_task("sample.bin", content), {"kind": "runnable"}
+        )
+        # sha256 is computed while spooling, the sample is downloaded once
+        metadata = res.get_resource("sample").metadata
+        self.assertEqual(metadata["sha256"], hashlib.sha256(content).hexdigest())
+        self.assertEqual(self.backend.minio.requests, [(0, 0)])
+
+    def test_mmap_below_threshold(self):
+        task = self.remote_task("sample.sh", b"#!/bin/bash\necho 1\n")
+        # Small samples are loaded into memory
+        self.assertIsInstance(
+            self.karton._create_sample_reader(task), BytesSampleReader
+        )
+        res = self.run_task(task)
+        self.assertEqual(res[0].headers["kind"], "script")
+
+
+def test_mapped_magic(tmp_path, magic_backend):
+    # libmagic gets the same results from the mapping as from bytes
+    classifier = Classifier(
+        magic=magic_backend, config=ConfigMock(), backend=KartonBackendMock()
+    )
+    for path in sorted((tests_dir / "testdata").iterdir()):
+        content = path.read_bytes()
+        spooled = tempfile.NamedTemporaryFile(dir=str(tmp_path))
+        spooled.write(content)
+        spooled.flush()
+        reader = MappedSampleReader(spooled)
+        assert classifier._get_magic(reader) == classifier._describe(content)
+        reader.close()
@@ -0,0 +1,168 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from karton.core import Task
+from karton.core.resource import RemoteResource
+from karton.core.task import TaskState
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+
+from .test_classifier_range_reads import MinioMock
+
+
+class QueueBackendMock(KartonBackendMock):
+    """
+    Backend serving queued tasks and recording the order of task status updates
+    """
+
+    def __init__(self, tasks, download_delay=0.0):
+        super().__init__()
+        self.tasks = list(tasks)
+        self.download_delay = download_delay
+        self.bind = None
+        self.consumer = None
+        self.finished = []
+        self.download_threads = set()
+        self.downloads_ahead = 0
+        self._downloaded = set()
+        self._lock = threading.Lock()
+
+    def register_bind(self, bind):
+        old_bind, self.bind = self.bind, bind
+        return old_bind
+
+    def get_bind(self, identity):
+        return self.bind
+
+    def set_consumer_identity(self, identity):
+        pass
+
+    def consume_routed_task(self, identity, timeout=5):
+        if not self.tasks:
+            # Queue drained, request graceful shutdown
+            self.consumer.shutdown = True
+            return None
+        return self.tasks.pop(0)
+
+    def set_task_status(self, task, status, consumer=None):
+        if status == TaskState.FINISHED:
+            self.finished.append(task.uid)
+
+    def download_object(self, bucket, object_uid):
+        time.sleep(self.download_delay)
+        with self._lock:
+            self.download_threads.add(threading.current_thread().name)
+            self._downloaded.add(object_uid)
+            self.downloads_ahead = max(
+                self.downloads_ahead, len(self._downloaded) - len(self.finished)
+            )
+        return super().download_object(bucket, object_uid)
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierPipeline(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+
+    def make_task(self, i, content):
+        resource = RemoteResource(
+            f"script{i}.sh",
+            bucket="karton.test",
+            uid=f"object{i}",
+            size=len(content),
+            sha256=f"sha256-{i}",
+        )
+        task = Task({"type": "sample", "kind": "raw"})
+        task.add_payload("sample", resource)
+        return task, content
+
+    def make_tasks(self, count):
+        return [self.make_task(i, b"#!/bin/sh\necho %d\n" % i) for i in range(count)]
+
+    def run_pipeline(self, tasks, options, download_delay=0.0, missing=(), cached=()):
+        backend = QueueBackendMock([task for task, _ in tasks], download_delay)
+        backend.minio = MinioMock(backend.buckets)
+        for task, content in tasks:
+            resource = task.get_resource("sample")
+            resource.backend = backend
+            if resource.uid not in missing:
+                backend.buckets["karton.test"][resource.uid] = content
+
+        self.config.config.read_dict({"classifier": options})
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=backend
+        )
+        for key in cached:
+            self.karton.cache.set(key, {"kind": "cached", "mime": "text/x-shellscript"})
+        backend.consumer = self.karton
+        self.karton.loop()
+        return [task for task, _ in tasks], backend
+
+    def test_pipeline_preserves_order(self):
+        tasks, backend = self.run_pipeline(
+            self.make_tasks(20), {"prefetch": "4"}, download_delay=0.01
+        )
+        assert backend.finished == [task.uid for task in tasks]
+        produced = [task.get_resource("sample").name for task in backend.produced_tasks]
+        assert produced == [task.get_resource("sample").name for task in tasks]
+        for produced_task in backend.produced_tasks:
+            assert produced_task.headers["kind"] == "script"
+        # Samples are downloaded in background threads, at most 4 tasks ahead
+        assert "MainThread" not in backend.download_threads
+        assert 1 < backend.downloads_ahead <= 5
+
+    def test_pipeline_range_reads(self):
+        large_script = b"#!/bin/sh\n" + b"echo\n" * 100000
+        tasks, backend = self.run_pipeline(
+            self.make_tasks(4) + [self.make_task(4, large_script)],
+            {"prefetch": "2", "range_reads": "true"},
+        )
+        assert backend.finished == [task.uid for task in tasks]
+        for produced_task in backend.produced_tasks:
+            assert produced_task.headers["kind"] == "script"
+        # Small samples are downloaded in background threads
+        assert backend.download_threads == {"karton-prefetch_0", "karton-prefetch_1"}
+        assert "object4" not in backend._downloaded
+        # Head of the large sample is fetched ahead and reused by classification
+        assert backend.minio.requests[0] == (0, 64 * 1024)
+        assert backend.minio.requests.count((0, 64 * 1024)) == 1
+
+    def test_pipeline_fetch_error(self):
+        tasks, backend = self.run_pipeline(
+            self.make_tasks(3), {"prefetch": "2"}, missing=["object1"]
+        )
+        # Task with missing object crashes as usual, other ones are processed
+        assert backend.finished == [tasks[0].uid, tasks[2].uid]
+        assert len(backend.produced_tasks) == 2
+
+    def test_pipeline_cached(self):
+        tasks, backend = self.run_pipeline(
+            self.make_tasks(4),
+            {"prefetch": "2", "cache_size": "16"},
+            cached=["sha256-1:sh", "sha256-2:sh"],
+        )
+        assert backend.finished == [task.uid for task in tasks]
+        kinds = [task.headers["kind"] for task in backend.produced_tasks]
+        assert kinds == ["script", "cached", "cached", "script"]
+        # Samples with cached classification are not prefetched
+        assert backend._downloaded == {"object0", "object3"}
+        assert self.karton._prefetched_readers == {}
+
+    def test_unused_prefetched_reader(self):
+        self.config.config.read_dict({"classifier": {"cache_size": "16"}})
+        self.karton = Classifier(
+            magic=self.magic_from_content,
+            config=self.config,
+            backend=KartonBackendMock(),
+        )
+        task, _ = self.make_task(0, b"")
+        self.karton.cache.set("sha256-0:sh", {"kind": "cached", "mime": None})
+        # Sample was prefetched before its classification was cached
+        reader = mock.Mock()
+        self.karton._prefetched_readers[task] = reader
+        self.run_task(task)
+        reader.close.assert_called_once()
+        assert self.karton._prefetched_readers == {}
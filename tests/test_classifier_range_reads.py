@@ -0,0 +1,144 @@
+import hashlib
+import os
+from io import BytesIO
+from zipfile import ZIP_STORED, ZipFile
+
+import pytest
+from karton.core import Task
+from karton.core.resource import RemoteResource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.reader import RangedSampleReader
+
+from .mock_helper import mock_resource
+
+
+class ResponseMock:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def stream(self, amt):
+        for offset in range(0, len(self._data), amt):
+            yield self._data[offset : offset + amt]
+
+    def release_conn(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MinioMock:
+    """
+    Local stand-in for MinIO client serving objects from KartonBackendMock buckets
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.requests = []
+
+    def get_object(self, bucket, object_uid, offset=0, length=0):
+        self.requests.append((offset, length))
+        data = self.buckets[bucket][object_uid]
+        return ResponseMock(data[offset : offset + length] if length else data[offset:])
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierRangeReads(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"range_reads": "true"}})
+        self.backend = KartonBackendMock()
+        self.backend.minio = MinioMock(self.backend.buckets)
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def remote_task(self, name, content):
+        bucket = self.backend.default_bucket_name
+        self.backend.buckets[bucket][name] = content
+        resource = RemoteResource(
+            name,
+            bucket=bucket,
+            uid=name,
+            size=len(content),
+            backend=self.backend,
+            sha256="sha256",
+        )
+        task = Task({"type": "sample", "kind": "raw"})
+        task.add_payload("sample", resource)
+        return task
+
+    def assertClassified(self, task, headers):
+        res = self.run_task(task)
+        self.assertEqual(len(res), 1)
+        for key, value in headers.items():
+            self.assertEqual(res[0].headers.get(key), value)
+        self.assertFalse(task.get_resource("sample").loaded())
+        return res[0]
+
+    def test_range_reads_pe(self):
+        content = mock_resource("runnable.exe").content + os.urandom(8 * 1024 * 1024)
+        task = self.remote_task("sample.bin", content)
+        self.assertClassified(
+            task, {"kind": "runnable", "platform": "win32", "extension": "exe"}
+        )
+        fetched = sum(length for _, length in self.backend.minio.requests)
+        self.assertLessEqual(fetched, 256 * 1024)
+
+    def test_range_reads_jar(self):
+        zip_content = BytesIO()
+        with ZipFile(zip_content, "w", compression=ZIP_STORED) as zipfile:
+            zipfile.writestr("META-INF/MANIFEST.MF", b"Manifest-Version: 1.0\n")
+            zipfile.writestr("payload.bin", os.urandom(8 * 1024 * 1024))
+        task = self.remote_task("sample", zip_content.getvalue())
+        self.assertClassified(
+            task, {"kind": "runnable", "platform": "win32", "extension": "jar"}
+        )
+        fetched = sum(length for _, length in self.backend.minio.requests)
+        self.assertLessEqual(fetched, 256 * 1024)
+
+    def test_range_reads_sha256(self):
+        content = mock_resource("runnable.exe").content + os.urandom(1024 * 1024)
+        task = self.remote_task("sample.bin", content)
+        del task.get_resource("sample").metadata["sha256"]
+        res = self.assertClassified(task, {"kind": "runnable"})
+        # sha256 is computed from the streamed object
+        self.assertEqual(
+            res.get_resource("sample").metadata["sha256"],
+            hashlib.sha256(content).hexdigest(),
+        )
+
+    def test_range_reads_fallback(self):
+        task = self.remote_task("sample", b"\x00" * 1024 * 1024)
+        res = self.run_task(task)
+        self.assertEqual(res[0].headers["stage"], "unrecognized")
+        # Generic magic windows make classifier download the whole sample
+        self.assertTrue(task.get_resource("sample").loaded())
+
+
+def test_ranged_sample_reader():
+    backend = KartonBackendMock()
+    backend.minio = MinioMock(backend.buckets)
+    content = os.urandom(10000)
+    backend.buckets["bucket"]["uid"] = content
+    resource = RemoteResource(
+        "sample", bucket="bucket", uid="uid", size=len(content), backend=backend
+    )
+    reader = RangedSampleReader(resource, block_size=1024)
+
+    assert reader.head(100) == content[:100]
+    assert reader.tail(2048) == content[-2048:]
+    assert reader.read(1000, 3000) == content[1000:4000]
+    assert reader.read(9000, 5000) == content[9000:]
+    assert reader.read(20000, 10) == b""
+    with reader.open() as f:
+        f.seek(-10, 2)
+        assert f.read() == content[-10:]
+    # Every block is fetched only once and blocks 4-6 are never fetched
+    assert reader.bytes_fetched == len(content) - 3 * 1024
+    assert not resource.loaded()
@@ -0,0 +1,117 @@
+import bz2
+import gzip
+import io
+import lzma
+import tarfile
+import zlib
+
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.compression import peek_decompressed
+from karton.classifier.reader import BytesSampleReader
+
+from .mock_helper import mock_resource, mock_task, tests_dir
+
+COMPRESSORS = {
+    "gz": gzip.compress,
+    "zlib": zlib.compress,
+    "bz2": bz2.compress,
+    "xz": lzma.compress,
+}
+
+
+def make_tar(content):
+    output = io.BytesIO()
+    with tarfile.open(fileobj=output, mode="w") as archive:
+        info = tarfile.TarInfo("file.bin")
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("compression", ["gz", "zlib", "bz2", "xz"])
+def test_peek(compression):
+    data = bytes(range(256)) * 64
+    content = COMPRESSORS[compression](data)
+    assert peek_decompressed(BytesSampleReader(content), compression) == data
+    assert (
+        peek_decompressed(BytesSampleReader(content), compression, output_size=100)
+        == data[:100]
+    )
+
+
+@pytest.mark.parametrize("compression", ["gz", "zlib", "bz2", "xz"])
+def test_peek_bomb(compression):
+    content = COMPRESSORS[compression](bytes(16 * 1024 * 1024))
+    data = peek_decompressed(
+        BytesSampleReader(content), compression, output_size=1024 * 1024
+    )
+    assert data == bytes(1024 * 1024)
+
+
+def test_peek_input_limit():
+    content = gzip.compress(lzma.compress(bytes(range(256)) * 4096))
+    data = peek_decompressed(BytesSampleReader(content), "gz", input_size=1024)
+    assert 0 < len(data) < 1024 * 1024
+
+
+def test_peek_corrupted():
+    content = gzip.compress(b"a" * 1024 + bytes(range(256)) * 16)
+    # Data decompressed before the corrupted part is returned
+    assert peek_decompressed(BytesSampleReader(content[:-100]), "gz")[:4] == b"aaaa"
+    assert peek_decompressed(BytesSampleReader(b"\x1f\x8b\x08garbage"), "gz") is None
+    with pytest.raises(ValueError):
+        peek_decompressed(BytesSampleReader(content), "lz")
+
+
+def test_peek_testdata():
+    content = (tests_dir / "testdata" / "archive.gz").read_bytes()
+    assert peek_decompressed(BytesSampleReader(content), "gz").startswith(b"MZ")
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierDecompressPeek(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"decompress_peek": "true"}})
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def test_inner_runnable(self):
+        res = self.run_task(mock_task(mock_resource("archive.gz")))
+        headers = res[0].headers
+        self.assertEqual(headers["kind"], "archive")
+        self.assertEqual(headers["extension"], "gz")
+        self.assertEqual(headers["inner_kind"], "runnable")
+        self.assertEqual(headers["inner_extension"], "exe")
+
+    def test_inner_tar(self):
+        content = make_tar(b"data" * 1024)
+        for compression, compress in COMPRESSORS.items():
+            resource = Resource(f"file.tar.{compression}", compress(content))
+            res = self.run_task(mock_task(resource))
+            headers = res[0].headers
+            self.assertEqual(headers["extension"], compression)
+            self.assertEqual(headers["inner_kind"], "archive")
+            self.assertEqual(headers["inner_extension"], "tar")
+
+    def test_inner_unknown(self):
+        resource = Resource("file.gz", gzip.compress(bytes(1024 * 1024)))
+        res = self.run_task(mock_task(resource))
+        self.assertEqual(res[0].headers["extension"], "gz")
+        self.assertNotIn("inner_kind", res[0].headers)
+
+    def test_peek_disabled(self):
+        self.karton = Classifier(
+            magic=self.magic_from_content,
+            config=ConfigMock(),
+            backend=self.backend,
+        )
+        res = self.run_task(mock_task(mock_resource("archive.gz")))
+        self.assertEqual(res[0].headers["extension"], "gz")
+        self.assertNotIn("inner_kind", res[0].headers)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+
+import pytest
+from karton.core import Task
+from karton.core.resource import RemoteResource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.digests import MultiDigest
+from karton.classifier.profiling import AllocationTracer
+from karton.classifier.reader import download_content
+
+from .test_classifier_range_reads import MinioMock
+
+
+def test_multi_digest():
+    digest = MultiDigest(["md5", "sha1", "sha256", "sha512"])
+    digest.update(b"abc")
+    digest.update(b"def")
+    assert digest.hexdigests() == {
+        algorithm: hashlib.new(algorithm, b"abcdef").hexdigest()
+        for algorithm in ["md5", "sha1", "sha256", "sha512"]
+    }
+    with pytest.raises(ValueError):
+        MultiDigest(["sha256", "unknown"])
+
+
+def test_download_content_streaming():
+    backend = KartonBackendMock()
+    backend.minio = MinioMock(backend.buckets)
+    content = os.urandom(3 * 1024 + 1)
+    backend.buckets["bucket"]["uid"] = content
+    resource = RemoteResource("sample", bucket="bucket", uid="uid", backend=backend)
+
+    digest = MultiDigest(["md5"])
+    assert download_content(resource, digest, chunk_size=1024) == content
+    assert digest.hexdigests() == {"md5": hashlib.md5(content).hexdigest()}
+    # Whole object was fetched with a single request
+    assert backend.minio.requests == [(0, 0)]
+
+
+def remote_resource(content, size):
+    backend = KartonBackendMock()
+    backend.minio = MinioMock(backend.buckets)
+    backend.buckets["bucket"]["uid"] = content
+    return RemoteResource(
+        "sample", bucket="bucket", uid="uid", size=size, backend=backend
+    )
+
+
+def test_download_content_peak_allocation():
+    content = os.urandom(16 * 1024 * 1024)
+    resource = remote_resource(content, len(content))
+    with AllocationTracer() as tracer:
+        assert download_content(resource, chunk_size=1024 * 1024) == content
+    # Chunks are not joined at the end (which would double the peak)
+    assert tracer.peak < len(content) * 1.25
+
+
+@pytest.mark.parametrize("size", [None, 1000, 5000])
+def test_download_content_size_mismatch(size):
+    # Declared size is only a hint for the buffer allocation
+    content = os.urandom(3 * 1024 + 1)
+    resource = remote_resource(content, size)
+    assert download_content(resource, chunk_size=1024) == content
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierDigests(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"digests": "md5, sha1, sha512"}})
+        self.backend = KartonBackendMock()
+        self.backend.minio = MinioMock(self.backend.buckets)
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def remote_task(self, content, **metadata):
+        self.backend.buckets["bucket"]["uid"] = content
+        resource = RemoteResource(
+            "file.txt",
+            bucket="bucket",
+            uid="uid",
+            size=len(content),
+            backend=self.backend,
+            **metadata,
+        )
+        task = Task({"type": "sample", "kind": "raw"})
+        task.add_payload("sample", resource)
+        return task
+
+    def test_digests(self):
+        content = b"hello world\n" * 1000
+        res = self.run_task(self.remote_task(content))
+        metadata = res[0].get_resource("sample").metadata
+        for algorithm in ["md5", "sha1", "sha256", "sha512"]:
+            assert metadata[algorithm] == hashlib.new(algorithm, content).hexdigest()
+        assert self.backend.minio.requests == [(0, 0)]
+
+    def test_digests_keep_producer_metadata(self):
+        res = self.run_task(self.remote_task(b"hello world\n", sha256="sha256"))
+        metadata = res[0].get_resource("sample").metadata
+        assert metadata["sha256"] == "sha256"
+        assert metadata["md5"] == hashlib.md5(b"hello world\n").hexdigest()
+
+    def test_unknown_digest(self):
+        self.config.config.read_dict({"classifier": {"digests": "sha256,unknown"}})
+        with pytest.raises(ValueError):
+            Classifier(config=self.config, backend=self.backend)
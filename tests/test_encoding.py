@@ -0,0 +1,78 @@
+import codecs
+
+import pytest
+
+from karton.classifier import encoding
+from karton.classifier.encoding import decode_text, get_encoding_detectors
+
+
+@pytest.fixture
+def chardet_calls(monkeypatch):
+    calls = []
+    detect = encoding.chardet.detect
+
+    def counting_detect(data):
+        calls.append(data)
+        return detect(data)
+
+    monkeypatch.setattr(encoding.chardet, "detect", counting_detect)
+    return calls
+
+
+@pytest.mark.parametrize(
+    "data, magic, expected",
+    [
+        (b"plain text", "ASCII text", ("plain text", "ascii")),
+        ("zażółć".encode(), "", ("zażółć", "utf-8")),
+        (codecs.BOM_UTF8 + b"text", "", ("text", "utf-8-sig")),
+        ("text".encode("utf-16"), "", ("text", "utf-16")),
+        ("zażółć".encode("iso-8859-2"), "ISO-8859 text", ("za¿ó³æ", "iso-8859-1")),
+        (
+            "text".encode("utf-16-le"),
+            "Unicode text, UTF-16, little-endian text",
+            ("text", "utf-16-le"),
+        ),
+    ],
+)
+def test_decode_without_chardet(chardet_calls, data, magic, expected):
+    assert decode_text(data, magic) == expected
+    assert chardet_calls == []
+
+
+def test_decode_chardet_fallback(chardet_calls):
+    data = "Zażółć gęślą jaźń. ".encode("windows-1250") * 10
+    text, text_encoding = decode_text(data, "data")
+    assert text_encoding.startswith("Windows-")
+    assert text.startswith("Za")
+    assert len(chardet_calls) == 1
+
+
+def test_decode_failure(chardet_calls):
+    assert decode_text(b"\x81\x8d\x8f", "data") is None
+    assert len(chardet_calls) == 1
+
+
+def test_encoding_detectors():
+    detectors = get_encoding_detectors(["ascii", " chardet"])
+    assert detectors == [encoding.detect_ascii, encoding.detect_chardet]
+    assert decode_text("zażółć".encode(), detectors=detectors[:1]) is None
+    with pytest.raises(ValueError):
+        get_encoding_detectors(["ascii", "unknown"])
+
+
+def test_control_bytes_ratio():
+    assert encoding.control_bytes_ratio(b"") == 0.0
+    assert encoding.control_bytes_ratio(b"text\r\n\tmore\x0c\x1b[0m\xff") == 0.0
+    assert encoding.control_bytes_ratio(b"ab\x00\x01") == 0.5
+
+
+def test_is_binary():
+    assert encoding.is_binary(b"MZ\x90\x00\x03\x00\x00\x00")
+    assert not encoding.is_binary(b"var x = 1;\n" * 10)
+    # UTF-16 text has a lot of NUL bytes
+    assert not encoding.is_binary("text".encode("utf-16"))
+    assert not encoding.is_binary(
+        "text".encode("utf-16-le"), "Unicode text, UTF-16, little-endian text"
+    )
+    assert encoding.is_binary("text".encode("utf-16-le"), "data")
+    assert not encoding.is_binary(b"\x00" * 10, threshold=1.0)
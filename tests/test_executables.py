@@ -0,0 +1,178 @@
+import struct
+
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.executables import ExecutableInfo, parse_executable
+from karton.classifier.reader import BytesSampleReader
+
+from .mock_helper import mock_resource, mock_task, tests_dir
+
+
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        ("runnable.exe", ExecutableInfo("pe", "x86", 32, "executable", "gui")),
+        ("runnable.dll", ExecutableInfo("pe", "x86", 32, "dll", "console")),
+        ("runnable.exe64", ExecutableInfo("pe", "x86_64", 64, "executable", "console")),
+        ("runnable.dll64", ExecutableInfo("pe", "x86_64", 64, "dll", "gui")),
+        ("runnable.spc", ExecutableInfo("elf", "sparc", 32, "executable")),
+        ("runnable.msi", None),
+        ("runnable.jar", None),
+        ("document.pdf", None),
+    ],
+)
+def test_parse_testdata(filename, expected):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    assert parse_executable(BytesSampleReader(content)) == expected
+
+
+def test_parse_elf():
+    header = b"\x7fELF\x02\x01\x01" + bytes(9) + struct.pack("<HH", 3, 183)
+    assert parse_executable(BytesSampleReader(header)) == ExecutableInfo(
+        "elf", "arm64", 64, "shared_object"
+    )
+    # Invalid class
+    assert parse_executable(BytesSampleReader(b"\x7fELF\x05" + header[5:])) is None
+
+
+def elf_shared_object(program_headers, dynamic=b""):
+    # 64-bit little-endian ET_DYN with program headers following the ELF header
+    # and dynamic entries following the program headers
+    header = b"\x7fELF\x02\x01\x01" + bytes(9) + struct.pack("<HH", 3, 62)
+    header += struct.pack("<IQQQIHHH", 1, 0, 64, 0, 0, 64, 56, len(program_headers))
+    header += bytes(64 - len(header))
+    dynamic_offset = 64 + 56 * len(program_headers)
+    table = b"".join(
+        struct.pack(
+            "<IIQQQQQQ",
+            p_type,
+            0,
+            dynamic_offset if p_type == 2 else 0,
+            0,
+            0,
+            len(dynamic) if p_type == 2 else 0,
+            0,
+            0,
+        )
+        for p_type in program_headers
+    )
+    return header + table + dynamic
+
+
+@pytest.mark.parametrize(
+    "content,binary_type",
+    [
+        # PT_INTERP
+        (elf_shared_object([6, 3, 1]), "executable"),
+        # DT_FLAGS_1 with DF_1_PIE
+        (
+            elf_shared_object(
+                [1, 2], struct.pack("<qQqQqQ", 1, 1, 0x6FFFFFFB, 0x08000001, 0, 0)
+            ),
+            "executable",
+        ),
+        # DT_FLAGS_1 without DF_1_PIE
+        (
+            elf_shared_object([1, 2], struct.pack("<qQqQ", 0x6FFFFFFB, 1, 0, 0)),
+            "shared_object",
+        ),
+        # DF_1_PIE after DT_NULL
+        (
+            elf_shared_object(
+                [1, 2], struct.pack("<qQqQ", 0, 0, 0x6FFFFFFB, 0x08000000)
+            ),
+            "shared_object",
+        ),
+        (elf_shared_object([1]), "shared_object"),
+        # Truncated program headers
+        (elf_shared_object([1, 3])[: 64 + 56], "shared_object"),
+    ],
+)
+def test_parse_elf_pie(content, binary_type):
+    info = parse_executable(BytesSampleReader(content))
+    assert info == ExecutableInfo("elf", "x86_64", 64, binary_type)
+
+
+def test_parse_elf_pie_32bit():
+    # 32-bit big-endian ET_DYN with PT_INTERP
+    header = b"\x7fELF\x01\x02\x01" + bytes(9) + struct.pack(">HH", 3, 8)
+    header += struct.pack(">IIIIIHHH", 1, 0, 52, 0, 0, 52, 32, 1)
+    header += bytes(52 - len(header))
+    content = header + struct.pack(">8I", 3, 0, 0, 0, 0, 0, 0, 0)
+    assert parse_executable(BytesSampleReader(content)) == ExecutableInfo(
+        "elf", "mips", 32, "executable"
+    )
+
+
+def test_parse_macho():
+    header = b"\xcf\xfa\xed\xfe" + struct.pack("<III", 0x0100000C, 0, 6)
+    assert parse_executable(BytesSampleReader(header)) == ExecutableInfo(
+        "macho", "arm64", 64, "shared_object"
+    )
+    header = b"\xfe\xed\xfa\xce" + struct.pack(">III", 18, 0, 2)
+    assert parse_executable(BytesSampleReader(header)) == ExecutableInfo(
+        "macho", "ppc", 32, "executable"
+    )
+
+
+def test_parse_truncated_pe():
+    content = mock_resource("runnable.exe").content
+    pe_offset = struct.unpack("<I", content[0x3C:0x40])[0]
+    # Subsystem is missing
+    info = parse_executable(BytesSampleReader(content[: pe_offset + 0x40]))
+    assert info == ExecutableInfo("pe", "x86", 32, "executable")
+    assert info.headers() == {
+        "machine": "x86",
+        "bitness": "32",
+        "binary_type": "executable",
+    }
+    assert parse_executable(BytesSampleReader(content[: pe_offset + 0x10])) is None
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierExecutableInfo(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"executable_info": "true"}})
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def test_executable_info(self):
+        res = self.run_task(mock_task(mock_resource("runnable.dll64")))
+        headers = res[0].headers
+        self.assertEqual(headers["kind"], "runnable")
+        self.assertEqual(headers["platform"], "win64")
+        self.assertEqual(headers["machine"], "x86_64")
+        self.assertEqual(headers["bitness"], "64")
+        self.assertEqual(headers["binary_type"], "dll")
+        self.assertEqual(headers["subsystem"], "gui")
+        self.assertEqual(
+            res[0].get_payload("executable"),
+            {
+                "format": "pe",
+                "machine": "x86_64",
+                "bitness": "64",
+                "binary_type": "dll",
+                "subsystem": "gui",
+            },
+        )
+
+    def test_executable_info_elf(self):
+        res = self.run_task(mock_task(mock_resource("runnable.spc")))
+        self.assertEqual(res[0].headers["machine"], "sparc")
+        self.assertNotIn("subsystem", res[0].headers)
+        self.assertEqual(res[0].get_payload("executable")["format"], "elf")
+
+    def test_executable_info_other_kinds(self):
+        for resource in [
+            mock_resource("runnable.msi"),
+            Resource("file.exe", b"MZ" + bytes(100)),
+        ]:
+            res = self.run_task(mock_task(resource))
+            self.assertNotIn("machine", res[0].headers)
+            self.assertFalse(res[0].has_payload("executable"))
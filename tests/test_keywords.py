@@ -0,0 +1,77 @@
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.keywords import KeywordScanner
+
+from .mock_helper import mock_task
+
+
+class CountingText(str):
+    """
+    String counting substring searches
+    """
+
+    searches = 0
+
+    def __contains__(self, keyword):
+        CountingText.searches += 1
+        return super().__contains__(keyword)
+
+
+def test_keyword_scanner():
+    scanner = KeywordScanner(
+        {"vbs": ["createobject", "end if", "end if"], "js": ["var ", "createobject"]}
+    )
+    assert scanner.families["vbs"] == ("createobject", "end if")
+    assert scanner.keywords == ("createobject", "end if", "var ")
+
+    hits = scanner.scan("set x = createobject(1)\nvar y")
+    assert hits.counts() == {"vbs": 1, "js": 2}
+    assert hits.has_at_least("js", 2)
+    assert not hits.has_at_least("vbs", 2)
+
+
+def test_keyword_scanner_searches_each_keyword_once():
+    scanner = KeywordScanner(
+        {"vbs": ["createobject", "end if"], "js": ["createobject", "var "]}
+    )
+    CountingText.searches = 0
+    hits = scanner.scan(CountingText("createobject end if"))
+    # Family threshold is reached after the first keyword
+    assert hits.has_at_least("vbs", 1)
+    assert CountingText.searches == 1
+    assert hits.has_at_least("js", 1)
+    assert CountingText.searches == 1
+    assert hits.counts() == {"vbs": 2, "js": 1}
+    assert CountingText.searches == 3
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestHeuristics(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.backend = KartonBackendMock()
+
+    def classify(self, content, options=None):
+        self.config.config.read_dict({"classifier": options or {}})
+        classifier = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+        return classifier._classify(mock_task(Resource("file", content)))
+
+    def test_heuristics_window(self):
+        padding = b"lorem ipsum\n" * 500
+        content = padding + b"var x = new ActiveXObject('x');\n" + padding
+        assert self.classify(content)["kind"] == "ascii"
+        sample_class = self.classify(content, {"heuristics_window": "8192"})
+        assert sample_class["kind"] == "script"
+        assert sample_class["extension"] == "js"
+
+    def test_binary_gate(self):
+        content = bytes(range(32)) * 16 + b"var x = new ActiveXObject('x');"
+        assert self.classify(content) is None
+        sample_class = self.classify(content, {"binary_threshold": "1.0"})
+        assert sample_class["kind"] == "script"
+        assert sample_class["extension"] == "js"
@@ -0,0 +1,38 @@
+import magic as pymagic
+import pytest
+
+from karton.classifier.classifier import MagicBackend
+
+from .mock_helper import tests_dir
+
+
+@pytest.fixture(scope="module")
+def magic_backend():
+    return MagicBackend()
+
+
+@pytest.mark.parametrize(
+    "filename", sorted(path.name for path in (tests_dir / "testdata").iterdir())
+)
+def test_describe(magic_backend, filename):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    expected = (
+        pymagic.Magic(mime=False).from_buffer(content),
+        pymagic.Magic(mime=True).from_buffer(content),
+    )
+    assert magic_backend.describe(content) == expected
+    assert (magic_backend(content, mime=False), magic_backend(content, mime=True)) == (
+        expected
+    )
+
+
+@pytest.mark.parametrize(
+    "content,expected",
+    [
+        (b"", ("empty", "application/x-empty")),
+        (b"\x00" * 4096, ("data", "application/octet-stream")),
+    ],
+)
+def test_describe_generic(magic_backend, content, expected):
+    assert magic_backend.describe(content) == expected
+    assert magic_backend(content, mime=True) == expected[1]
@@ -0,0 +1,95 @@
+import socket
+import urllib.request
+
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.metrics import (
+    NO_METRICS,
+    PrometheusMetrics,
+    start_metrics_server,
+)
+
+from .mock_helper import mock_resource, mock_task
+
+pytest.importorskip("prometheus_client")
+
+
+def test_no_metrics():
+    with NO_METRICS.stage("magic"):
+        pass
+    NO_METRICS.rule_matched("pe")
+
+
+def test_metrics_server():
+    metrics = PrometheusMetrics()
+    with metrics.stage("magic"):
+        pass
+    metrics.rule_matched(None)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    start_metrics_server(port, "127.0.0.1", metrics.registry)
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        body = response.read().decode()
+    assert 'karton_classifier_stage_duration_seconds_count{stage="magic"} 1.0' in body
+    assert 'karton_classifier_rule_hits_total{rule="unrecognized"} 1.0' in body
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierMetrics(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"metrics_port": "9100"}})
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def get_stage_count(self, stage):
+        return self.karton.metrics.registry.get_sample_value(
+            "karton_classifier_stage_duration_seconds_count", {"stage": stage}
+        )
+
+    def get_rule_hits(self, rule):
+        return self.karton.metrics.registry.get_sample_value(
+            "karton_classifier_rule_hits_total", {"rule": rule}
+        )
+
+    def test_stages(self):
+        self.run_task(mock_task(mock_resource("runnable.exe")))
+        for stage in ["process", "download", "magic", "rules", "send_task"]:
+            self.assertEqual(self.get_stage_count(stage), 1, stage)
+        self.assertEqual(self.get_stage_count("zip"), 0)
+        self.assertEqual(self.get_rule_hits("pe"), 1)
+
+        self.run_task(mock_task(mock_resource("runnable.jar")))
+        self.assertEqual(self.get_stage_count("process"), 2)
+        self.assertEqual(self.get_stage_count("zip"), 1)
+        self.assertEqual(self.get_rule_hits("jar"), 1)
+
+    def test_heuristics_stages(self):
+        self.run_task(mock_task(mock_resource("script.js", with_name=False)))
+        self.assertEqual(self.get_stage_count("encoding"), 1)
+        self.assertEqual(self.get_stage_count("heuristics"), 1)
+
+    def test_unrecognized(self):
+        self.run_task(mock_task(Resource("file", bytes(100))))
+        self.assertEqual(self.get_rule_hits("unrecognized"), 1)
+        self.assertEqual(self.get_stage_count("send_task"), 1)
+
+    def test_memory_peak(self):
+        self.karton.trace_memory = True
+        self.run_task(mock_task(mock_resource("runnable.exe")))
+        count = self.karton.metrics.registry.get_sample_value(
+            "karton_classifier_task_memory_peak_bytes_count"
+        )
+        self.assertEqual(count, 1)
+
+    def test_metrics_disabled(self):
+        karton = Classifier(
+            magic=self.magic_from_content, config=ConfigMock(), backend=self.backend
+        )
+        self.assertIs(karton.metrics, NO_METRICS)
@@ -0,0 +1,134 @@
+import logging
+import os
+import signal
+import time
+
+from karton.classifier import Classifier
+from karton.classifier.cache import SQLiteClassificationCache
+from karton.classifier.prefork import run_prefork
+
+
+class ServiceMock:
+    def __init__(self, tmp_path, crash_once=False, crashes=0):
+        self.tmp_path = tmp_path
+        self.crashes = 1 if crash_once else crashes
+        self.log = logging.getLogger("test_prefork")
+
+    def loop(self):
+        crashed = len(list(self.tmp_path.glob("crashed*")))
+        if crashed < self.crashes:
+            (self.tmp_path / f"crashed{crashed}").touch()
+            raise RuntimeError("Worker crashed")
+        (self.tmp_path / str(os.getpid())).touch()
+
+
+class StoppableServiceMock(ServiceMock):
+    """
+    Service with graceful shutdown on SIGTERM (like KartonServiceBase)
+    """
+
+    def __init__(self, tmp_path, crashes=0):
+        super().__init__(tmp_path, crashes=crashes)
+        self.shutdown = False
+        signal.signal(signal.SIGTERM, self.graceful_shutdown)
+
+    def graceful_shutdown(self, signum, frame):
+        self.shutdown = True
+
+    def loop(self):
+        super().loop()
+        while not self.shutdown:
+            time.sleep(0.01)
+        (self.tmp_path / f"stopped{os.getpid()}").touch()
+
+
+def worker_pids(tmp_path):
+    return {path.name for path in tmp_path.iterdir() if path.name.isdigit()}
+
+
+def test_prefork_workers(tmp_path):
+    run_prefork(ServiceMock(tmp_path), 3)
+    pids = worker_pids(tmp_path)
+    assert len(pids) == 3
+    assert str(os.getpid()) not in pids
+
+
+def test_prefork_restarts_crashed_worker(tmp_path):
+    run_prefork(ServiceMock(tmp_path, crash_once=True), 2)
+    assert (tmp_path / "crashed0").exists()
+    assert len(worker_pids(tmp_path)) == 2
+
+
+def test_prefork_restart_backoff(tmp_path):
+    start = time.monotonic()
+    run_prefork(ServiceMock(tmp_path, crashes=4), 1, restart_delay=0.05)
+    # Restarts are delayed by 0.05 + 0.1 + 0.2 + 0.4 seconds
+    assert time.monotonic() - start >= 0.75
+    assert len(worker_pids(tmp_path)) == 1
+
+
+def test_prefork_max_restart_delay(tmp_path):
+    start = time.monotonic()
+    run_prefork(
+        ServiceMock(tmp_path, crashes=4), 1, restart_delay=0.05, max_restart_delay=0.1
+    )
+    elapsed = time.monotonic() - start
+    assert 0.35 <= elapsed < 0.75
+
+
+def test_prefork_stop_after_restart(tmp_path):
+    parent = os.fork()
+    if parent == 0:
+        try:
+            run_prefork(StoppableServiceMock(tmp_path, crashes=1), 2, 0.05)
+        finally:
+            os._exit(0)
+    try:
+        deadline = time.monotonic() + 10
+        while len(worker_pids(tmp_path)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(worker_pids(tmp_path)) == 2
+        os.kill(parent, signal.SIGTERM)
+        # Restarted worker shuts down gracefully like the original one
+        deadline = time.monotonic() + 10
+        while os.waitpid(parent, os.WNOHANG) == (0, 0):
+            assert time.monotonic() < deadline, "Workers didn't stop"
+            time.sleep(0.01)
+        parent = None
+        stopped = {path.name for path in tmp_path.glob("stopped*")}
+        assert stopped == {f"stopped{pid}" for pid in worker_pids(tmp_path)}
+    finally:
+        if parent is not None:
+            for pid in [parent, *map(int, worker_pids(tmp_path))]:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+def test_workers_arguments():
+    parser = Classifier.args_parser()
+    args = parser.parse_args(["--workers", "4"])
+    assert args.prefork_workers == 4
+    args = parser.parse_args(["--workers", "4", "batch", "--workers", "2", "dir"])
+    assert (args.prefork_workers, args.workers) == (4, 2)
+    args = parser.parse_args(["--workers", "4", "batch", "dir"])
+    assert args.prefork_workers == 4
+
+
+def test_prefork_sqlite_cache(tmp_path):
+    cache = SQLiteClassificationCache(str(tmp_path / "cache.db"))
+    cache.set("parent", {"kind": "raw"})
+
+    class CacheService(ServiceMock):
+        def loop(self):
+            assert cache.get("parent") == (True, {"kind": "raw"})
+            cache.set(str(os.getpid()), {"kind": "runnable"})
+            super().loop()
+
+    run_prefork(CacheService(tmp_path), 2)
+    pids = worker_pids(tmp_path)
+    assert len(pids) == 2
+    for pid in pids:
+        assert cache.get(pid) == (True, {"kind": "runnable"})
+    cache.close()
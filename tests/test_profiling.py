@@ -0,0 +1,159 @@
+import hashlib
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+import pytest
+from karton.core import Resource
+from karton.core.test import ConfigMock, KartonBackendMock, KartonTestCase
+
+from karton.classifier import Classifier
+from karton.classifier.profiling import AllocationTracer, TaskProfiler
+
+from .mock_helper import mock_resource, mock_task
+
+
+def profiles(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pstats"))
+
+
+def test_sampled(tmp_path):
+    profiler = TaskProfiler(str(tmp_path), rate=0.5)
+    with mock.patch("random.random", side_effect=[0.7, 0.2]):
+        profiler.run(lambda: None, lambda: ("a" * 64, "pe"))
+        assert profiles(tmp_path) == []
+        profiler.run(lambda: None, lambda: ("a" * 64, "pe"))
+    [name] = profiles(tmp_path)
+    assert name.endswith(f"-{'a' * 64}-pe.pstats")
+    pstats.Stats(str(tmp_path / name))
+
+
+def test_threshold(tmp_path):
+    profiler = TaskProfiler(str(tmp_path), threshold=0.05)
+    profiler.run(lambda: None, lambda: ("fast", "pe"))
+    assert profiles(tmp_path) == []
+    profiler.run(lambda: time.sleep(0.06), lambda: ("slow", "pe"))
+    [name] = profiles(tmp_path)
+    assert name.endswith("-slow-pe.pstats")
+
+
+def test_failed_task(tmp_path):
+    def fail():
+        raise RuntimeError("failed")
+
+    profiler = TaskProfiler(str(tmp_path), rate=1.0)
+    with pytest.raises(RuntimeError):
+        profiler.run(fail, lambda: ("sha256", "norule"))
+    assert len(profiles(tmp_path)) == 1
+
+
+def test_rotation(tmp_path):
+    profiler = TaskProfiler(str(tmp_path), rate=1.0)
+    profiler.run(lambda: None, lambda: ("first", "pe"))
+    size = os.path.getsize(tmp_path / profiles(tmp_path)[0])
+    # Room for two profiles
+    profiler.max_size = size * 2 + size // 2
+    for index in range(3):
+        time.sleep(0.01)
+        profiler.run(lambda: None, lambda: (f"next{index}", "pe"))
+    names = profiles(tmp_path)
+    assert len(names) == 2
+    assert not any("-first-" in name for name in names)
+    assert any("-next2-" in name for name in names)
+    # Other files are not removed
+    (tmp_path / "other.txt").write_bytes(bytes(size * 10))
+    profiler.run(lambda: None, lambda: ("last", "pe"))
+    assert (tmp_path / "other.txt").exists()
+
+
+def test_allocation_tracer():
+    with AllocationTracer() as tracer:
+        data = bytes(10 * 1024 * 1024)
+        del data
+    assert 10 * 1024 * 1024 <= tracer.peak < 11 * 1024 * 1024
+    assert not tracemalloc.is_tracing()
+
+
+def test_allocation_tracer_already_tracing():
+    tracemalloc.start()
+    try:
+        data = bytes(10 * 1024 * 1024)
+        del data
+        # Peak before the block is not included
+        with AllocationTracer() as tracer:
+            data = bytes(1024 * 1024)
+        # Small objects traced before the block may be freed within it
+        # (depending on the preceding tests), which lowers the peak slightly
+        assert len(data) - 1024 <= tracer.peak < 2 * 1024 * 1024
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierProfiling(KartonTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = ConfigMock()
+        self.config.config.read_dict(
+            {
+                "classifier": {
+                    "profile_rate": "1.0",
+                    "profile_dir": self.directory.name,
+                }
+            }
+        )
+        self.backend = KartonBackendMock()
+        self.karton = Classifier(
+            magic=self.magic_from_content, config=self.config, backend=self.backend
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_profile_names(self):
+        res = self.run_task(mock_task(mock_resource("runnable.exe")))
+        self.assertEqual(res[0].headers["kind"], "runnable")
+        self.run_task(mock_task(Resource("file", bytes(100))))
+        names = profiles(self.directory.name)
+        self.assertEqual(len(names), 2)
+        self.assertTrue(any(name.endswith("-sha256-pe.pstats") for name in names))
+        # Resources created from content get sha256 metadata
+        digest = hashlib.sha256(bytes(100)).hexdigest()
+        self.assertTrue(
+            any(name.endswith(f"-{digest}-norule.pstats") for name in names)
+        )
+
+    def test_profiling_disabled(self):
+        karton = Classifier(
+            magic=self.magic_from_content, config=ConfigMock(), backend=self.backend
+        )
+        self.assertIsNone(karton.profiler)
+
+
+@pytest.mark.usefixtures("karton_classifier")
+class TestClassifierTraceMemory(KartonTestCase):
+    def setUp(self):
+        self.config = ConfigMock()
+        self.config.config.read_dict({"classifier": {"trace_memory": "true"}})
+        self.karton = Classifier(
+            magic=self.magic_from_content,
+            config=self.config,
+            backend=KartonBackendMock(),
+        )
+
+    def test_trace_memory(self):
+        with mock.patch.object(self.karton.metrics, "memory_peak") as memory_peak:
+            with self.assertLogs(self.karton.log, "INFO") as logs:
+                res = self.run_task(mock_task(mock_resource("runnable.exe")))
+        self.assertEqual(res[0].headers["kind"], "runnable")
+        memory_peak.assert_called_once()
+        [peak] = memory_peak.call_args[0]
+        self.assertGreater(peak, 0)
+        self.assertTrue(
+            any(f"peak memory allocation: {peak} bytes" in line for line in logs.output)
+        )
+        self.assertFalse(tracemalloc.is_tracing())
@@ -0,0 +1,125 @@
+import logging
+
+import pytest
+
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.rules import (
+    CLASSIFICATION_RULES,
+    ClassificationContext,
+    PrefixTrie,
+    Rule,
+    RuleEngine,
+)
+
+
+def make_context(magic="", extension="", content=b""):
+    return ClassificationContext(
+        BytesSampleReader(content),
+        magic=magic,
+        mime="",
+        extension=extension,
+        log=logging.getLogger("test_rules"),
+    )
+
+
+def test_prefix_trie():
+    trie = PrefixTrie()
+    trie.add("PE32", 1)
+    trie.add("PE32+", 2)
+    trie.add("PDF", 3)
+    assert trie.find("PE32+ executable") == {1, 2}
+    assert trie.find("PE32 executable") == {1}
+    assert trie.find("PE") == set()
+    assert trie.find("") == set()
+    with pytest.raises(ValueError):
+        trie.add("", 4)
+
+
+def test_rule_engine_precedence():
+    engine = RuleEngine(
+        [
+            Rule(
+                "always",
+                headers={"kind": "a"},
+                condition=lambda ctx: False,
+                always=True,
+            ),
+            Rule("by_extension", headers={"kind": "b"}, extensions=["txt"]),
+            Rule("by_magic", headers={"kind": "c"}, magic_prefixes=["ASCII"]),
+            Rule("by_substring", headers={"kind": "d"}, magic_substrings=["text"]),
+            Rule("by_ext_prefix", headers={"kind": "e"}, extension_prefixes=["doc"]),
+        ]
+    )
+    assert [rule.name for rule in engine.candidates("ASCII text", "txt")] == [
+        "always",
+        "by_extension",
+        "by_magic",
+        "by_substring",
+    ]
+    assert [rule.name for rule in engine.candidates("data", "docm")] == [
+        "always",
+        "by_ext_prefix",
+    ]
+    # Rules are evaluated in order, not by the kind of index
+    rule, headers = engine.match(make_context("ASCII text", "txt"))
+    assert rule.name == "by_extension"
+    assert headers == {"kind": "b"}
+    rule, _ = engine.match(make_context("ASCII text", "csv"))
+    assert rule.name == "by_magic"
+    assert engine.match(make_context("data", "bin")) is None
+
+
+def test_rule_engine_trace():
+    engine = RuleEngine(
+        [
+            Rule(
+                "never", headers={"kind": "a"}, condition=lambda ctx: False, always=True
+            ),
+            Rule("by_magic", headers={"kind": "b"}, magic_prefixes=["ASCII"]),
+            Rule("after", headers={"kind": "c"}, always=True),
+        ]
+    )
+    trace = []
+    rule, _ = engine.match(make_context("ASCII text"), trace)
+    assert rule.name == "by_magic"
+    assert [(entry.rule, entry.matched) for entry in trace] == [
+        ("never", False),
+        ("by_magic", True),
+    ]
+    assert all(entry.duration >= 0 for entry in trace)
+    trace = []
+    assert engine.match(make_context("data"), trace)[0].name == "after"
+    assert [entry.rule for entry in trace] == ["never", "after"]
+
+
+def test_rule_headers_are_copied():
+    rule = Rule("constant", headers={"kind": "a"}, always=True)
+    rule.match(make_context())["kind"] = "b"
+    assert rule.match(make_context()) == {"kind": "a"}
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        Rule("none")
+    with pytest.raises(ValueError):
+        Rule("both", headers={}, match=lambda ctx: {})
+    with pytest.raises(ValueError):
+        RuleEngine([Rule("a", headers={}), Rule("a", headers={})])
+
+
+def test_classification_rules_candidates():
+    engine = RuleEngine(CLASSIFICATION_RULES)
+    candidates = engine.candidates("PE32+ executable (DLL)", "dll")
+    # Only PE rule and content-based rules are consulted
+    assert candidates[0].name == "pe"
+    assert all(rule.always for rule in candidates[1:])
+    rule, headers = engine.match(make_context("PE32+ executable (DLL)", "dll"))
+    assert headers == {"kind": "runnable", "platform": "win64", "extension": "dll"}
+
+
+def test_context_decodes_heuristics_window_once(caplog):
+    ctx = make_context(content=b"\x81\x8d\x8f")
+    with caplog.at_level(logging.WARNING):
+        assert ctx.partial_str is None
+        assert ctx.partial_str is None
+    assert caplog.text.count("Heuristics disabled") == 1
@@ -0,0 +1,132 @@
+import io
+import struct
+import tarfile
+
+import pytest
+from karton.core import Resource, Task
+from karton.core.test import ConfigMock, KartonBackendMock
+
+from karton.classifier import Classifier
+from karton.classifier.reader import BytesSampleReader
+from karton.classifier.signatures import (
+    LEGACY_PE_MIME,
+    PE_MIME,
+    get_pe_mime,
+    pymagic,
+    sniff,
+)
+
+from .mock_helper import tests_dir
+
+
+def make_tar(name, format=tarfile.USTAR_FORMAT):
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode="w", format=format) as tar:
+        info = tarfile.TarInfo(name)
+        info.size = 3
+        tar.addfile(info, io.BytesIO(b"abc"))
+    return content.getvalue()
+
+
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        ("runnable.exe", "PE32 executable"),
+        ("runnable.dll", "PE32 executable (DLL)"),
+        ("runnable.exe64", "PE32+ executable"),
+        ("runnable.dll64", "PE32+ executable (DLL)"),
+        ("runnable.spc", "ELF"),
+        ("document.pdf", "PDF document"),
+        ("document.rtf", "Rich Text Format data"),
+        ("archive.tar", "POSIX tar archive"),
+        ("archive.iso", "ISO 9660 CD-ROM filesystem data"),
+        # Ambiguous formats are left to libmagic
+        ("archive.zip", None),
+        ("document.docx", None),
+        ("document.doc", None),
+        ("runnable.msi", None),
+        ("archive.udf", None),
+        ("misc.ascii", None),
+    ],
+)
+def test_sniff_testdata(filename, expected):
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    sniffed = sniff(BytesSampleReader(content))
+    assert (sniffed and sniffed[0]) == expected
+
+
+def test_sniff_synthetic():
+    elf = b"\x7fELF\x02\x01\x01" + b"\x00" * 9 + struct.pack("<HHI", 3, 62, 1)
+    assert sniff(BytesSampleReader(elf)) == ("ELF", "application/x-sharedlib")
+    macho = b"\xcf\xfa\xed\xfe" + b"\x00" * 28
+    assert sniff(BytesSampleReader(macho)) == (
+        "Mach-O 64-bit",
+        "application/x-mach-binary",
+    )
+    # Truncated signatures are not recognized by libmagic
+    assert sniff(BytesSampleReader(b"%PDF")) is None
+    assert sniff(BytesSampleReader(b"{\\rtf")) is None
+    # Unknown optional header magic
+    pe = b"MZ" + b"\x00" * 58 + b"\x80\x00\x00\x00" + b"\x00" * 64 + b"PE\x00\x00"
+    assert sniff(BytesSampleReader(pe + b"\x00" * 200)) is None
+
+
+def test_sniff_tar():
+    # tar header is checked before other signatures (like in libmagic)
+    tar = make_tar("%PDF-1.4", format=tarfile.GNU_FORMAT)
+    assert sniff(BytesSampleReader(tar))[0] == "POSIX tar archive"
+    # Invalid checksum
+    tar = tar[:148] + b"0000000\x00" + tar[156:]
+    assert sniff(BytesSampleReader(tar))[0] == "PDF document"
+
+
+@pytest.mark.parametrize(
+    "version,mime", [(537, LEGACY_PE_MIME), (540, LEGACY_PE_MIME), (541, PE_MIME)]
+)
+def test_pe_mime(monkeypatch, version, mime):
+    monkeypatch.setattr(pymagic, "version", lambda: version)
+    get_pe_mime.cache_clear()
+    try:
+        assert get_pe_mime() == mime
+    finally:
+        get_pe_mime.cache_clear()
+
+
+def classify(classifier, name, content):
+    task = Task({"type": "sample", "kind": "raw"})
+    task.add_payload("sample", Resource(name, content))
+    return classifier._classify(task)
+
+
+@pytest.fixture(scope="module")
+def classifiers(magic_backend):
+    classifiers = []
+    for options in [
+        {},
+        {"signature_sniffer": "true"},
+        {"signature_sniffer": "true", "signature_sniffer_magic": "false"},
+    ]:
+        config = ConfigMock()
+        config.config.read_dict({"classifier": options})
+        classifiers.append(
+            Classifier(magic=magic_backend, config=config, backend=KartonBackendMock())
+        )
+    return classifiers
+
+
+@pytest.mark.parametrize(
+    "filename", sorted(path.name for path in (tests_dir / "testdata").iterdir())
+)
+@pytest.mark.parametrize("extension", ["", "pdf", "vbs", "dmg", "doc", "zip"])
+def test_sniffer_classification(classifiers, filename, extension):
+    plain, classifier, fast_classifier = classifiers
+    content = (tests_dir / "testdata" / filename).read_bytes()
+    name = f"sample.{extension}" if extension else "sample"
+
+    expected = classify(plain, name, content)
+    # magic payload and MIME type come from libmagic
+    assert classify(classifier, name, content) == expected
+    if expected is not None and sniff(BytesSampleReader(content)) is not None:
+        # Sniffed MIME type is the same, but magic payload is not added
+        expected.pop("magic")
+    assert classify(fast_classifier, name, content) == expected
@@ -0,0 +1,54 @@
+from io import BytesIO
+from zipfile import ZipFile
+
+import pytest
+
+from karton.classifier.classifier import classify_openxml
+from karton.classifier.zipindex import ZipIndex
+
+
+def make_zip(*names):
+    out = BytesIO()
+    with ZipFile(out, "w") as zipfile:
+        for name in names:
+            zipfile.writestr(name, b"")
+    return out.getvalue()
+
+
+@pytest.fixture
+def zip_index():
+    return ZipIndex.from_content(
+        make_zip("AndroidManifest.xml", "classes.dex", "Foo.App/Contents/Info.plist")
+    )
+
+
+def test_has_file(zip_index):
+    assert zip_index.has_file("AndroidManifest.xml")
+    assert not zip_index.has_file("androidmanifest.xml")
+    assert not zip_index.has_file("META-INF/MANIFEST.MF")
+
+
+def test_has_prefix(zip_index):
+    assert zip_index.has_prefix("classes")
+    assert zip_index.has_prefix("Foo.App/")
+    assert not zip_index.has_prefix("foo.app/")
+    assert not zip_index.has_prefix("word")
+
+
+def test_has_suffix(zip_index):
+    assert zip_index.has_suffix(".app/contents/info.plist")
+    assert zip_index.has_suffix(".DEX")
+    assert not zip_index.has_suffix(".jar")
+
+
+@pytest.mark.parametrize(
+    "names,expected",
+    [
+        (["[Content_Types].xml", "word/document.xml"], "docx"),
+        (["[Content_Types].xml", "ppt/presentation.xml"], "pptx"),
+        (["[Content_Types].xml", "xl/workbook.xml"], "xlsx"),
+        (["[Content_Types].xml"], None),
+    ],
+)
+def test_classify_openxml(names, expected):
+    assert classify_openxml(make_zip(*names)) == expected